@@ -1,39 +1,62 @@
-from typing import Optional, Any
+from typing import Optional, Tuple, Any
 from tkinter import Tk, Frame, Button, Label, Canvas, Toplevel, StringVar, simpledialog, filedialog
-from multiprocessing import Process, Pipe
+from multiprocessing import Process, parent_process, get_context, get_all_start_methods, forkserver
 from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
+from threading import Thread
+from queue import Queue, Empty
 from numpy import int32
 
 from assembler import Assembler
-from processor import Processor, ProcessorError, ProcessorEvent, GPU, Device, ImageBuffer
-from utils import ConnectionManager, KeyDebouncer
+from processor import Processor, ProcessorError, ProcessorEvent, GPU, Device, ImageBuffer, ProgramImage
+from utils import ConnectionManager, KeyDebouncer, ClockScheduler
+from telemetry import Telemetry
+from shared import SharedState, ProcessorStats
+from recording import Recorder
+from sampling_profiler import SamplingProfiler
+from runner import MAX_SPEED_BATCH
 
 import os
 import time
-import tkinter
+import utils
+import argparse
 import constants
 
 
 REFRESH_MS = 10
+FRAME_NS = REFRESH_MS * 1_000_000  # Minimum time between frames written for the UI. Frames flushed faster than this are coalesced
 CLOCK_NS = 20_000_000
 
-DIRECTIVE_SIM_CLOCK_TIME = 'sim_clock_time'
-
-P2C_SCREEN = 'screen'
-P2C_STATS = 'stats'
 P2C_PRINT = 'print'
 P2C_HALT = 'halt'
 
-C2P_KEY = 'key'
-C2P_HALT = 'halt'
+A2C_PROGRESS = 'progress'
+A2C_RESULT = 'result'
+
+# Processors are started from a fork server where available, which has already imported the app and its dependencies
+START_METHOD = 'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn'
+
+def read_command_line_args():
+    parser = argparse.ArgumentParser(description='UI for running Factorio ProcessorV5 programs')
+
+    parser.add_argument('--sample', action='store_true', default=False, help='Print a sampling profile of where the simulator itself spends time, each time the processor stops')
+
+    return parser.parse_args()
 
-def main():
-    App()
+
+def main(args: argparse.Namespace):
+    context = get_context(START_METHOD)
+    if START_METHOD == 'forkserver':
+        context.set_forkserver_preload(['__main__'])
+        forkserver.ensure_running()  # Start the server now, rather than on the first run
+    App(context, args.sample)
 
 
 class App:
 
-    def __init__(self):
+    def __init__(self, context: Optional[BaseContext] = None, sample: bool = False):
+        self.context = context if context is not None else get_context(START_METHOD)
+        self.sample = sample
         self.root = Tk()
         self.root.title('ProcessorV5')
         self.root.protocol("WM_DELETE_WINDOW", self.on_shutdown)
@@ -58,41 +81,55 @@ class App:
         self.halt_button = Button(self.buttons, text='Halt', command=self.on_halt)
         self.halt_button.grid(row=3, column=0, sticky='ew', padx=5, pady=5)
 
+        # When enabled, each run records its inputs and screens next to the assembly file, for replay by the headless runner
+        self.record = False
+        self.record_button = Button(self.buttons, text='Record: Off', command=self.on_record)
+        self.record_button.grid(row=4, column=0, sticky='ew', padx=5, pady=5)
+
         self.info_text = StringVar()
         self.info_text.set('Ready')
         self.info_label = Label(self.buttons, textvariable=self.info_text)
-        self.info_label.grid(row=4, column=0, sticky='ew', padx=5, pady=5)
+        self.info_label.grid(row=5, column=0, sticky='ew', padx=5, pady=5)
 
         self.perf_clock_ns = CLOCK_NS
         self.perf_text = StringVar()
-        self.perf_text.set(format_frequency(1_000_000_000 / self.perf_clock_ns))
+        self.perf_text.set(format_clock(self.perf_clock_ns))
         self.perf_label = Label(self.buttons, textvariable=self.perf_text)
-        self.perf_label.grid(row=5, column=0, sticky='ew', padx=5, pady=0)
+        self.perf_label.grid(row=6, column=0, sticky='ew', padx=5, pady=0)
         self.perf_label.bind('<Button-1>', self.on_perf_text_click)
 
         self.mem_text = StringVar()
         self.mem_text.set('')
         self.mem_label = Label(self.buttons, textvariable=self.mem_text)
-        self.mem_label.grid(row=6, column=0, sticky='ew', padx=5, pady=0)
+        self.mem_label.grid(row=7, column=0, sticky='ew', padx=5, pady=0)
 
         self.inst_mem_text = StringVar()
         self.inst_mem_text.set('')
         self.inst_mem_label = Label(self.buttons, textvariable=self.inst_mem_text)
-        self.inst_mem_label.grid(row=7, column=0, sticky='ew', padx=5, pady=0)
+        self.inst_mem_label.grid(row=8, column=0, sticky='ew', padx=5, pady=0)
 
         self.gpu_mem_text = StringVar()
         self.gpu_mem_text.set('')
         self.gpu_mem_label = Label(self.buttons, textvariable=self.gpu_mem_text)
-        self.gpu_mem_label.grid(row=8, column=0, sticky='ew', padx=5, pady=0)
+        self.gpu_mem_label.grid(row=9, column=0, sticky='ew', padx=5, pady=0)
 
         self.cpi_text = StringVar()
         self.cpi_text.set('')
         self.cpi_label = Label(self.buttons, textvariable=self.cpi_text)
-        self.cpi_label.grid(row=8, column=0, sticky='ew', padx=5, pady=0)
+        self.cpi_label.grid(row=10, column=0, sticky='ew', padx=5, pady=0)
+
+        self.telemetry_text = StringVar()
+        self.telemetry_text.set('')
+        self.telemetry_label = Label(self.buttons, textvariable=self.telemetry_text, justify='left')
+        self.telemetry_label.grid(row=11, column=0, sticky='ew', padx=5, pady=0)
 
         self.canvas = Canvas(self.root, bg='white', height=320, width=320)
         self.canvas.grid(row=0, column=1, padx=5, pady=5)
 
+        # Pixels are persistent rectangles, and only those that changed since the last frame are updated
+        self.pixels = [[self.canvas.create_rectangle(x * 10, y * 10, x * 10 + 10, y * 10 + 10, fill='black') for y in range(constants.SCREEN_HEIGHT)] for x in range(constants.SCREEN_WIDTH)]
+        self.screen_rows: Tuple[int, ...] = EMPTY_SCREEN
+
         self.key_mapping = {
             'Up': constants.CONTROL_PORT_UP,
             'Down': constants.CONTROL_PORT_DOWN,
@@ -106,26 +143,34 @@ class App:
         self.root.bind('<KeyRelease>', self.key_debouncer.on_released)
 
         self.asm: Optional[Assembler] = None
+        self.assembly_queue: Queue = Queue()  # Messages posted by assembly threads, as (id, A2C_PROGRESS, phase) or (id, A2C_RESULT, assembler or None, error or None)
+        self.assembly_id = 0  # The id of the latest assembly started. Results from any earlier assembly are dropped
+        self.assembling = False
         self.processor_thread: Optional[Process] = None
         self.processor_pipe: ConnectionManager = ConnectionManager()
+        self.processor_state: Optional[SharedState] = None  # The screen, inputs and stats, shared with the processor process
 
-        self.update_screen(ImageBuffer.empty())
         self.root.after(REFRESH_MS, self.tick)
         self.root.mainloop()
 
     def tick(self):
+        try:
+            while True:
+                assembly_id, key, *data = self.assembly_queue.get_nowait()
+                if assembly_id == self.assembly_id:
+                    if key == A2C_PROGRESS:
+                        phase, *_ = data
+                        self.info_text.set('Assembling: %s' % phase)
+                    elif key == A2C_RESULT:
+                        asm, error = data
+                        self.on_assembled(asm, error)
+        except Empty:
+            pass
+
+        self.read_processor_state()
+
         for key, *data in self.processor_pipe.poll():
-            if key == P2C_SCREEN:
-                buffer, *_ = data
-                self.update_screen(buffer)
-            elif key == P2C_STATS:
-                freq, mem, inst_mem, gpu_mem, cpi, *_ = data
-                self.perf_text.set(format_frequency(freq))
-                self.mem_text.set(mem)
-                self.inst_mem_text.set(inst_mem)
-                self.gpu_mem_text.set(gpu_mem)
-                self.cpi_text.set('%.2f CPI' % cpi)
-            elif key == P2C_PRINT:
+            if key == P2C_PRINT:
                 arg, *_ = data
                 print(arg)
             elif key == P2C_HALT:
@@ -133,6 +178,14 @@ class App:
 
         self.root.after(REFRESH_MS, self.tick)
 
+    def read_processor_state(self):
+        if (state := self.processor_state) is not None:
+            # Only the latest screen and stats are read
+            if (screen := state.read_frame()) is not None:
+                self.update_screen(screen)
+            if (stats := state.read_stats()) is not None:
+                self.update_stats(stats)
+
     def on_load(self):
         if path := filedialog.askopenfilename(
             filetypes=[('Assembly Files', '*.s'), ('All Files', '*.*')],
@@ -148,76 +201,88 @@ class App:
             self.show_error_modal('No assembly file selected, cannot reload.')
 
     def on_run(self):
-        if self.asm is not None:
-            self.update_screen(ImageBuffer.empty())
-            proc = Processor(self.asm.code, self.asm.sprites, self.asm.print_table)
-            parent, child = Pipe()
-
+        if self.asm is not None and not self.assembling:
+            self.update_screen(EMPTY_SCREEN)
+            # The child process constructs its own processor from a compact image of the program
+            seed = self.asm.directives.get(constants.DIRECTIVE_RANDOM_SEED)
+            image = ProgramImage.create(self.asm.code, self.asm.sprites, self.asm.print_table, int(seed) if seed is not None else None)
+            parent, child = self.context.Pipe()
+
+            self.close_processor_thread()
             self.processor_pipe.reopen(parent)
-            self.processor_thread = Process(target=manage_processor, args=(proc, self.perf_clock_ns, child))
+            self.processor_state = SharedState()
+            record_file = os.path.splitext(self.load_last_file)[0] + '.rec' if self.record and self.load_last_file is not None else None
+            self.processor_thread = self.context.Process(target=manage_processor, args=(image, self.perf_clock_ns, child, self.processor_state, record_file, self.sample))
             self.processor_thread.start()
-            self.info_text.set('Running')
+            self.info_text.set('Recording' if record_file is not None else 'Running')
 
-    def on_perf_text_click(self):
+    def on_record(self):
+        self.record = not self.record
+        self.record_button.configure(text='Record: On' if self.record else 'Record: Off')
+
+    def on_perf_text_click(self, _=None):
         if self.processor_pipe.closed():
-            entry = simpledialog.askstring('ProcessorV5', 'Clock Cycle Time')
-            if entry.endswith('ns'):
-                self.perf_clock_ns = int(entry[:-2])
-            elif entry.endswith('us'):
-                self.perf_clock_ns = int(entry[:-2]) * 1_000
-            elif entry.endswith('ms'):
-                self.perf_clock_ns = int(entry[:-2]) * 1_000_000
-            else:
-                self.perf_clock_ns = int(entry) * 1_000_000
-            self.perf_text.set(format_frequency(1_000_000_000 / self.perf_clock_ns))
+            if entry := simpledialog.askstring('ProcessorV5', 'Clock Cycle Time (or \'max\')'):
+                self.set_frequency(entry)
 
     def on_key_event(self, event, pressed: bool):
-        if event.keysym in self.key_mapping:
-            self.processor_pipe.send(C2P_KEY, self.key_mapping[event.keysym], pressed)
+        if event.keysym in self.key_mapping and self.processor_state is not None:
+            self.processor_state.set_input(self.key_mapping[event.keysym] - constants.CONTROL_PORT, pressed)
 
     def on_halt(self):
+        # The processor writes its last screen before it halts, which may be after this tick read the shared state, so it is read once more before closing
+        self.read_processor_state()
         self.close_processor_thread()
-        self.info_text.set('Loaded' if self.asm is not None else 'Ready')
-        self.perf_text.set(format_frequency(1_000_000_000 / self.perf_clock_ns))
+        self.info_text.set('Assembling' if self.assembling else 'Loaded' if self.asm is not None else 'Ready')
+        self.perf_text.set(format_clock(self.perf_clock_ns))
+        self.telemetry_text.set('')
 
     def on_shutdown(self):
         self.close_processor_thread()
         self.root.destroy()
 
     def assemble(self, path: str):
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                text = f.read()
-        except OSError:
-            return self.show_error_modal('Error loading from file: %s' % path)
-
-        asm = Assembler(path, text, enable_assertions=True, enable_print=True)
-        if not asm.assemble():
-            return self.show_error_modal(asm.error)
+        # Assembly runs in a thread, so the UI stays responsive. The result is shared with the UI thread directly, without pickling
+        self.assembly_id += 1
+        self.assembling = True
+        self.info_text.set('Assembling')
+        Thread(target=assemble_program, args=(path, self.assembly_id, self.assembly_queue), daemon=True).start()
+
+    def on_assembled(self, asm: Optional[Assembler], error: Optional[str]):
+        self.assembling = False
+        if asm is None:
+            self.info_text.set('Loaded' if self.asm is not None else 'Ready')
+            return self.show_error_modal(error)
 
         self.asm = asm
         self.info_text.set('Loaded')
 
         # Accept certain directives from the assembly
-        if DIRECTIVE_SIM_CLOCK_TIME in asm.directives:
-            self.set_frequency(asm.directives[DIRECTIVE_SIM_CLOCK_TIME])
+        if constants.DIRECTIVE_SIM_CLOCK_TIME in asm.directives:
+            self.set_frequency(asm.directives[constants.DIRECTIVE_SIM_CLOCK_TIME])
 
     def set_frequency(self, value: str):
-        if value.endswith('ns'):
-            self.perf_clock_ns = int(value[:-2])
-        elif value.endswith('us'):
-            self.perf_clock_ns = int(value[:-2]) * 1_000
-        elif value.endswith('ms'):
-            self.perf_clock_ns = int(value[:-2]) * 1_000_000
+        self.perf_clock_ns = utils.parse_clock_time(value)
+        self.perf_text.set(format_clock(self.perf_clock_ns))
+
+    def update_screen(self, screen: Tuple[int, ...]):
+        for y, (row, prev) in enumerate(zip(screen, self.screen_rows)):
+            if changed := row ^ prev:
+                for x in range(constants.SCREEN_WIDTH):
+                    if (changed >> x) & 1:
+                        self.canvas.itemconfigure(self.pixels[x][y], fill='white' if (row >> x) & 1 else 'black')
+        self.screen_rows = screen
+
+    def update_stats(self, stats: ProcessorStats):
+        if stats.target_frequency:
+            self.perf_text.set('%s (%.0f%%)' % (format_frequency(stats.frequency), 100 * stats.frequency / stats.target_frequency))
         else:
-            self.perf_clock_ns = int(value) * 1_000_000
-        self.perf_text.set(format_frequency(1_000_000_000 / self.perf_clock_ns))
-
-    def update_screen(self, screen: ImageBuffer):
-        self.canvas.delete(tkinter.ALL)
-        for x in range(constants.SCREEN_WIDTH):
-            for y in range(constants.SCREEN_HEIGHT):
-                self.canvas.create_rectangle(x * 10, y * 10, x * 10 + 10, y * 10 + 10, fill='white' if screen[x, y] == '#' else 'black')
+            self.perf_text.set('%s (Max)' % format_frequency(stats.frequency))
+        self.telemetry_text.set('\n'.join(stats.telemetry.lines()) if stats.telemetry is not None else '')
+        self.mem_text.set('M %.1f%%' % (100 * stats.memory))
+        self.inst_mem_text.set('I %.1f%%' % (100 * stats.instruction_memory))
+        self.gpu_mem_text.set('G %.1f%%' % (100 * stats.gpu_memory))
+        self.cpi_text.set('%.2f CPI' % stats.cpi)
 
     def show_error_modal(self, error_text: str):
         error = Toplevel(self.root)
@@ -227,10 +292,41 @@ class App:
         text.pack()
 
     def close_processor_thread(self):
-        self.processor_pipe.send(C2P_HALT)
+        if self.processor_state is not None:
+            # The processor process keeps its own mapping of the shared memory, until it observes the halt request
+            self.processor_state.request_halt()
+            self.processor_state.close(unlink=True)
+            self.processor_state = None
         self.processor_thread = None
 
 
+EMPTY_SCREEN: Tuple[int, ...] = (0,) * constants.SCREEN_HEIGHT
+
+
+def assemble_program(path: str, assembly_id: int, queue: Queue):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        return queue.put((assembly_id, A2C_RESULT, None, 'Error loading from file: %s' % path))
+
+    asm = Assembler(path, text, enable_assertions=True, enable_print=True, progress=lambda phase: queue.put((assembly_id, A2C_PROGRESS, phase)))
+    try:
+        success = asm.assemble()
+    except Exception as e:  # Any unexpected error must still be posted, or the UI would wait on this assembly forever
+        return queue.put((assembly_id, A2C_RESULT, None, 'Error assembling %s: %s' % (path, e)))
+    if not success:
+        return queue.put((assembly_id, A2C_RESULT, None, asm.error))
+    if not asm.directives.get(constants.DIRECTIVE_RANDOM_SEED, '0').isdigit():
+        return queue.put((assembly_id, A2C_RESULT, None, 'Invalid random seed: \'%s\'' % asm.directives[constants.DIRECTIVE_RANDOM_SEED]))
+
+    queue.put((assembly_id, A2C_RESULT, asm, None))
+
+
+def format_clock(period_ns: int) -> str:
+    return format_frequency(1_000_000_000 / period_ns) if period_ns > 0 else 'Max'
+
+
 def format_frequency(hz: float) -> str:
     if hz < 10_000:
         return '%.0f Hz' % hz
@@ -240,74 +336,113 @@ def format_frequency(hz: float) -> str:
         return '%.0f MHz' % (hz / 1_000_000)
 
 
-def manage_processor(proc: Processor, period_ns: int, raw: Connection):
+def manage_processor(image: ProgramImage, period_ns: int, raw: Connection, state: SharedState, record_file: Optional[str] = None, sample: bool = False):
+    # The pipe is only used for print events, and to notify the UI on halt. Inputs, screens and stats are exchanged via shared memory
+    proc = image.processor()
     pipe = ConnectionManager(raw)
-    keyboard = AppControlDevice()
+    keyboard = AppControlDevice(state)
+    events = AppEventHandle(pipe, state)
     proc.devices.append(keyboard)
-    proc.event_handle = AppEventHandle(pipe)
-
-    last_ns = tick_ns = time.perf_counter_ns()
+    proc.event_handle = events
+
+    recorder = Recorder(proc).attach() if record_file is not None else None
+    sampler = SamplingProfiler().start() if sample else None
+    try:
+        run_processor(proc, period_ns, pipe, state, events)
+    finally:
+        if recorder is not None:
+            recorder.save(record_file)
+        if sampler is not None:
+            sampler.stop()
+            print('\n'.join(sampler.report()))
+
+
+def run_processor(proc: Processor, period_ns: int, pipe: ConnectionManager, state: SharedState, events: 'AppEventHandle'):
+    # A period of zero runs as fast as possible, with telemetry
+    scheduler = ClockScheduler(period_ns) if period_ns > 0 else None
+    telemetry = Telemetry(proc).attach() if scheduler is None else None
+    last_ns = time.perf_counter_ns()
     next_ns = last_ns + 1_000_000_000  # report actual frequency every 1s
     ticks = 0
     proc.running = True
     while proc.running:
         try:
-            proc.tick()
+            for _ in range(scheduler.ticks_due() if scheduler is not None else MAX_SPEED_BATCH):
+                proc.tick()
+                ticks += 1
+                if not proc.running:
+                    break
         except ProcessorError as e:
             print(e)
             print(proc.debug_view())
+            events.write_frame(force=True)  # The last frame flushed before the fault may still be pending
             pipe.send(P2C_HALT)
             return
 
-        ticks += 1
-        tick_ns += period_ns
+        if state.halt_requested():
+            return
 
-        for key, *data in pipe.poll():
-            if key == C2P_KEY:
-                key, data = data
-                keyboard.data[key - constants.CONTROL_PORT] = int32(data)
-            elif key == C2P_HALT:
-                return
+        if events.pending is not None:
+            events.write_frame()
 
-        if pipe.closed():
-            return
+        if (now_ns := time.perf_counter_ns()) > next_ns:
+            if pipe.closed() or ((parent := parent_process()) is not None and not parent.is_alive()):
+                return
 
-        if time.perf_counter_ns() > next_ns:
-            _, mem = proc.memory_utilization()
-            _, inst_mem = proc.instruction_memory_utilization()
-            _, gpu_mem = proc.gpu_memory_utilization()
-            cpi = proc.counter.tick_count / proc.cpi_instruction_count
-            pipe.send(P2C_STATS, ticks, mem, inst_mem, gpu_mem, cpi)
-            last_ns = time.perf_counter_ns()
+            state.write_stats(ProcessorStats(
+                ticks * 1_000_000_000 / (now_ns - last_ns),
+                proc.counter.tick_count / proc.cpi_instruction_count,
+                1_000_000_000 / period_ns if period_ns > 0 else 0,
+                proc.memory_utilization()[0] / len(proc.memory),
+                proc.instruction_memory_utilization()[0] / len(proc.instructions),
+                proc.gpu_memory_utilization()[0] / len(proc.sprites),
+                telemetry.sample() if telemetry is not None else None
+            ))
+            last_ns = now_ns
             next_ns = last_ns + 1_000_000_000
             ticks = 0
 
-        while time.perf_counter_ns() < tick_ns:
-            pass
+        if scheduler is not None and proc.running:
+            scheduler.wait()
 
-    pipe.send('halt')
+    events.write_frame(force=True)
+    pipe.send(P2C_HALT)
 
 
 class AppControlDevice(Device):
 
-    def __init__(self):
-        self.data = [int32(0)] * constants.CONTROL_PORT_WIDTH
+    def __init__(self, state: SharedState):
+        self.state = state
 
     def reads(self, addr: int32) -> bool: return 0 <= addr - constants.CONTROL_PORT < constants.CONTROL_PORT_WIDTH
-    def get(self, addr: int32) -> int32: return self.data[addr - constants.CONTROL_PORT]
+    def get(self, addr: int32) -> int32: return int32(self.state.get_input(addr - constants.CONTROL_PORT))
 
 
 class AppEventHandle:
+    """
+    Forwards processor events to the UI.
+    Screens are packed as one integer per row, and written to shared memory at most once per FRAME_NS. Any screens flushed in between are dropped, except the latest.
+    """
 
-    def __init__(self, pipe: ConnectionManager):
+    def __init__(self, pipe: ConnectionManager, state: SharedState):
         self.pipe = pipe
+        self.state = state
+        self.pending: Optional[ImageBuffer] = None
+        self.next_frame_ns = 0
 
     def __call__(self, proc: Processor, event_type: ProcessorEvent, arg: Any):
         if event_type == ProcessorEvent.PRINT:
             self.pipe.send(P2C_PRINT, arg)
         elif event_type == ProcessorEvent.GFLUSH:
-            self.pipe.send(P2C_SCREEN, arg)
+            self.pending = arg
+            self.write_frame()
+
+    def write_frame(self, force: bool = False):
+        if self.pending is not None and (force or time.perf_counter_ns() >= self.next_frame_ns):
+            self.state.write_frame(self.pending.pack())
+            self.pending = None
+            self.next_frame_ns = time.perf_counter_ns() + FRAME_NS
 
 
 if __name__ == '__main__':
-    main()
+    main(read_command_line_args())
@@ -1,9 +1,9 @@
 # This is an Assembler from assembly code to binary level instructions for the ProcessorV5 architecture
 # The purpose is to be able to write programs for the final implementation and hardware model levels
 
-from typing import Optional, Tuple, List, Dict
+from typing import Optional, Tuple, List, Dict, Callable, Any
 
-from phases import Scanner, Parser, CodeGen
+from phases import Scanner, Parser, CodeGen, Optimizer, Allocator
 from constants import Registers
 
 import sys
@@ -22,58 +22,71 @@ def read_command_line_args():
     parser.add_argument('--disassembly', action='store_true', dest='output_viewable', help='Output a hybrid view/disassembly file')
     parser.add_argument('--factorio-blueprint', action='store_true', dest='output_blueprint', help='Output a blueprint string')
     parser.add_argument('--factorio-memory-map', action='store_true', dest='output_factorio_memory_map', help='Output a Factorio Memory Mapping file to <file>.fmap')
+    parser.add_argument('--allocation-map', action='store_true', dest='output_allocation_map', help='Output the allocated and original address of each word to <file>.amap, requires --alloc')
 
     parser.add_argument('--ea', action='store_true', dest='enable_assertions', default=False, help='Enable assert instructions in the output code')
     parser.add_argument('--ep', action='store_true', dest='enable_print', default=False, help='Enable print instructions in the output code')
+    parser.add_argument('--opt', action='store_true', dest='enable_optimizations', default=False, help='Enable the optimizer, and output a report of instructions saved')
+    parser.add_argument('--alloc', action='store_true', dest='enable_allocation', default=False, help='Enable the word allocator, which overlaps words that are never live at the same time, and output a report of memory saved')
     parser.add_argument('--out', type=str, help='The output file name')
 
     return parser.parse_args()
 
 def main(args: argparse.Namespace):
     input_text = utils.read_file(args.file)
-    asm = Assembler(args.file, input_text, args.enable_assertions, args.enable_print)
+    asm = Assembler(args.file, input_text, args.enable_assertions, args.enable_print, enable_optimizations=args.enable_optimizations, enable_allocation=args.enable_allocation)
     if not asm.assemble():
         print(asm.error)
         sys.exit(1)
 
+    if asm.optimizer_report is not None:
+        print(asm.optimizer_report)
+    if asm.allocator_report is not None:
+        print(asm.allocator_report)
+
     output_file = args.file if args.out is None else args.out
+    write_outputs(asm, output_file, args.output_binary, args.output_viewable, args.output_blueprint, args.output_factorio_memory_map, args.output_allocation_map)
+
 
-    if args.output_binary:
+def write_outputs(asm: 'Assembler', output_file: str, output_binary: bool = False, output_viewable: bool = False, output_blueprint: bool = False, output_factorio_memory_map: bool = False, output_allocation_map: bool = False):
+    if output_binary:
         with open(output_file + '.o', 'wb') as f:
             for c in asm.code:
                 f.write(c.to_bytes(8, byteorder='big'))
 
-    if args.output_viewable:
-        dis = disassembler.decode(asm.code, asm.print_table, asm.memory_table, asm.label_table)
+    if output_viewable:
         with open(output_file + '.v', 'w', encoding='utf-8') as f:
-            for c, line in zip(asm.code, dis):
-                f.write('%s %s | %s\n' % (
-                    bin(utils.bitfield_uint64(c, 32, 32))[2:].zfill(32),
-                    bin(utils.bitfield_uint64(c, 0, 32))[2:].zfill(32),
-                    line
-                ))
-
-    if args.output_blueprint:
+            disassembler.write_viewable(f, asm.code, asm.print_table, asm.memory_table, asm.label_table)
+
+    if output_blueprint:
         data = builder.build_rom(asm.code, asm.sprites)
         with open(output_file + '.blueprint', 'w', encoding='utf-8') as f:
             f.write(data)
 
-    if args.output_factorio_memory_map:
+    if output_factorio_memory_map:
         with open(output_file + '.fmap', 'w', encoding='utf-8') as f:
-            format_string = '%04d | %-' + str(1 + max(len(s) for s in asm.memory_table.values())) + 's | %d, %s\n'
+            format_string = '%04d | %-' + str(1 + max((len(s) for s in asm.memory_table.values()), default=3)) + 's | %d, %s\n'
             for r in Registers:
                 f.write(format_string % (r.value, r.name, r.value // 32, builder.SIGNALS_32BIT[r.value % 32]))
             for address, name in sorted(asm.memory_table.items()):
                 f.write(format_string % (address, name, address // 32, builder.SIGNALS_32BIT[address % 32]))
 
+    if output_allocation_map and asm.allocation_map is not None:
+        with open(output_file + '.amap', 'w', encoding='utf-8') as f:
+            f.writelines(asm.allocation_map)
+
 
 class Assembler:
 
-    def __init__(self, file_name: str, input_text: str, enable_assertions: bool = False, enable_print: bool = False):
+    def __init__(self, file_name: str, input_text: str, enable_assertions: bool = False, enable_print: bool = False, scanners: Optional[Dict[str, Scanner]] = None, enable_optimizations: bool = False, enable_allocation: bool = False, progress: Optional[Callable[[str], Any]] = None):
         self.file_name = file_name
         self.input_text = input_text
         self.enable_assertions = enable_assertions
         self.enable_print = enable_print
+        self.scanners = scanners  # Pre-scanned files, by unique path, which are used in place of re-scanning the file or any includes
+        self.enable_optimizations = enable_optimizations
+        self.enable_allocation = enable_allocation
+        self.progress = progress  # Called with the name of each phase, as it starts
 
         self.code: List[int] = []
         self.sprites: List[str] = []
@@ -81,20 +94,55 @@ class Assembler:
         self.print_table: List[Tuple[str, Tuple[int, ...]]] = []
         self.memory_table: Dict[int, str] = {}
         self.label_table: Dict[int, str] = {}
+        self.optimizer_report: Optional[str] = None
+        self.allocator_report: Optional[str] = None
+        self.allocation_map: Optional[List[str]] = None
         self.error: Optional[str] = None
 
     def assemble(self) -> bool:
-        scanner = Scanner(self.input_text)
-        if not scanner.scan():
-            self.error = 'Scanner error:\n%s' % scanner.error
-            return False
-
-        parser = Parser(scanner.output_tokens, self.file_name, self.enable_assertions, self.enable_print)
+        self.report_progress('Scanning')
+        path = utils.unique_path(self.file_name)
+        if self.scanners is not None and path in self.scanners:
+            scanner = self.scanners[path]
+            if scanner.error is not None:
+                self.error = 'Scanner error:\n%s' % scanner.error
+                return False
+        else:
+            scanner = Scanner(self.input_text)
+            if not scanner.scan():
+                self.error = 'Scanner error:\n%s' % scanner.error
+                return False
+
+        word_layout = None
+        if self.enable_allocation:
+            # Parse once to compute the allocation of words, allowing programs which would otherwise overflow memory
+            self.report_progress('Allocating')
+            parser = Parser(scanner.output_tokens, self.file_name, self.enable_assertions, self.enable_print, self.scanners, allow_memory_overflow=True)
+            if not parser.parse():
+                parser.error.trace(scanner)
+                self.error = 'Parser error:\n%s' % parser.error
+                return False
+
+            allocator = Allocator(parser)
+            allocator.allocate()
+            word_layout = allocator.layout
+            self.allocator_report = allocator.report()
+            self.allocation_map = allocator.memory_map()
+
+        self.report_progress('Parsing')  # Included files and textures are loaded while parsing
+        parser = Parser(scanner.output_tokens, self.file_name, self.enable_assertions, self.enable_print, self.scanners, word_layout)
         if not parser.parse():
             parser.error.trace(scanner)
             self.error = 'Parser error:\n%s' % parser.error
             return False
 
+        if self.enable_optimizations:
+            self.report_progress('Optimizing')
+            optimizer = Optimizer(parser)
+            optimizer.optimize()
+            self.optimizer_report = optimizer.report()
+
+        self.report_progress('Generating code')
         codegen = CodeGen(parser)
         codegen.gen()
 
@@ -106,6 +154,10 @@ class Assembler:
         self.label_table = parser.label_table()
         return True
 
+    def report_progress(self, phase: str):
+        if self.progress is not None:
+            self.progress(phase)
+
 
 if __name__ == '__main__':
     main(read_command_line_args())
@@ -0,0 +1,238 @@
+# Benchmarks for the assembler, the processor model, and the combinator simulator, over fixed and reproducible workloads
+# Each workload is timed over several runs, keeping the fastest, and then run once more under tracemalloc to measure its peak memory
+# Results are written as JSON, and may be compared against a stored baseline, which fails if any workload is slower, or uses more memory, than the tolerance allows
+#
+# Baselines are only comparable on the same machine and Python version, so they are not stored in the repository. Record one with '--out', and compare with '--baseline'
+
+from typing import List, Dict, Callable, NamedTuple, Any
+from assembler import Assembler
+from processor import Processor
+from blueprint import decode_blueprint_string
+from simulator import ModelBuilder
+from constants import GPUFunction
+from utils import ImageBuffer
+
+import gc
+import os
+import sys
+import json
+import time
+import utils
+import argparse
+import platform
+import tracemalloc
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_VERSION = 1
+RANDOM_SEED = 5
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.1
+
+Run = Callable[[], int]  # Runs a workload once, returning the units of work done
+
+
+def read_command_line_args():
+    parser = argparse.ArgumentParser(description='Benchmarks for the simulator and assembler, with regression checks against a baseline')
+
+    parser.add_argument('--workload', type=str, action='append', choices=list(WORKLOADS), default=None, help='Run only this workload. May be given more than once. Defaults to all workloads')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplies the size of every workload')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='The number of timed runs of each workload. The fastest is kept')
+
+    parser.add_argument('--out', type=str, default=None, help='Write the results to this file, as JSON')
+    parser.add_argument('--baseline', type=str, default=None, help='Compare the results against a baseline, written by \'--out\', and fail if any workload has regressed')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='The allowed regression, as a fraction of the baseline\'s rate and peak memory')
+
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    baseline = load(args.baseline) if args.baseline is not None else None
+    if baseline is not None and baseline['scale'] != args.scale:
+        print('Baseline was recorded at scale %g, not %g' % (baseline['scale'], args.scale))
+        sys.exit(1)
+
+    results = []
+    for name in args.workload or WORKLOADS:
+        results.append(result := measure(WORKLOADS[name], args.scale, args.repeat))
+        print(result.format())
+
+    if args.out is not None:
+        save(args.out, results, args.scale, args.repeat)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('Regression: %s' % regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against %s' % args.baseline)
+
+
+class Workload(NamedTuple):
+    name: str
+    unit: str  # The unit of work, i.e. 'instructions'
+    size: int  # The size of the workload at scale 1
+    setup: Callable[[int], Run]  # (size) -> run. Setup is not included in the time, or the peak memory
+
+
+class Result(NamedTuple):
+    name: str
+    unit: str
+    units: int
+    wall_time: float  # Seconds, of the fastest run
+    rate: float  # Units per second, of the fastest run
+    peak_memory: int  # Peak bytes allocated by Python during a run
+
+    def format(self) -> str:
+        return '%-10s %9.3f s %12.1f %s/s, %9.1f KB peak' % (self.name, self.wall_time, self.rate, self.unit, self.peak_memory / 1024)
+
+
+def measure(workload: Workload, scale: float = 1.0, repeat: int = DEFAULT_REPEAT) -> Result:
+    """ Runs a workload, with a fresh setup each time. The garbage collector is disabled while timing, as in timeit """
+    size = max(1, round(workload.size * scale))
+    wall_time, units = float('inf'), 0
+    for _ in range(max(1, repeat)):
+        run = workload.setup(size)
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            units = run()
+            wall_time = min(wall_time, time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    run = workload.setup(size)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Result(workload.name, workload.unit, units, wall_time, units / max(wall_time, 1e-9), peak_memory)
+
+
+def compare(results: List[Result], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """ Returns a description of each regression against the baseline. Workloads missing from the baseline are not compared """
+    regressions = []
+    for result in results:
+        if (base := baseline['results'].get(result.name)) is None:
+            continue
+        if result.rate < base['rate'] * (1 - tolerance):
+            regressions.append('%s is %.1f%% slower, %.1f %s/s against %.1f' % (result.name, 100 * (1 - result.rate / base['rate']), result.rate, result.unit, base['rate']))
+        if result.peak_memory > base['peak_memory'] * (1 + tolerance):
+            regressions.append('%s uses %.1f%% more memory, %d bytes against %d' % (result.name, 100 * (result.peak_memory / max(base['peak_memory'], 1) - 1), result.peak_memory, base['peak_memory']))
+    return regressions
+
+
+def save(file: str, results: List[Result], scale: float, repeat: int):
+    with open(file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': RESULTS_VERSION,
+            'scale': scale,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': {result.name: result._asdict() for result in results},
+        }, f, indent=2)
+
+
+def load(file: str) -> Dict[str, Any]:
+    with open(file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('version') != RESULTS_VERSION:
+        raise ValueError('Unsupported benchmark results version %s in %s' % (baseline.get('version'), file))
+    return baseline
+
+
+def assemble(path: str) -> Assembler:
+    file = os.path.join(ROOT_DIR, path)
+    asm = Assembler(file, utils.read_file(file))
+    if not asm.assemble():
+        raise ValueError(asm.error)
+    return asm
+
+
+def setup_assemble(size: int) -> Run:
+    """ Assembles tetris.s, the largest program, repeatedly """
+    file = os.path.join(ROOT_DIR, 'asm/tetris.s')
+    text = utils.read_file(file)
+
+    def run() -> int:
+        instructions = 0
+        for _ in range(size):
+            asm = Assembler(file, text)
+            if not asm.assemble():
+                raise ValueError(asm.error)
+            instructions += len(asm.code)
+        return instructions
+    return run
+
+
+def setup_execute(size: int) -> Run:
+    """ Executes game_of_life.s for a number of ticks, with a fixed random seed """
+    asm = assemble('asm/game_of_life.s')
+    proc = Processor(asm.code, asm.sprites, random_seed=RANDOM_SEED)
+    proc.running = True
+
+    def run() -> int:
+        for _ in range(size):
+            proc.tick()
+        return size
+    return run
+
+
+def setup_gpu(size: int) -> Run:
+    """ Composes the buffer with a fixed image, through each GPU function in turn """
+    proc = Processor()
+    gpu = proc.gpu
+    gpu.image = ImageBuffer.create(lambda x, y: '#' if (x * y + x) % 3 == 0 else '.')
+    functions = list(GPUFunction)
+
+    def run() -> int:
+        for i in range(size):
+            gpu.buffer = gpu.compose(functions[i % len(functions)])
+        return size
+    return run
+
+
+def setup_blueprint(size: int) -> Run:
+    """ Decodes the full processor blueprint """
+    text = utils.read_file(os.path.join(ROOT_DIR, 'blueprints/v5.blueprint')).strip()
+
+    def run() -> int:
+        entities = 0
+        for _ in range(size):
+            entities += len(decode_blueprint_string(text)['blueprint']['entities'])
+        return entities
+    return run
+
+
+def setup_model(size: int) -> Run:
+    """ Ticks a chain of combinators until stable. A value ripples down the chain, one combinator per tick """
+    builder = ModelBuilder()
+    port = builder.cc('a=1')
+    for i in range(size):
+        entity = builder.ac('a := a + 1') if i % 2 == 0 else builder.dc('a if a > 0')
+        builder.red(port, entity.input)
+        port = entity.output
+    model = builder.build()
+
+    def run() -> int:
+        return model.tick_until_stable() + 1  # Including the last tick, which had no effect
+    return run
+
+
+WORKLOADS: Dict[str, Workload] = {w.name: w for w in (
+    Workload('assemble', 'instructions', 20, setup_assemble),
+    Workload('execute', 'ticks', 6_000, setup_execute),
+    Workload('gpu', 'composes', 600, setup_gpu),
+    Workload('blueprint', 'entities', 10, setup_blueprint),
+    Workload('model', 'ticks', 300, setup_model),
+)}
+
+
+if __name__ == '__main__':
+    main(read_command_line_args())
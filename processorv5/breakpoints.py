@@ -0,0 +1,275 @@
+# Breakpoints and watchpoints for programs running on the ProcessorV5 model
+# Breakpoints stop before the instruction at an address executes, and watchpoints stop after an instruction reads or writes a memory address
+# Either may have a condition, which is written in a small expression language, and compiled once to a closure:
+#
+#   Numbers        123, 0x7f
+#   Registers      r0 ... r16, sp, ra, rv, and pc
+#   Memory         @123, @name, @name[2], @r1 (the address in r1), @@name, @(r1 + 3)
+#   The value      value, the value read or written by a watched access. In a write watchpoint, memory still holds the previous value
+#   Operators      ! - ~, * , + -, << >>, < <= > >=, == !=, &, ^, |, &&, || (from highest to lowest precedence)
+#
+# Uninitialized memory, and addresses outside of main memory, read as zero. Conditions are true if they evaluate to any non-zero value
+
+from typing import List, Dict, Tuple, Optional, Callable, NamedTuple, Union
+from enum import Enum
+from numpy import int32
+from constants import Registers
+from processor import Processor, ProcessorHook
+
+import re
+import operator
+import constants
+
+
+WATCH_ADDRESS_SPACE = 1 << 16  # Covers main memory, and all device ports
+
+Condition = Callable[[Processor, int], int]  # (proc, value) -> result
+
+TOKEN = re.compile(r'\s*(?:(0x[0-9a-fA-F]+|\d+)|([A-Za-z_][A-Za-z_0-9]*(?:\[\d+\])?)|(==|!=|<=|>=|&&|\|\||<<|>>|[-+*&|^<>!~()@]))')
+
+BINARY_OPERATORS: Dict[str, Tuple[int, Optional[Callable[[int, int], int]]]] = {
+    '||': (1, None),  # Logical operators short circuit, so are compiled separately
+    '&&': (2, None),
+    '|': (3, operator.or_),
+    '^': (4, operator.xor),
+    '&': (5, operator.and_),
+    '==': (6, lambda a, b: int(a == b)),
+    '!=': (6, lambda a, b: int(a != b)),
+    '<': (7, lambda a, b: int(a < b)),
+    '<=': (7, lambda a, b: int(a <= b)),
+    '>': (7, lambda a, b: int(a > b)),
+    '>=': (7, lambda a, b: int(a >= b)),
+    '<<': (8, lambda a, b: a << b if 0 <= b < 64 else 0),
+    '>>': (8, lambda a, b: a >> b if 0 <= b < 64 else 0),
+    '+': (9, operator.add),
+    '-': (9, operator.sub),
+    '*': (10, operator.mul),
+}
+
+UNARY_OPERATORS: Dict[str, Callable[[int], int]] = {
+    '!': lambda a: int(not a),
+    '-': operator.neg,
+    '~': operator.invert,
+}
+
+REGISTERS: Dict[str, int] = {**{'r%d' % i: i for i in range(Registers.R16 + 1)}, 'sp': Registers.SP, 'ra': Registers.RA, 'rv': Registers.RV}
+
+
+def compile_condition(text: str, memory_table: Optional[Dict[int, str]] = None) -> Condition:
+    """ Compiles a condition to a closure. Raises a ValueError if the condition is not valid """
+    return ConditionCompiler(text, memory_table).compile()
+
+
+class ConditionCompiler:
+
+    def __init__(self, text: str, memory_table: Optional[Dict[int, str]] = None):
+        self.text = text
+        self.addresses: Dict[str, int] = {name: addr for addr, name in (memory_table or {}).items()}
+        self.tokens: List[str] = []
+        self.index = 0
+
+        pos = 0
+        while pos < len(text.rstrip()):
+            if (match := TOKEN.match(text, pos)) is None:
+                raise ValueError('Unexpected \'%s\' in condition \'%s\'' % (text[pos:].strip(), text))
+            self.tokens.append(match.group().strip())
+            pos = match.end()
+
+    def compile(self) -> Condition:
+        condition = self.expression(1)
+        if self.index < len(self.tokens):
+            raise ValueError('Unexpected \'%s\' in condition \'%s\'' % (self.tokens[self.index], self.text))
+        return condition
+
+    def expression(self, precedence: int) -> Condition:
+        left = self.unary()
+        while (token := self.peek()) in BINARY_OPERATORS and BINARY_OPERATORS[token][0] >= precedence:
+            self.index += 1
+            left = self.binary(token, left, self.expression(BINARY_OPERATORS[token][0] + 1))
+        return left
+
+    def binary(self, token: str, left: Condition, right: Condition) -> Condition:
+        if token == '&&':
+            return lambda p, v: int(bool(left(p, v) and right(p, v)))
+        if token == '||':
+            return lambda p, v: int(bool(left(p, v) or right(p, v)))
+        op = BINARY_OPERATORS[token][1]
+        assert op is not None
+        return lambda p, v: op(left(p, v), right(p, v))
+
+    def unary(self) -> Condition:
+        token = self.next()
+        if token in UNARY_OPERATORS:
+            op, operand = UNARY_OPERATORS[token], self.unary()
+            return lambda p, v: op(operand(p, v))
+        if token == '@':
+            address = self.address()
+            return lambda p, v: read_memory(p, address(p, v))
+        if token == '(':
+            inner = self.expression(1)
+            self.expect(')')
+            return inner
+        return self.atom(token)
+
+    def address(self) -> Condition:
+        """ The address following an '@'. Names are addresses, not values, so '@name' reads the memory named 'name' """
+        token = self.peek()
+        if token is not None and token in self.addresses:
+            self.index += 1
+            addr = self.addresses[token]
+            return lambda p, v: addr
+        return self.unary()
+
+    def atom(self, token: Optional[str]) -> Condition:
+        if token is None:
+            raise ValueError('Unexpected end of condition \'%s\'' % self.text)
+        if token[0].isdigit():
+            constant = int(token, 0)
+            return lambda p, v: constant
+        if token in REGISTERS:
+            addr = REGISTERS[token]
+            return lambda p, v: read_memory(p, addr)
+        if token == 'pc':
+            return lambda p, v: int(p.pc)
+        if token == 'value':
+            return lambda p, v: v
+        if token in self.addresses:
+            raise ValueError('\'%s\' is an address, use \'@%s\' to read it, in condition \'%s\'' % (token, token, self.text))
+        raise ValueError('Unknown name \'%s\' in condition \'%s\'' % (token, self.text))
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def next(self) -> Optional[str]:
+        token = self.peek()
+        self.index += 1
+        return token
+
+    def expect(self, expected: str):
+        if (token := self.next()) != expected:
+            raise ValueError('Expected \'%s\' but got \'%s\' in condition \'%s\'' % (expected, token if token is not None else 'end', self.text))
+
+
+def read_memory(proc: Processor, addr: int) -> int:
+    if 0 <= addr < len(proc.memory) and (value := proc.memory[addr]) is not None:
+        return int(value)
+    return 0
+
+
+class WatchKind(Enum):
+    READ = 'read'
+    WRITE = 'write'
+    CHANGE = 'change'  # A write of a different value
+
+
+class Breakpoint(NamedTuple):
+    id: int
+    pc: int
+    condition: Optional[Condition]
+    text: str  # How the breakpoint was specified
+
+class Watchpoint(NamedTuple):
+    id: int
+    addr: int
+    kind: WatchKind
+    condition: Optional[Condition]
+    text: str
+
+class BreakpointHit(NamedTuple):
+    point: Union[Breakpoint, Watchpoint]
+    value: Optional[int]  # The value read or written, for a watchpoint
+
+
+class Breakpoints:
+    """
+    The breakpoints and watchpoints of a single processor. Both are indexed by address in bitmaps, so checking an address which is not watched costs one lookup.
+    Memory hooks are only added to the processor while there are watchpoints which need them.
+    Breakpoints are checked by whatever runs the processor, by calling check_pc() before each instruction. Watchpoints set 'hit' when they trigger.
+    """
+
+    def __init__(self, proc: Processor):
+        self.proc = proc
+        self.next_id = 1
+        self.breakpoints: Dict[int, List[Breakpoint]] = {}  # pc -> breakpoints
+        self.watchpoints: Dict[int, List[Watchpoint]] = {}  # addr -> watchpoints
+        self.pc_bitmap = bytearray(constants.INSTRUCTION_MEMORY_SIZE)
+        self.read_bitmap = bytearray(WATCH_ADDRESS_SPACE)
+        self.write_bitmap = bytearray(WATCH_ADDRESS_SPACE)
+        self.hit: Optional[BreakpointHit] = None
+
+    def add_breakpoint(self, pc: int, condition: Optional[Condition] = None, text: str = '') -> Breakpoint:
+        if not 0 <= pc < len(self.pc_bitmap):
+            raise ValueError('Invalid breakpoint address %d' % pc)
+        point = Breakpoint(self.new_id(), pc, condition, text)
+        self.breakpoints.setdefault(pc, []).append(point)
+        self.pc_bitmap[pc] = 1
+        return point
+
+    def add_watchpoint(self, addr: int, kind: WatchKind, condition: Optional[Condition] = None, text: str = '') -> Watchpoint:
+        if not 0 <= addr < WATCH_ADDRESS_SPACE:
+            raise ValueError('Invalid watchpoint address %d' % addr)
+        point = Watchpoint(self.new_id(), addr, kind, condition, text)
+        self.watchpoints.setdefault(addr, []).append(point)
+        self.update_watches(addr)
+        return point
+
+    def remove(self, id: int) -> bool:
+        for pc, points in self.breakpoints.items():
+            if any(point.id == id for point in points):
+                points[:] = [point for point in points if point.id != id]
+                self.pc_bitmap[pc] = 1 if points else 0
+                return True
+        for addr, points in self.watchpoints.items():
+            if any(point.id == id for point in points):
+                points[:] = [point for point in points if point.id != id]
+                self.update_watches(addr)
+                return True
+        return False
+
+    def points(self) -> List[Union[Breakpoint, Watchpoint]]:
+        return sorted([point for points in (*self.breakpoints.values(), *self.watchpoints.values()) for point in points], key=lambda point: point.id)
+
+    def new_id(self) -> int:
+        self.next_id += 1
+        return self.next_id - 1
+
+    def update_watches(self, addr: int):
+        points = self.watchpoints[addr]
+        self.read_bitmap[addr] = any(point.kind == WatchKind.READ for point in points)
+        self.write_bitmap[addr] = any(point.kind != WatchKind.READ for point in points)
+
+        hooks = self.proc.hooks
+        for hook, bitmap, callback in ((ProcessorHook.MEM_READ, self.read_bitmap, self.on_mem_read), (ProcessorHook.MEM_WRITE, self.write_bitmap, self.on_mem_write)):
+            if any(bitmap) and callback not in hooks[hook]:
+                self.proc.add_hook(hook, callback)
+            elif not any(bitmap) and callback in hooks[hook]:
+                self.proc.remove_hook(hook, callback)
+
+    def check_pc(self, proc: Processor) -> bool:
+        """ Checks the breakpoints at the current PC, returning True if one is hit """
+        pc = proc.pc
+        if 0 <= pc < len(self.pc_bitmap) and self.pc_bitmap[pc]:
+            for point in self.breakpoints[int(pc)]:
+                if point.condition is None or point.condition(proc, 0):
+                    self.hit = BreakpointHit(point, None)
+                    return True
+        return False
+
+    def on_mem_read(self, proc: Processor, addr: int32, value: int32):
+        if 0 <= addr < WATCH_ADDRESS_SPACE and self.read_bitmap[addr]:
+            self.check_watch(proc, int(addr), int(value), False)
+
+    def on_mem_write(self, proc: Processor, addr: int32, value: int32):
+        if 0 <= addr < WATCH_ADDRESS_SPACE and self.write_bitmap[addr]:
+            self.check_watch(proc, int(addr), int(value), True)
+
+    def check_watch(self, proc: Processor, addr: int, value: int, write: bool):
+        for point in self.watchpoints[addr]:
+            if (point.kind == WatchKind.READ) == write:
+                continue
+            if point.kind == WatchKind.CHANGE and addr < len(proc.memory) and proc.memory[addr] is not None and int(proc.memory[addr]) == value:
+                continue  # Device ports have no previous value, so any write is a change
+            if point.condition is None or point.condition(proc, value):
+                if self.hit is None:
+                    self.hit = BreakpointHit(point, value)
+                return
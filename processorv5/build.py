@@ -0,0 +1,213 @@
+# This is an incremental build tool for a library of assembly programs for the ProcessorV5 architecture
+# It computes the include and texture dependency graph of all programs, scans shared files once, and assembles independent programs in parallel
+
+from typing import List, Dict, Tuple, Set, Optional, NamedTuple, Any
+from multiprocessing import Pool
+from networkx import DiGraph
+from networkx.algorithms.dag import descendants
+
+from phases.scanner import Scanner, ScanToken
+from assembler import Assembler
+
+import os
+import sys
+import json
+import utils
+import hashlib
+import argparse
+import assembler
+
+
+BUILD_CACHE_VERSION = 1
+
+
+def read_command_line_args():
+    parser = argparse.ArgumentParser(description='Incremental, parallel build tool for Factorio ProcessorV5 assembly programs')
+
+    parser.add_argument('files', type=str, nargs='+', help='The root assembly files to be compiled')
+
+    parser.add_argument('--object', action='store_true', dest='output_binary', help='Output a binary file')
+    parser.add_argument('--disassembly', action='store_true', dest='output_viewable', help='Output a hybrid view/disassembly file')
+    parser.add_argument('--factorio-blueprint', action='store_true', dest='output_blueprint', help='Output a blueprint string')
+    parser.add_argument('--factorio-memory-map', action='store_true', dest='output_factorio_memory_map', help='Output a Factorio Memory Mapping file to <file>.fmap')
+    parser.add_argument('--allocation-map', action='store_true', dest='output_allocation_map', help='Output the allocated and original address of each word to <file>.amap, requires --alloc')
+
+    parser.add_argument('--ea', action='store_true', dest='enable_assertions', default=False, help='Enable assert instructions in the output code')
+    parser.add_argument('--ep', action='store_true', dest='enable_print', default=False, help='Enable print instructions in the output code')
+    parser.add_argument('--opt', action='store_true', dest='enable_optimizations', default=False, help='Enable the optimizer')
+    parser.add_argument('--alloc', action='store_true', dest='enable_allocation', default=False, help='Enable the word allocator')
+
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help='The number of programs to assemble in parallel')
+    parser.add_argument('--cache', type=str, default='.build_cache.json', help='The file used to record the state of previous builds')
+    parser.add_argument('--force', action='store_true', default=False, help='Rebuild all programs, even if their inputs have not changed')
+
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    options = BuildOptions(args.output_binary, args.output_viewable, args.output_blueprint, args.output_factorio_memory_map, args.output_allocation_map and args.enable_allocation, args.enable_assertions, args.enable_print, args.enable_optimizations, args.enable_allocation)
+    build = Build(args.files, options, args.cache)
+    build.scan()
+    errors = build.build(args.jobs, args.force)
+
+    print('Built %d, up to date %d, failed %d' % (len(build.built), len(build.up_to_date), len(errors)))
+    for root, error in errors:
+        print('Error in %s:\n%s' % (root, error))
+    if errors:
+        sys.exit(1)
+
+
+class BuildOptions(NamedTuple):
+    output_binary: bool
+    output_viewable: bool
+    output_blueprint: bool
+    output_factorio_memory_map: bool
+    output_allocation_map: bool
+    enable_assertions: bool
+    enable_print: bool
+    enable_optimizations: bool
+    enable_allocation: bool
+
+    def outputs(self) -> Tuple[str, ...]:
+        return tuple(ext for ext, enabled in (('.o', self.output_binary), ('.v', self.output_viewable), ('.blueprint', self.output_blueprint), ('.fmap', self.output_factorio_memory_map), ('.amap', self.output_allocation_map)) if enabled)
+
+
+class BuildTask(NamedTuple):
+    root: str
+    options: BuildOptions
+    scanners: Dict[str, Scanner]
+
+
+class Build:
+    """
+    A make-like build over a set of root assembly files.
+    Nodes in the dependency graph are unique file paths, with an edge from each file to every file it includes, or texture it references.
+    """
+
+    def __init__(self, roots: List[str], options: BuildOptions, cache_file: Optional[str] = None):
+        self.roots: List[str] = [utils.unique_path(root) for root in roots]
+        self.options = options
+        self.cache_file = cache_file
+
+        self.graph: DiGraph = DiGraph()
+        self.scanners: Dict[str, Scanner] = {}  # Every assembly file, scanned exactly once
+        self.digests: Dict[str, str] = {}  # Content hash of every file in the graph
+
+        self.built: List[str] = []
+        self.up_to_date: List[str] = []
+
+    def scan(self):
+        """ Computes the dependency graph from all roots, scanning each reachable assembly file once """
+        queue = list(self.roots)
+        while queue:
+            file = queue.pop()
+            if file in self.scanners:
+                continue
+            self.graph.add_node(file)
+            try:
+                text = utils.read_file(file)
+            except OSError:
+                continue  # Missing files will be reported by the assembler, when it tries to include them
+
+            scanner = Scanner(text)
+            scanner.scan()
+            self.scanners[file] = scanner
+            for dependency, is_source in dependencies(scanner, os.path.dirname(file)):
+                self.graph.add_edge(file, dependency)
+                if is_source and dependency not in self.scanners:
+                    queue.append(dependency)
+
+    def dependencies(self, root: str) -> Set[str]:
+        return {root} | descendants(self.graph, root)
+
+    def digest(self, root: str) -> str:
+        """ The hash of all inputs to a root, including the build options """
+        h = hashlib.sha1(repr(self.options).encode('utf-8'))
+        for file in sorted(self.dependencies(root)):
+            if file not in self.digests:
+                try:
+                    with open(file, 'rb') as f:
+                        self.digests[file] = hashlib.sha1(f.read()).hexdigest()
+                except OSError:
+                    self.digests[file] = '?'
+            h.update(file.encode('utf-8'))
+            h.update(self.digests[file].encode('utf-8'))
+        return h.hexdigest()
+
+    def build(self, jobs: int = 1, force: bool = False) -> List[Tuple[str, str]]:
+        """ Assembles all out of date roots, returning a list of (root, error) for those that failed """
+        cache = self.load_cache()
+        digests = {root: self.digest(root) for root in self.roots}
+        tasks = []
+        for root in self.roots:
+            if not force and cache.get(root) == digests[root] and all(os.path.isfile(root + ext) for ext in self.options.outputs()):
+                self.up_to_date.append(root)
+            else:
+                # Files with scan errors are left out, as they will be re-scanned (and the error reported) by the assembler
+                scanners = {file: self.scanners[file] for file in self.dependencies(root) if file in self.scanners and self.scanners[file].error is None}
+                tasks.append(BuildTask(root, self.options, scanners))
+
+        if jobs > 1 and len(tasks) > 1:
+            with Pool(min(jobs, len(tasks))) as pool:
+                results = pool.map(build_root, tasks)
+        else:
+            results = [build_root(task) for task in tasks]
+
+        errors = []
+        for root, error in results:
+            if error is None:
+                self.built.append(root)
+                cache[root] = digests[root]
+            else:
+                errors.append((root, error))
+                cache.pop(root, None)
+
+        self.save_cache(cache)
+        return errors
+
+    def load_cache(self) -> Dict[str, str]:
+        if self.cache_file is not None and os.path.isfile(self.cache_file):
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    data: Dict[str, Any] = json.load(f)
+                if data.get('version') == BUILD_CACHE_VERSION:
+                    return data['roots']
+            except (OSError, ValueError, KeyError):
+                pass
+        return {}
+
+    def save_cache(self, cache: Dict[str, str]):
+        if self.cache_file is not None:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump({'version': BUILD_CACHE_VERSION, 'roots': cache}, f, indent=2)
+
+
+def dependencies(scanner: Scanner, root: str) -> List[Tuple[str, bool]]:
+    """ Finds all files referenced by 'include' and 'texture' statements, returned as (unique path, is assembly source) """
+    deps = []
+    tokens = scanner.output_tokens
+    for i, t in enumerate(tokens):
+        if ScanToken.INCLUDE.equals(t) and i + 2 < len(tokens) and ScanToken.STRING.equals(tokens[i + 1]):
+            deps.append((utils.unique_path(os.path.join(root, tokens[i + 2])), True))
+        elif ScanToken.TEXTURE.equals(t) and i + 4 < len(tokens) and ScanToken.IDENTIFIER.equals(tokens[i + 1]) and ScanToken.STRING.equals(tokens[i + 3]):
+            deps.append((utils.unique_path(os.path.join(root, tokens[i + 4])), False))
+    return deps
+
+
+def build_root(task: BuildTask) -> Tuple[str, Optional[str]]:
+    root, options, scanners = task
+    try:
+        text = utils.read_file(root)
+    except OSError as e:
+        return root, str(e)
+
+    asm = Assembler(root, text, options.enable_assertions, options.enable_print, scanners, options.enable_optimizations, options.enable_allocation)
+    if not asm.assemble():
+        return root, asm.error
+
+    assembler.write_outputs(asm, root, options.output_binary, options.output_viewable, options.output_blueprint, options.output_factorio_memory_map, options.output_allocation_map)
+    return root, None
+
+
+if __name__ == '__main__':
+    main(read_command_line_args())
@@ -25,6 +25,9 @@ SCREEN_HEIGHT = 32
 
 STACK_POINTER_START = 1020
 
+DIRECTIVE_SIM_CLOCK_TIME = 'sim_clock_time'
+DIRECTIVE_RANDOM_SEED = 'random_seed'
+
 
 class Instructions(Enum):
     """
@@ -0,0 +1,322 @@
+# Time travel debugger for programs running on the ProcessorV5 model
+# Periodically snapshots the processor, so any earlier tick can be reconstructed by restoring the nearest snapshot and re-executing from there
+# Memory is snapshot in pages, and pages which have not changed since the previous snapshot are shared with it, so each snapshot only copies what was written
+# Re-execution must reproduce the original run, so programs should be run with a seeded random device, and scripted or replayed control inputs
+# Running forwards stops at any breakpoints and watchpoints. Re-executing after moving back does not
+
+from typing import List, Dict, Tuple, Optional, Callable, NamedTuple, Any
+from numpy import int32
+from assembler import Assembler
+from processor import Processor, ProcessorError, ProcessorEvent, ProcessorHook, ImageBuffer
+from breakpoints import Breakpoints, Breakpoint, WatchKind, compile_condition, REGISTERS
+from recording import Recording, Replayer
+from runner import RunnerControlDevice, RunnerEventHandle
+
+import cmd
+import sys
+import bisect
+import utils
+import argparse
+import disassembler
+
+
+PAGE_SIZE = 64  # Words of memory per page
+DEFAULT_SNAPSHOT_INTERVAL = 1000  # Ticks between snapshots
+
+
+def read_command_line_args():
+    parser = argparse.ArgumentParser(description='Time travel debugger for Factorio ProcessorV5 programs')
+
+    parser.add_argument('file', type=str, help='The assembly file to be debugged')
+
+    parser.add_argument('--ea', action='store_true', dest='enable_assertions', default=False, help='Enable assert instructions')
+    parser.add_argument('--ep', action='store_true', dest='enable_print', default=False, help='Enable print instructions')
+    parser.add_argument('--opt', action='store_true', dest='enable_optimizations', default=False, help='Enable the optimizer')
+    parser.add_argument('--alloc', action='store_true', dest='enable_allocation', default=False, help='Enable the word allocator')
+
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the random device')
+    parser.add_argument('--replay', type=str, default=None, help='Replay the inputs of a recording')
+    parser.add_argument('--interval', type=int, default=DEFAULT_SNAPSHOT_INTERVAL, help='Ticks between snapshots. Smaller intervals use more memory, but step back faster')
+
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    asm = Assembler(args.file, utils.read_file(args.file), args.enable_assertions, args.enable_print, enable_optimizations=args.enable_optimizations, enable_allocation=args.enable_allocation)
+    if not asm.assemble():
+        print(asm.error)
+        sys.exit(1)
+
+    proc = Processor(asm.code, asm.sprites, asm.print_table, event_handle=RunnerEventHandle(), random_seed=args.seed)
+    if args.replay is not None:
+        Replayer(proc, Recording.load(args.replay)).attach()
+    else:
+        proc.devices.append(RunnerControlDevice())
+
+    DebuggerConsole(TimeTravelDebugger(proc, asm.label_table, args.interval).start(), asm).cmdloop()
+
+
+class Snapshot(NamedTuple):
+    tick: int
+    pc: int32
+    running: bool
+    cpi_instruction_count: int
+    pages: Tuple[List[Optional[int32]], ...]  # Pages are shared between snapshots, and never modified
+    gpu: Tuple[ImageBuffer, ImageBuffer, ImageBuffer]  # Screen, buffer and image. Image buffers are replaced, never modified
+    devices: Tuple[Any, ...]
+
+
+class TimeTravelDebugger:
+    """
+    Runs a single processor forwards, taking a snapshot every 'interval' ticks, and can move it to any earlier tick.
+    'tick' counts the instructions executed since start(). Moving to a tick leaves the processor about to execute that instruction.
+    Events are only posted the first time an instruction executes, not when it is re-executed after moving back.
+    """
+
+    def __init__(self, proc: Processor, label_table: Optional[Dict[int, str]] = None, interval: int = DEFAULT_SNAPSHOT_INTERVAL):
+        self.proc = proc
+        self.labels: Dict[str, int] = {name: addr for addr, name in (label_table or {}).items()}
+        self.breakpoints = Breakpoints(proc)
+        self.interval = interval
+        self.tick = 0
+        self.furthest = 0  # The furthest tick reached
+        self.snapshots: List[Snapshot] = []
+        self.event_handle = proc.event_handle
+        self.error: Optional[ProcessorError] = None  # The error raised by the instruction at the current tick, if any
+
+    def start(self) -> 'TimeTravelDebugger':
+        proc = self.proc
+        for device in proc.devices:
+            device.start()
+        proc.running = True
+        proc.pc = int32(0)
+        proc.event_handle = self.on_event
+        self.tick = self.furthest = 0
+        self.snapshots = []
+        self.snapshot()
+        return self
+
+    def step(self, count: int = 1) -> int:
+        """ Executes up to 'count' instructions, stopping early if the processor halts or raises an error. Returns the number executed """
+        return self.run(count)
+
+    def run(self, max_ticks: Optional[int] = None, until: Optional[Callable[[Processor], bool]] = None, stop_at_breakpoints: bool = True) -> int:
+        """
+        Executes until the processor halts, raises an error, 'until' is true before an instruction, or 'max_ticks' are executed.
+        Also stops before an instruction with a breakpoint, or after one which hits a watchpoint, which is stored in 'breakpoints.hit'.
+        """
+        proc, breakpoints = self.proc, self.breakpoints
+        breakpoints.hit = None
+        ticks = 0
+        while proc.running and (max_ticks is None or ticks < max_ticks) and not (ticks > 0 and until is not None and until(proc)):
+            if ticks > 0 and stop_at_breakpoints and breakpoints.check_pc(proc):
+                break
+            if self.tick % self.interval == 0 and self.tick > self.snapshots[-1].tick:
+                self.snapshot()
+            try:
+                proc.tick()
+            except ProcessorError as e:
+                self.error = e
+                break
+            self.tick += 1
+            ticks += 1
+            if breakpoints.hit is not None and stop_at_breakpoints:
+                break
+        if not stop_at_breakpoints:
+            breakpoints.hit = None
+        self.furthest = max(self.furthest, self.tick)
+        return ticks
+
+    def on_event(self, proc: Processor, event_type: ProcessorEvent, arg: Any):
+        if self.tick >= self.furthest:
+            self.event_handle(proc, event_type, arg)
+
+    def run_to_label(self, label: str, max_ticks: Optional[int] = None) -> bool:
+        """ Executes until the instruction at a label is next. Returns False if it was not reached """
+        addr = self.labels[label]
+        self.run(max_ticks, lambda p: p.pc == addr)
+        return self.proc.pc == addr and self.proc.running and self.breakpoints.hit is None
+
+    def step_back(self, count: int = 1):
+        self.goto(max(self.tick - count, 0))
+
+    def goto(self, tick: int):
+        """ Moves to a tick by restoring the nearest snapshot before it, if that is closer than the current tick, and executing from there """
+        snapshot = self.snapshots[bisect.bisect_right(self.snapshots, tick, key=lambda s: s.tick) - 1]
+        if tick < self.tick or snapshot.tick > self.tick:
+            self.restore(snapshot)
+        self.run(tick - self.tick, stop_at_breakpoints=False)
+
+    def run_back_to_write(self, addr: int) -> bool:
+        """ Moves back to the last instruction which wrote to an address. Returns False, without moving, if none did since start """
+        end = self.tick
+        writes: List[int] = []
+        def on_mem_write(p: Processor, a: int32, value: int32):
+            if a == addr:
+                writes.append(self.tick)
+
+        self.proc.add_hook(ProcessorHook.MEM_WRITE, on_mem_write)
+        try:
+            # Search each interval between snapshots, from the most recent, until one contains a write
+            i = bisect.bisect_left(self.snapshots, end, key=lambda s: s.tick) - 1
+            while i >= 0 and not writes:
+                stop = self.snapshots[i + 1].tick if i + 1 < len(self.snapshots) else end
+                self.restore(self.snapshots[i])
+                self.run(min(stop, end) - self.tick, stop_at_breakpoints=False)
+                i -= 1
+        finally:
+            self.proc.remove_hook(ProcessorHook.MEM_WRITE, on_mem_write)
+
+        self.goto(writes[-1] if writes else end)
+        return bool(writes)
+
+    def snapshot(self):
+        proc = self.proc
+        previous = self.snapshots[-1].pages if self.snapshots else None
+        pages = []
+        for i, start in enumerate(range(0, len(proc.memory), PAGE_SIZE)):
+            page = proc.memory[start:start + PAGE_SIZE]
+            pages.append(previous[i] if previous is not None and previous[i] == page else page)
+        self.snapshots.append(Snapshot(
+            self.tick,
+            proc.pc,
+            proc.running,
+            proc.cpi_instruction_count,
+            tuple(pages),
+            (proc.gpu.screen, proc.gpu.buffer, proc.gpu.image),
+            tuple(device.save_state() for device in proc.devices)
+        ))
+
+    def restore(self, snapshot: Snapshot):
+        proc = self.proc
+        for i, page in enumerate(snapshot.pages):
+            proc.memory[i * PAGE_SIZE:(i + 1) * PAGE_SIZE] = page
+        proc.pc = snapshot.pc
+        proc.running = snapshot.running
+        proc.cpi_instruction_count = snapshot.cpi_instruction_count
+        proc.gpu.screen, proc.gpu.buffer, proc.gpu.image = snapshot.gpu
+        for device, state in zip(proc.devices, snapshot.devices):
+            device.restore_state(state)
+        self.tick = snapshot.tick
+        self.error = None
+
+
+class DebuggerConsole(cmd.Cmd):
+
+    intro = 'Time travel debugger. Type \'help\' for a list of commands'
+    prompt = '(debug) '
+
+    def __init__(self, debugger: TimeTravelDebugger, asm: Assembler):
+        super().__init__()
+        self.debugger = debugger
+        self.asm = asm
+        self.dis = disassembler.Disassembler(asm.code, asm.print_table, asm.memory_table, asm.label_table)
+        self.addresses: Dict[str, int] = {name: addr for addr, name in asm.memory_table.items()}
+
+    def do_step(self, arg: str):
+        """ step [count]: Execute the next instruction, or 'count' instructions """
+        self.debugger.step(int(arg) if arg else 1)
+
+    def do_back(self, arg: str):
+        """ back [count]: Step back one instruction, or 'count' instructions """
+        self.debugger.step_back(int(arg) if arg else 1)
+
+    def do_goto(self, arg: str):
+        """ goto <tick>: Move to a tick, either forwards or backwards """
+        self.debugger.goto(int(arg))
+
+    def do_run(self, arg: str):
+        """ run [ticks]: Run until the program halts or raises an error, or for at most 'ticks' instructions """
+        self.debugger.run(int(arg) if arg else None)
+
+    def do_until(self, arg: str):
+        """ until <label>: Run until the instruction at a label is next """
+        if arg not in self.debugger.labels:
+            print('Unknown label \'%s\'' % arg)
+        elif not self.debugger.run_to_label(arg):
+            print('Did not reach \'%s\'' % arg)
+
+    def do_write(self, arg: str):
+        """ write <address>: Move back to the last instruction which wrote an address, i.e. 'r1', 'sp', '@name' or '@123' """
+        if (addr := self.parse_address(arg)) is None:
+            print('Unknown address \'%s\'' % arg)
+        elif not self.debugger.run_back_to_write(addr):
+            print('No writes to \'%s\'' % arg)
+
+    def do_break(self, arg: str):
+        """ break <label|address> [if <condition>]: Stop before the instruction at a label or address executes, if the condition is true """
+        target, condition = self.parse_condition(arg)
+        pc = self.debugger.labels.get(target, int(target) if target.isdigit() else None)
+        if pc is None:
+            print('Unknown label \'%s\'' % target)
+        elif condition is not False:
+            print('Breakpoint %d' % self.debugger.breakpoints.add_breakpoint(pc, condition, arg).id)
+
+    def do_watch(self, arg: str):
+        """ watch <address> [read|write|change] [if <condition>]: Stop after an instruction writes (by default) or reads an address, if the condition is true """
+        target, condition = self.parse_condition(arg)
+        target, _, kind = target.partition(' ')
+        if (addr := self.parse_address(target)) is None:
+            print('Unknown address \'%s\'' % target)
+        elif kind.strip() not in ('', *(k.value for k in WatchKind)):
+            print('Unknown watch kind \'%s\'' % kind.strip())
+        elif condition is not False:
+            print('Watchpoint %d' % self.debugger.breakpoints.add_watchpoint(addr, WatchKind(kind.strip() or 'write'), condition, arg).id)
+
+    def do_delete(self, arg: str):
+        """ delete <id>: Delete a breakpoint or watchpoint """
+        if not arg.isdigit() or not self.debugger.breakpoints.remove(int(arg)):
+            print('No breakpoint or watchpoint %s' % arg)
+
+    def do_points(self, arg: str):
+        """ points: List all breakpoints and watchpoints """
+        for point in self.debugger.breakpoints.points():
+            print('%d: %s %s' % (point.id, 'break' if isinstance(point, Breakpoint) else 'watch', point.text))
+
+    def do_view(self, arg: str):
+        """ view: Show the processor state """
+        print(self.debugger.proc.debug_view())
+
+    def do_quit(self, arg: str) -> bool:
+        """ quit: Exit the debugger """
+        return True
+
+    do_EOF = do_quit
+
+    def postcmd(self, stop: bool, line: str) -> bool:
+        if not stop:
+            debugger, pc = self.debugger, int(self.debugger.proc.pc)
+            inst = self.dis.decode_line(pc) if 0 <= pc < len(self.dis.code) else '%04d' % pc
+            print('Tick %d: %s%s' % (debugger.tick, inst, '' if debugger.proc.running else ' (halted)'))
+            if debugger.error is not None:
+                print(debugger.error)
+            if (hit := debugger.breakpoints.hit) is not None:
+                print('Hit %d: %s%s' % (hit.point.id, hit.point.text, ', value = %d' % hit.value if hit.value is not None else ''))
+                debugger.breakpoints.hit = None
+        return stop
+
+    def emptyline(self) -> bool:
+        return False  # Do not repeat the last command
+
+    def parse_condition(self, arg: str) -> Tuple[str, Any]:
+        """ Splits '<target> if <condition>', returning the compiled condition, None if there is none, or False if it is invalid """
+        target, _, text = arg.partition(' if ')
+        if not text:
+            return target.strip(), None
+        try:
+            return target.strip(), compile_condition(text, self.asm.memory_table)
+        except ValueError as e:
+            print(e)
+            return target.strip(), False
+
+    def parse_address(self, arg: str) -> Optional[int]:
+        if arg in REGISTERS:
+            return REGISTERS[arg]
+        if arg.startswith('@'):
+            arg = arg[1:]
+            return int(arg) if arg.isdigit() else self.addresses.get(arg)
+        return None
+
+
+if __name__ == '__main__':
+    main(read_command_line_args())
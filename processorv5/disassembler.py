@@ -1,8 +1,57 @@
+# This is a disassembler for ProcessorV5 binary level instructions
+# It can also be run on an object file produced by the assembler, to produce a view/disassembly file without the source
+
 from constants import Instructions, Opcodes, Registers, GPUInstruction, GPUFunction, GPUImageDecoder
 from numpy import int32, uint64
-from typing import List, Sequence, Tuple, Dict
+from typing import List, Sequence, Tuple, Dict, Iterable, Iterator, Optional, BinaryIO, TextIO
+from functools import lru_cache
 
+import sys
+import numpy
 import processor
+import argparse
+
+
+LINE_CACHE_SIZE = 1024
+OBJECT_CHUNK_SIZE = 1024  # Instructions read from an object file at a time
+
+
+def read_command_line_args():
+    parser = argparse.ArgumentParser(description='Disassembler for Factorio ProcessorV5 object files')
+
+    parser.add_argument('file', type=str, help='The object file to be disassembled')
+    parser.add_argument('--out', type=str, default=None, help='The output file name, or \'-\' for the console. Defaults to the object file name, with a .v extension')
+
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    output_file = args.out if args.out is not None else (args.file[:-2] if args.file.endswith('.o') else args.file) + '.v'
+    with open(args.file, 'rb') as f:
+        if output_file == '-':
+            write_viewable(sys.stdout, read_object(f))
+        else:
+            with open(output_file, 'w', encoding='utf-8') as out:
+                write_viewable(out, read_object(f))
+
+
+def read_object(f: BinaryIO) -> Iterator[int]:
+    """ Reads the instructions of an object file, as big endian 64-bit words, one chunk at a time """
+    while chunk := f.read(8 * OBJECT_CHUNK_SIZE):
+        if len(chunk) % 8 != 0:
+            raise ValueError('Object file is not a whole number of instructions')
+        yield from numpy.frombuffer(chunk, dtype='>u8').tolist()
+
+
+def write_viewable(f: TextIO, code: Iterable[int], print_table: Sequence[Tuple[str, Tuple[int, ...]]] | None = None, memory_table: Dict[int, str] | None = None, label_table: Dict[int, str] | None = None):
+    """ Writes the hybrid view/disassembly of the code, one line at a time, as it is decoded """
+    f.writelines(viewable_lines(code, print_table, memory_table, label_table))
+
+
+def viewable_lines(code: Iterable[int], print_table: Sequence[Tuple[str, Tuple[int, ...]]] | None = None, memory_table: Dict[int, str] | None = None, label_table: Dict[int, str] | None = None) -> Iterator[str]:
+    dis = Disassembler((), print_table, memory_table, label_table)  # Only used to decode each line, which is not cached
+    for i, c in enumerate(code):
+        yield '%s %s | %s\n' % (format(c >> 32, '032b'), format(c & 0xFFFF_FFFF, '032b'), dis.decode_instruction(i, c))
 
 
 def decode(code: List[int], print_table: Sequence[Tuple[str, Tuple[int, ...]]] | None = None, memory_table: Dict[int, str] | None = None, label_table: Dict[int, str] | None = None) -> List[str]:
@@ -10,6 +59,9 @@ def decode(code: List[int], print_table: Sequence[Tuple[str, Tuple[int, ...]]] |
 
 
 class Disassembler:
+    """
+    Decodes lines of code on demand. The code must not change after construction, as decoded lines are cached, up to LINE_CACHE_SIZE per instance.
+    """
 
     def __init__(self, code: List[int], print_table: Sequence[Tuple[str, Tuple[int, ...]]] | None = None, memory_table: Dict[int, str] | None = None, label_table: Dict[int, str] | None = None):
         self.code = code
@@ -19,65 +71,73 @@ class Disassembler:
         self.memory_table = memory_table
         self.label_table = label_table
 
+        self.decode_line = lru_cache(maxsize=LINE_CACHE_SIZE)(self.decode_uncached)
+
     def decode(self) -> List[str]:
-        decoded = []
-        for i, c in enumerate(self.code):
-            if c is None:
-                decoded.append('---')
-                continue
-
-            fields = processor.decode_ir(uint64(c))
-            op = Opcodes(fields.opcode)
-            op_name = op.name.lower()
-            if c == 0:  # Special case, this is a implicit (and explicitly generated) noop
-                op_name = 'noop'
-            inst = '%04d | %s' % (i, op_name)
-
-            if c == 0:  # noop
-                pass
-            elif op.value <= Opcodes.LE.value:  # Type A
-                inst += ' ' + self.decode_address(fields.op2) + ' ' + self.decode_address(fields.op1) + ' ' + self.decode_address(fields.op3)
-            elif op.value <= Opcodes.GTI.value:  # Type B
-                inst += ' ' + self.decode_address(fields.op2) + ' ' + self.decode_address(fields.op3) + ' ' + str(fields.imm26)
-            elif op.value <= Opcodes.BLE.value:  # Type C
-                inst += ' ' + self.decode_address(fields.op1) + ' ' + self.decode_address(fields.op3) + ' ' + self.decode_offset(i, fields.branch)
-            elif op.value <= Opcodes.BGTI.value:  # Type D
-                inst += ' ' + self.decode_address(fields.op3) + ' ' + str(fields.imm26) + ' ' + self.decode_offset(i, fields.branch)
-            elif op == Opcodes.HALT or op == Opcodes.RET:
-                pass
-            elif op == Opcodes.CALL:
-                inst += ' ' + self.decode_offset(i, fields.branch)
-            elif op == Opcodes.ASSERT:
-                inst += ' ' + self.decode_address(fields.op3) + ' = ' + str(fields.imm26)
-            elif op == Opcodes.PRINT:
-                inst += ' ['
-                if self.print_table is not None:
-                    format_string, ops = self.print_table[fields.print_index]
-                    inst += ' "' + format_string + '" ' + ' '.join([self.decode_address(op) for op in ops])
-                inst += ' ]'
-            elif op == Opcodes.GPU:
-                gpu = GPUInstruction(fields.gpu_opcode)
-                inst = '%04d | %s' % (i, Instructions[gpu.name].value)
-                if gpu == GPUInstruction.GLSI:
-                    inst += ' ' + str(fields.op1)
-                elif gpu == GPUInstruction.GLS:
-                    inst += ' ' + self.decode_address(fields.op1)
-                elif gpu == GPUInstruction.GLSD:
-                    inst += ' ' + self.decode_address(fields.op1) + ' ' + GPUImageDecoder(fields.gpu_function).name
-                elif gpu == GPUInstruction.GCB or gpu == GPUInstruction.GCI:
-                    inst += ' ' + GPUFunction(fields.gpu_function).name
-                elif gpu == GPUInstruction.GMV:
-                    inst += ' ' + self.decode_address(fields.op1) + ' ' + self.decode_address(fields.op3)
-                elif gpu == GPUInstruction.GMVI:
-                    inst += ' ' + str(fields.op1) + ' ' + str(fields.op3)
-            else:
-                raise NotImplementedError
-
-            if self.label_table is not None and i in self.label_table:
-                inst += ' #%s' % self.label_table[i]
-
-            decoded.append(inst)
-        return decoded
+        return self.decode_range(0, len(self.code))
+
+    def decode_range(self, start: int, stop: int) -> List[str]:
+        """ Decodes the lines in [start, stop), clamped to the code """
+        return [self.decode_line(i) for i in range(max(start, 0), min(stop, len(self.code)))]
+
+    def decode_uncached(self, i: int) -> str:
+        return self.decode_instruction(i, self.code[i])
+
+    def decode_instruction(self, i: int, c: Optional[int]) -> str:
+        if c is None:
+            return '---'
+
+        fields = processor.decode_ir(uint64(c))
+        op = Opcodes(fields.opcode)
+        op_name = op.name.lower()
+        if c == 0:  # Special case, this is a implicit (and explicitly generated) noop
+            op_name = 'noop'
+        inst = '%04d | %s' % (i, op_name)
+
+        if c == 0:  # noop
+            pass
+        elif op.value <= Opcodes.LE.value:  # Type A
+            inst += ' ' + self.decode_address(fields.op2) + ' ' + self.decode_address(fields.op1) + ' ' + self.decode_address(fields.op3)
+        elif op.value <= Opcodes.GTI.value:  # Type B
+            inst += ' ' + self.decode_address(fields.op2) + ' ' + self.decode_address(fields.op3) + ' ' + str(fields.imm26)
+        elif op.value <= Opcodes.BLE.value:  # Type C
+            inst += ' ' + self.decode_address(fields.op1) + ' ' + self.decode_address(fields.op3) + ' ' + self.decode_offset(i, fields.branch)
+        elif op.value <= Opcodes.BGTI.value:  # Type D
+            inst += ' ' + self.decode_address(fields.op3) + ' ' + str(fields.imm26) + ' ' + self.decode_offset(i, fields.branch)
+        elif op == Opcodes.HALT or op == Opcodes.RET:
+            pass
+        elif op == Opcodes.CALL:
+            inst += ' ' + self.decode_offset(i, fields.branch)
+        elif op == Opcodes.ASSERT:
+            inst += ' ' + self.decode_address(fields.op3) + ' = ' + str(fields.imm26)
+        elif op == Opcodes.PRINT:
+            inst += ' ['
+            if self.print_table is not None:
+                format_string, ops = self.print_table[fields.print_index]
+                inst += ' "' + format_string + '" ' + ' '.join([self.decode_address(op) for op in ops])
+            inst += ' ]'
+        elif op == Opcodes.GPU:
+            gpu = GPUInstruction(fields.gpu_opcode)
+            inst = '%04d | %s' % (i, Instructions[gpu.name].value)
+            if gpu == GPUInstruction.GLSI:
+                inst += ' ' + str(fields.op1)
+            elif gpu == GPUInstruction.GLS:
+                inst += ' ' + self.decode_address(fields.op1)
+            elif gpu == GPUInstruction.GLSD:
+                inst += ' ' + self.decode_address(fields.op1) + ' ' + GPUImageDecoder(fields.gpu_function).name
+            elif gpu == GPUInstruction.GCB or gpu == GPUInstruction.GCI:
+                inst += ' ' + GPUFunction(fields.gpu_function).name
+            elif gpu == GPUInstruction.GMV:
+                inst += ' ' + self.decode_address(fields.op1) + ' ' + self.decode_address(fields.op3)
+            elif gpu == GPUInstruction.GMVI:
+                inst += ' ' + str(fields.op1) + ' ' + str(fields.op3)
+        else:
+            raise NotImplementedError
+
+        if self.label_table is not None and i in self.label_table:
+            inst += ' #%s' % self.label_table[i]
+
+        return inst
 
     def decode_address(self, value: int32):
         return decode_address(value, self.memory_table)
@@ -93,16 +153,22 @@ def decode_address(value: int32, memory_table: Dict[int, str] | None = None) ->
     op = processor.decode_operand(value)
     indirect = '@' if op.indirect == 1 else ''
     offset = '.%d' % op.offset if op.offset != 0 else ''
-    if 0 <= op.addr <= Registers.R16:  # Infer register argument
-        address = 'r%d' % op.addr
-    elif op.addr == Registers.SP:
-        address = 'sp'
-    elif op.addr == Registers.RA:
-        address = 'ra'
-    elif op.addr == Registers.RV:
-        address = 'rv'
-    elif memory_table is not None and op.addr in memory_table:
-        address = '@' + memory_table[op.addr]
-    else:
-        address = '@%d' % op.addr
-    return indirect + address + offset
+    return indirect + address_name(op.addr, memory_table) + offset
+
+
+def address_name(addr: int, memory_table: Dict[int, str] | None = None) -> str:
+    if 0 <= addr <= Registers.R16:  # Infer register argument
+        return 'r%d' % addr
+    if addr == Registers.SP:
+        return 'sp'
+    if addr == Registers.RA:
+        return 'ra'
+    if addr == Registers.RV:
+        return 'rv'
+    if memory_table is not None and addr in memory_table:
+        return '@' + memory_table[addr]
+    return '@%d' % addr
+
+
+if __name__ == '__main__':
+    main(read_command_line_args())
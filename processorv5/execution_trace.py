@@ -0,0 +1,170 @@
+# Execution trace for programs running on the ProcessorV5 model
+# Keeps the last N instructions executed in a fixed size ring buffer, which can stay attached during long runs, and be saved when a program faults
+# Saved traces can be viewed with the program's symbols, by running this module with the program source
+
+from typing import List, Sequence, NamedTuple, Optional
+from numpy import int32
+from assembler import Assembler
+from processor import Processor, ProcessorHook, IRData
+from disassembler import Disassembler
+
+import sys
+import zlib
+import numpy
+import utils
+import argparse
+import disassembler
+
+
+TRACE_VERSION = 1
+DEFAULT_TRACE_SIZE = 1 << 16
+NO_WRITE = -1  # The written address of an instruction which did not write memory
+
+
+def read_command_line_args():
+    parser = argparse.ArgumentParser(description='Viewer for Factorio ProcessorV5 execution traces')
+
+    parser.add_argument('trace', type=str, help='The trace file to be viewed')
+    parser.add_argument('file', type=str, help='The assembly file which was run, for symbols')
+
+    parser.add_argument('--ea', action='store_true', dest='enable_assertions', default=False, help='Enable assert instructions')
+    parser.add_argument('--ep', action='store_true', dest='enable_print', default=False, help='Enable print instructions')
+    parser.add_argument('--opt', action='store_true', dest='enable_optimizations', default=False, help='Enable the optimizer')
+    parser.add_argument('--alloc', action='store_true', dest='enable_allocation', default=False, help='Enable the word allocator')
+
+    parser.add_argument('--last', type=int, default=None, help='Only show this many of the last instructions')
+
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    asm = Assembler(args.file, utils.read_file(args.file), args.enable_assertions, args.enable_print, enable_optimizations=args.enable_optimizations, enable_allocation=args.enable_allocation)
+    if not asm.assemble():
+        print(asm.error)
+        sys.exit(1)
+
+    trace = Trace.load(args.trace)
+    if trace.code_hash != code_hash(asm.code):
+        print('Warning: The trace was recorded from a different program, or with different assembler options')
+    entries = trace.entries if args.last is None else trace.entries[-args.last:]
+    print('\n'.join(trace.format(entries, Disassembler(asm.code, asm.print_table, asm.memory_table, asm.label_table))))
+
+
+class TraceEntry(NamedTuple):
+    index: int  # The number of instructions executed before this one, since the trace was attached
+    pc: int
+    opcode: int
+    addr: int  # The last address written, or NO_WRITE
+    value: int
+
+
+class ExecutionTrace:
+    """
+    A ring buffer of the last 'size' instructions executed by a single processor, using its instruction and memory write hooks.
+    Each entry is written into preallocated lists, so recording an instruction only costs a few stores.
+    """
+
+    def __init__(self, proc: Processor, size: int = DEFAULT_TRACE_SIZE):
+        self.proc = proc
+        self.size = size
+        self.count = 0  # The total number of instructions traced
+        self.index = size - 1  # The entry of the current instruction
+        self.pcs: List[int32] = [int32(0)] * size
+        self.opcodes: List[int32] = [int32(0)] * size
+        self.addrs: List[int32] = [int32(NO_WRITE)] * size
+        self.values: List[int32] = [int32(0)] * size
+
+    def attach(self) -> 'ExecutionTrace':
+        self.proc.add_hook(ProcessorHook.INSTRUCTION, self.on_instruction)
+        self.proc.add_hook(ProcessorHook.MEM_WRITE, self.on_mem_write)
+        return self
+
+    def detach(self):
+        self.proc.remove_hook(ProcessorHook.INSTRUCTION, self.on_instruction)
+        self.proc.remove_hook(ProcessorHook.MEM_WRITE, self.on_mem_write)
+
+    def on_instruction(self, proc: Processor, pc: int32, ir: IRData):
+        index = self.index + 1
+        if index == self.size:
+            index = 0
+        self.index = index
+        self.count += 1
+        self.pcs[index] = pc
+        self.opcodes[index] = ir.opcode
+        self.addrs[index] = NO_WRITE
+
+    def on_mem_write(self, proc: Processor, addr: int32, value: int32):
+        self.addrs[self.index] = addr
+        self.values[self.index] = value
+
+    def trace(self) -> 'Trace':
+        """ A copy of the buffer, in execution order """
+        if self.count < self.size:
+            order = list(range(self.count))
+        else:
+            order = [(self.index + 1 + i) % self.size for i in range(self.size)]
+        return Trace(
+            code_hash(self.proc.instructions),
+            self.count,
+            numpy.array([self.pcs[i] for i in order], dtype=numpy.int32),
+            numpy.array([self.opcodes[i] for i in order], dtype=numpy.int32),
+            numpy.array([self.addrs[i] for i in order], dtype=numpy.int32),
+            numpy.array([self.values[i] for i in order], dtype=numpy.int32)
+        )
+
+    def save(self, file: str):
+        self.trace().save(file)
+
+
+class Trace(NamedTuple):
+    """ The saved contents of an execution trace. Arrays hold one element per entry, oldest first """
+    code_hash: int
+    count: int
+    pcs: numpy.ndarray
+    opcodes: numpy.ndarray
+    addrs: numpy.ndarray
+    values: numpy.ndarray
+
+    @property
+    def entries(self) -> List[TraceEntry]:
+        first = self.count - len(self.pcs)
+        return [TraceEntry(first + i, *entry) for i, entry in enumerate(zip(self.pcs.tolist(), self.opcodes.tolist(), self.addrs.tolist(), self.values.tolist()))]
+
+    def save(self, file: str):
+        with open(file, 'wb') as f:
+            numpy.savez_compressed(
+                f,
+                version=numpy.array(TRACE_VERSION),
+                code_hash=numpy.array(self.code_hash, dtype=numpy.int64),
+                count=numpy.array(self.count, dtype=numpy.int64),
+                pcs=self.pcs.astype(numpy.int16),  # Instruction addresses fit in 16 bits
+                opcodes=self.opcodes.astype(numpy.int8),
+                addrs=self.addrs,
+                values=self.values
+            )
+
+    @staticmethod
+    def load(file: str) -> 'Trace':
+        with numpy.load(file) as data:
+            if int(data['version']) != TRACE_VERSION:
+                raise ValueError('Unsupported trace version %d in %s' % (int(data['version']), file))
+            return Trace(int(data['code_hash']), int(data['count']), data['pcs'].astype(numpy.int32), data['opcodes'].astype(numpy.int32), data['addrs'], data['values'])
+
+    def format(self, entries: Sequence[TraceEntry], dis: Optional[Disassembler] = None) -> List[str]:
+        """ One line per entry, with the disassembled instruction, if given the program, and the memory written """
+        lines = []
+        for entry in entries:
+            inst = dis.decode_line(entry.pc) if dis is not None and 0 <= entry.pc < len(dis.code) else '%04d' % entry.pc
+            write = ''
+            if entry.addr != NO_WRITE:
+                write = '%s <- %d' % (disassembler.address_name(entry.addr, dis.memory_table if dis is not None else None), entry.value)
+            lines.append(('%10d | %-60s | %s' % (entry.index, inst, write)).rstrip())
+        return lines
+
+
+def code_hash(code: Sequence[Optional[int]]) -> int:
+    return zlib.crc32(numpy.array([c for c in code if c is not None], dtype='<u8').tobytes())
+
+
+if __name__ == '__main__':
+    main(read_command_line_args())
@@ -0,0 +1,208 @@
+# This is a headless farm for running many instances of a single ProcessorV5 program, i.e. for fuzzing game logic
+# Each job runs the program with its own random seed and control port input script, and reports how the program stopped, and its final screen
+
+from typing import List, Tuple, Optional, Sequence, NamedTuple, Callable, Any
+from multiprocessing import get_context, get_all_start_methods
+
+from assembler import Assembler
+from processor import Processor, ProcessorError, ProcessorEvent, ProgramImage, IRData, ImageBuffer, decode_ir
+from recording import Recording, ScriptedControlDevice, frame_hash
+
+import gc
+import os
+import sys
+import json
+import utils
+import argparse
+import constants
+
+
+PORT_NAMES = {
+    'x': constants.CONTROL_PORT_X - constants.CONTROL_PORT,
+    'up': constants.CONTROL_PORT_UP - constants.CONTROL_PORT,
+    'down': constants.CONTROL_PORT_DOWN - constants.CONTROL_PORT,
+    'left': constants.CONTROL_PORT_LEFT - constants.CONTROL_PORT,
+    'right': constants.CONTROL_PORT_RIGHT - constants.CONTROL_PORT,
+}
+
+BATCH_TICKS = 1000
+
+
+def read_command_line_args():
+    parser = argparse.ArgumentParser(description='Headless farm for running many instances of a Factorio ProcessorV5 program')
+
+    parser.add_argument('file', type=str, help='The assembly file to be run')
+
+    parser.add_argument('--ea', action='store_true', dest='enable_assertions', default=False, help='Enable assert instructions')
+    parser.add_argument('--opt', action='store_true', dest='enable_optimizations', default=False, help='Enable the optimizer')
+    parser.add_argument('--alloc', action='store_true', dest='enable_allocation', default=False, help='Enable the word allocator')
+
+    parser.add_argument('--seeds', type=int, default=1, help='Run each input script with this many random seeds, from 0')
+    parser.add_argument('--inputs', type=str, nargs='*', default=(), help='Control port input scripts, either recordings (.rec) or text files of \'<tick> <x|up|down|left|right> <value>\' lines. Without any, the program runs with no input')
+    parser.add_argument('--ticks', type=int, default=1_000_000, help='Stop each job after running this many instructions')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='The number of worker processes')
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this file, as JSON')
+
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    asm = Assembler(args.file, utils.read_file(args.file), args.enable_assertions, enable_optimizations=args.enable_optimizations, enable_allocation=args.enable_allocation)
+    if not asm.assemble():
+        print(asm.error)
+        sys.exit(1)
+
+    scripts = [(os.path.basename(file), load_inputs(file)) for file in args.inputs] or [('none', ())]
+    jobs = [FarmJob(name, seed, inputs) for name, inputs in scripts for seed in range(args.seeds)]
+    results = run_farm(ProgramImage.create(asm.code, asm.sprites, asm.print_table), jobs, args.workers, args.ticks)
+
+    for result in results:
+        print(result.format())
+    reasons = {reason: sum(r.reason == reason for r in results) for reason in sorted({r.reason for r in results})}
+    print('Ran %d jobs: %s' % (len(results), ', '.join('%d %s' % (count, reason) for reason, count in reasons.items())))
+
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump([result._asdict() for result in results], f, indent=2)
+    if any(result.error is not None for result in results):
+        sys.exit(1)
+
+
+class FarmJob(NamedTuple):
+    name: str
+    seed: int
+    inputs: Sequence[Tuple[int, int, int]]  # (tick, control port index, value) input changes, in tick order
+
+
+class FarmResult(NamedTuple):
+    name: str
+    seed: int
+    reason: str  # 'halt', 'error', or 'timeout' if the tick limit was reached
+    error: Optional[str]  # The processor error, including any failed assertion
+    ticks: int
+    frames: int
+    screen_hash: int  # Hash of the last flushed screen, or zero if none were flushed
+
+    def format(self) -> str:
+        return '%s seed=%d %s ticks=%d frames=%d screen=%08x%s' % (self.name, self.seed, self.reason, self.ticks, self.frames, self.screen_hash, ': ' + self.error if self.error is not None else '')
+
+
+class FarmProgram:
+    """
+    An assembled program, with its instructions decoded ahead of time.
+    This is created once, in the parent process. Forked workers share it copy-on-write, and never modify it.
+    """
+
+    def __init__(self, image: ProgramImage):
+        template = image.processor()
+        self.instructions = template.instructions
+        self.sprites = template.sprites
+        self.print_table = template.print_table
+        self.rom: List[Optional[IRData]] = [decode_ir(inst) if inst is not None else None for inst in self.instructions]
+
+    def processor(self, seed: int) -> Processor:
+        proc = Processor(random_seed=seed)
+        proc.instructions = self.instructions
+        proc.sprites = self.sprites
+        proc.print_table = self.print_table
+        proc.decode = self.decoder(proc)
+        proc.decode_overridden = True
+        return proc
+
+    def decoder(self, proc: Processor) -> Callable[[], IRData]:
+        rom, decode = self.rom, proc.decode
+        def predecoded() -> IRData:
+            if 0 <= proc.pc < len(rom) and (ir := rom[proc.pc]) is not None:
+                return ir
+            return decode()  # Raises the appropriate error
+        return predecoded
+
+
+# The program shared by all workers. In forked workers, this is inherited from the parent
+FARM_PROGRAM: Optional[FarmProgram] = None
+
+
+def run_farm(image: ProgramImage, jobs: Sequence[FarmJob], workers: int, max_ticks: int) -> List[FarmResult]:
+    """ Runs all jobs, returning their results in the same order """
+    global FARM_PROGRAM
+    if workers <= 1:
+        FARM_PROGRAM = FarmProgram(image)
+        return [run_job(job, max_ticks) for job in jobs]
+
+    args = [(job, max_ticks) for job in jobs]
+    if 'fork' in get_all_start_methods():
+        FARM_PROGRAM = FarmProgram(image)
+        gc.freeze()  # Keeps the collector from touching, and so copying, the shared program in each worker
+        try:
+            with get_context('fork').Pool(workers) as pool:
+                return pool.starmap(run_job, args)
+        finally:
+            gc.unfreeze()
+
+    with get_context('spawn').Pool(workers, initializer=init_worker, initargs=(image,)) as pool:
+        return pool.starmap(run_job, args)
+
+
+def init_worker(image: ProgramImage):
+    global FARM_PROGRAM
+    FARM_PROGRAM = FarmProgram(image)
+
+
+def run_job(job: FarmJob, max_ticks: int) -> FarmResult:
+    assert FARM_PROGRAM is not None
+    proc = FARM_PROGRAM.processor(job.seed)
+    proc.devices.append(ScriptedControlDevice(proc, job.inputs))
+    events = FarmEventHandle()
+    proc.event_handle = events
+
+    for device in proc.devices:
+        device.start()
+    ticks, error = 0, None
+    proc.running = True
+    try:
+        while proc.running and ticks < max_ticks:
+            for _ in range(min(BATCH_TICKS, max_ticks - ticks)):
+                proc.tick()
+                ticks += 1
+                if not proc.running:
+                    break
+    except ProcessorError as e:
+        error = str(e)
+
+    reason = 'error' if error is not None else 'halt' if not proc.running else 'timeout'
+    return FarmResult(job.name, job.seed, reason, error, ticks, events.frames, events.screen_hash)
+
+
+class FarmEventHandle:
+
+    def __init__(self):
+        self.frames = 0
+        self.screen: Optional[ImageBuffer] = None
+
+    def __call__(self, proc: Processor, event_type: ProcessorEvent, arg: Any):
+        if event_type == ProcessorEvent.GFLUSH:
+            self.frames += 1
+            self.screen = arg
+
+    @property
+    def screen_hash(self) -> int:
+        return frame_hash(self.screen) if self.screen is not None else 0
+
+
+def load_inputs(file: str) -> List[Tuple[int, int, int]]:
+    if file.endswith('.rec'):
+        return Recording.load(file).inputs
+
+    inputs = []
+    for line_number, line in enumerate(utils.read_file(file).split('\n')):
+        if line := line.split('#')[0].strip():
+            try:
+                tick, port, value = line.split()
+                inputs.append((int(tick), PORT_NAMES[port.lower()], int(value)))
+            except (ValueError, KeyError):
+                raise ValueError('Invalid input script line %d in %s: \'%s\'' % (1 + line_number, file, line))
+    return sorted(inputs, key=lambda i: i[0])
+
+
+if __name__ == '__main__':
+    main(read_command_line_args())
@@ -1,3 +1,5 @@
 from phases.scanner import Scanner
 from phases.parser import Parser
 from phases.codegen import CodeGen
+from phases.optimizer import Optimizer
+from phases.allocator import Allocator
@@ -0,0 +1,156 @@
+from typing import List, Dict, Set
+from phases.parser import Parser, ParseToken
+from phases.optimizer import Instruction, split_instructions, destination, sources, label_of, is_constant, is_branch, is_call, is_unconditional_branch
+
+import constants
+
+
+class Allocator:
+    """
+    Word allocation phase, which overlaps scalar words that are never live at the same time.
+    This operates on the output of a first parse, and computes a layout of all words, which is then used to re-parse the program.
+
+    Words are only considered for sharing an address if they are scalar, their address is never taken (used as an immediate, or indexed), and they are both read and written directly by name.
+    Any other word is assumed to possibly be accessed indirectly, and keeps its own address, in declaration order.
+    """
+
+    def __init__(self, parser: Parser):
+        self.parser = parser
+        self.instructions, _ = split_instructions(parser.output_tokens)
+        self.words: Dict[str, int] = parser.words  # Word -> size, in declaration order
+        self.original: Dict[str, int] = {word: parser.aliases[word] for word in self.words}  # Word -> address from the first parse
+        self.layout: Dict[str, int] = {}  # Word -> allocated address
+        self.interference: Dict[int, Set[int]] = {}  # Address -> addresses of words live at the same time
+
+    def allocate(self):
+        candidates = self.candidates()
+        self.interference = {address: set() for address in candidates}
+        for i, live in enumerate(self.liveness(candidates)):
+            dest = destination(self.instructions[i])
+            if dest is not None and dest[1] in candidates and is_constant(dest):
+                for other in live:
+                    if other != dest[1]:
+                        self.interference[dest[1]].add(other)
+                        self.interference[other].add(dest[1])
+
+        # Greedy coloring in declaration order. Each color is a single shared address
+        colors: Dict[int, int] = {}  # Address -> color
+        color_addresses: Dict[int, int] = {}  # Color -> allocated address
+        word_count = constants.FIRST_GENERAL_MEMORY_ADDRESS
+        for word, size in self.words.items():
+            address = self.original[word]
+            if address in candidates:
+                used = {colors[other] for other in self.interference[address] if other in colors}
+                color = next(c for c in range(len(colors) + 1) if c not in used)
+                colors[address] = color
+                if color not in color_addresses:
+                    color_addresses[color] = word_count
+                    word_count += 1
+                self.layout[word] = color_addresses[color]
+            else:
+                self.layout[word] = word_count
+                word_count += size
+
+    def candidates(self) -> Set[int]:
+        reads, writes = set(), set()
+        for inst in self.instructions:
+            dest = destination(inst)
+            if dest is not None and is_constant(dest):
+                writes.add(dest[1])
+            reads |= uses(inst)
+        return {self.original[word] for word, size in self.words.items() if size == 1 and word not in self.parser.address_taken and self.original[word] in reads and self.original[word] in writes}
+
+    def liveness(self, candidates: Set[int]) -> List[Set[int]]:
+        """ Computes the set of candidate words live after each instruction, over the whole program """
+        count = len(self.instructions)
+        return_sites = self.return_sites()
+        successors: List[List[int]] = [self.successors(i, return_sites.get(i, [])) for i in range(count)]
+        predecessors: List[List[int]] = [[] for _ in range(count)]
+        for i, targets in enumerate(successors):
+            for j in targets:
+                predecessors[j].append(i)
+
+        use = [uses(inst) & candidates for inst in self.instructions]
+        kill = [{dest[1]} if (dest := destination(inst)) is not None and is_constant(dest) else set() for inst in self.instructions]
+        live_in: List[Set[int]] = [set() for _ in range(count)]
+        live_out: List[Set[int]] = [set() for _ in range(count)]
+
+        queue, queued = list(range(count)), set(range(count))
+        while queue:
+            i = queue.pop()
+            queued.discard(i)
+            live_out[i] = set().union(*(live_in[j] for j in successors[i]))
+            new_in = use[i] | (live_out[i] - kill[i])
+            if new_in != live_in[i]:
+                live_in[i] = new_in
+                for j in predecessors[i]:
+                    if j not in queued:
+                        queued.add(j)
+                        queue.append(j)
+        return live_out
+
+    def return_sites(self) -> Dict[int, List[int]]:
+        """
+        Maps each 'ret' to the instructions it may return to, which are the sites of all calls to a routine containing that 'ret'.
+        The extent of a routine is all code reachable from its label, without entering any nested calls.
+        """
+        rets: Dict[int, Set[int]] = {}  # Call target -> 'ret' instructions reachable from the target
+        result: Dict[int, List[int]] = {}
+        for i, inst in enumerate(self.instructions):
+            if is_call(inst) and i + 1 < len(self.instructions):
+                target = self.parser.labels[label_of(inst)]
+                if target not in rets:
+                    rets[target] = set()
+                    seen, queue = set(), [target]
+                    while queue:
+                        j = queue.pop()
+                        if j in seen or not 0 <= j < len(self.instructions):
+                            continue
+                        seen.add(j)
+                        if is_ret(self.instructions[j]):
+                            rets[target].add(j)
+                        elif is_call(self.instructions[j]):
+                            queue.append(j + 1)  # Assume nested calls return
+                        else:
+                            queue.extend(self.successors(j, []))
+                for ret in rets[target]:
+                    result.setdefault(ret, []).append(i + 1)
+        return result
+
+    def successors(self, i: int, return_sites: List[int]) -> List[int]:
+        inst = self.instructions[i]
+        if ParseToken.TYPE_E.equals(inst[0]) and ParseToken.HALT.equals(inst[1]):
+            targets = []
+        elif is_ret(inst):
+            targets = return_sites
+        elif is_unconditional_branch(inst) or is_call(inst):
+            # Calls continue at the return site via the 'ret' of the called routine
+            targets = [self.parser.labels[label_of(inst)]]
+        elif is_branch(inst):
+            targets = [self.parser.labels[label_of(inst)], i + 1]
+        else:
+            targets = [i + 1]
+        return [j for j in targets if 0 <= j < len(self.instructions)]
+
+    def report(self) -> str:
+        before = sum(self.words.values())
+        after = sum(size for _, size in {(self.layout[word], size) for word, size in self.words.items()})
+        return 'Allocated %d -> %d words (saved %d)' % (before, after, before - after)
+
+    def memory_map(self) -> List[str]:
+        """ Lines of a memory map, in the same format as the Factorio memory map, showing the allocated and original address of each word """
+        format_string = '%04d | %-' + str(1 + max((len(word) for word in self.words), default=3)) + 's | %04d\n'
+        return [format_string % (self.layout[word], word, self.original[word]) for word in sorted(self.words, key=lambda w: (self.layout[w], self.original[w]))]
+
+
+def is_ret(inst: Instruction) -> bool:
+    return ParseToken.TYPE_E.equals(inst[0]) and ParseToken.RET.equals(inst[1])
+
+
+def uses(inst: Instruction) -> Set[int]:
+    """ The addresses read by an instruction. This includes the base address of any indirect operand, including the destination. """
+    result = {address[1] for address in sources(inst)}
+    dest = destination(inst)
+    if dest is not None and not is_constant(dest):
+        result.add(dest[1])
+    return result
@@ -0,0 +1,283 @@
+from typing import List, Dict, Tuple, Set, Optional, Sequence, Callable
+from phases.parser import Parser, ParseToken
+
+
+Address = Tuple['Parser.Token', ...]  # (ADDRESS_CONSTANT, addr) or (ADDRESS_INDIRECT, addr, offset)
+Instruction = List['Parser.Token']  # The tokens of a single instruction, starting with the instruction type
+
+R0: Address = Parser.R0
+
+
+class Optimizer:
+    """
+    Optimization phase, which operates on the output tokens of the parser, before code generation.
+    Instructions are removed or re-targeted, and the parser's labels are adjusted to match, so code generation computes correct branch offsets.
+    """
+
+    def __init__(self, parser: Parser):
+        self.parser = parser
+        self.instructions, self.tail = split_instructions(parser.output_tokens)
+        self.input_count = len(self.instructions)
+        self.stats: Dict[str, int] = {}
+
+    def optimize(self):
+        """ Runs all rules until no rule makes any further change """
+        changed = True
+        while changed:
+            changed = False
+            for name, rule in (
+                ('Unreachable code', self.remove_unreachable),
+                ('Jump to next', self.remove_jump_to_next),
+                ('Identity or discarded result', self.remove_identity),
+                ('Overwritten store', self.remove_overwritten_store),
+                ('Branch chain', self.retarget_branch_chains)
+            ):
+                count = rule()
+                if count > 0:
+                    self.stats[name] = self.stats.get(name, 0) + count
+                    changed = True
+        self.commit()
+
+    def commit(self):
+        """ Writes the optimized instructions back to the parser """
+        self.parser.output_tokens = [t for inst in self.instructions for t in inst] + self.tail
+        self.parser.code_point = len(self.instructions)
+
+    def report(self) -> str:
+        lines = ['Optimized %d -> %d instructions (saved %d)' % (self.input_count, len(self.instructions), self.input_count - len(self.instructions))]
+        for name, count in self.stats.items():
+            lines.append('  %s: %d' % (name, count))
+        return '\n'.join(lines)
+
+    def remove_unreachable(self) -> int:
+        """
+        Whole program reachability analysis, starting from the entry point, following branches, and calls to both their target and return site.
+        This removes unused routines (i.e. from an included library), and the code of inline functions only expanded in unreachable code.
+        Labels pointing to removed code are deleted, and print statements are removed from the print table.
+        """
+        reachable = set()
+        queue = [0] if self.instructions else []
+        while queue:
+            i = queue.pop()
+            if i not in reachable:
+                reachable.add(i)
+                queue.extend(j for j in self.successors(i) if j not in reachable)
+        return self.remove({i for i in range(len(self.instructions)) if i not in reachable}, keep_labels=False)
+
+    def successors(self, i: int) -> List[int]:
+        """ All possible next instructions, within the program. The successors of a 'call' include the return site, and 'ret' has none. """
+        inst = self.instructions[i]
+        if ParseToken.TYPE_E.equals(inst[0]) and (ParseToken.HALT.equals(inst[1]) or ParseToken.RET.equals(inst[1])):
+            targets = []
+        elif is_unconditional_branch(inst):
+            targets = [self.target(inst)]
+        elif is_branch(inst) or is_call(inst):
+            targets = [self.target(inst), i + 1]
+        else:
+            targets = [i + 1]
+        return [j for j in targets if 0 <= j < len(self.instructions)]
+
+    def remove_jump_to_next(self) -> int:
+        # A branch to the immediately following instruction does nothing, as long as evaluating the operands has no side effects
+        initialized = self.initialized()
+        return self.remove_where(lambda i, inst: is_branch(inst) and self.target(inst) == i + 1 and all(is_constant(a) for a in addresses(inst)) and reads_initialized(inst, initialized[i]))
+
+    def remove_identity(self) -> int:
+        initialized = self.initialized()
+        return self.remove_where(lambda i, inst: is_identity(inst) and reads_initialized(inst, initialized[i]))
+
+    def remove_overwritten_store(self) -> int:
+        # A store which is unconditionally overwritten by the next instruction, without being read, can be removed
+        initialized = self.initialized()
+
+        def overwritten(i: int, inst: Instruction) -> bool:
+            if i + 1 >= len(self.instructions):
+                return False
+            dest = destination(inst)
+            if dest is None or dest == R0 or not all(is_constant(a) for a in addresses(inst)):
+                return False
+            after = self.instructions[i + 1]
+            return destination(after) == dest and all(is_constant(a) and a != dest for a in sources(after)) and reads_initialized(inst, initialized[i])
+        return self.remove_where(overwritten)
+
+    def retarget_branch_chains(self) -> int:
+        # A branch (or call) to an unconditional branch can instead branch directly to the final target
+        # Skipping a branch also skips its reads, so only branches which cannot fault on reading uninitialized memory are skipped
+        initialized = self.initialized()
+        count = 0
+        for inst in self.instructions:
+            if is_branch(inst) or is_call(inst):
+                label, seen = label_of(inst), set()
+                target = self.parser.labels[label]
+                while 0 <= target < len(self.instructions) and is_unconditional_branch(self.instructions[target]) and reads_initialized(self.instructions[target], initialized[target]) and label not in seen:
+                    seen.add(label)
+                    label = label_of(self.instructions[target])
+                    target = self.parser.labels[label]
+                if label != label_of(inst) and label not in seen:
+                    set_label(inst, label)
+                    count += 1
+        return count
+
+    def initialized(self) -> List[Set[Address]]:
+        """
+        For each instruction, the constant addresses which are written on every path from the entry point to it, and so are known to be initialized when it executes.
+        Removing an instruction also removes its reads, so an instruction is only removed if it cannot fault on reading uninitialized memory.
+        Indirect writes are ignored, and a call is assumed to write nothing before its return site, so this may miss addresses which are initialized, but never includes one which is not.
+        """
+        initialized: List[Optional[Set[Address]]] = [None] * len(self.instructions)
+        queue = [0] if self.instructions else []
+        if queue:
+            initialized[0] = set()
+        while queue:
+            i = queue.pop()
+            written = set(initialized[i] or ())
+            if (dest := destination(self.instructions[i])) is not None and is_constant(dest):
+                written.add(dest)
+            for j in self.successors(i):
+                before = initialized[j]
+                initialized[j] = written if before is None else before & written
+                if initialized[j] != before:
+                    queue.append(j)
+        return [s if s is not None else set() for s in initialized]
+
+    def target(self, inst: Instruction) -> int:
+        return self.parser.labels[label_of(inst)]
+
+    def remove_where(self, predicate: Callable[[int, Instruction], bool]) -> int:
+        return self.remove({i for i, inst in enumerate(self.instructions) if predicate(i, inst)})
+
+    def remove(self, removed: Set[int], keep_labels: bool = True) -> int:
+        """
+        Removes the instructions at the given indices, and relocates all labels.
+        Labels pointing to a removed instruction will point to the next remaining instruction, or if keep_labels is False, will be deleted.
+        """
+        if not removed:
+            return 0
+        relocation, count = [], 0
+        for i in range(len(self.instructions) + 1):
+            relocation.append(count)
+            if i not in removed:
+                count += 1
+        for label, code_point in list(self.parser.labels.items()):
+            if not keep_labels and code_point in removed:
+                del self.parser.labels[label]
+            else:
+                self.parser.labels[label] = relocation[code_point]
+        self.instructions = [inst for i, inst in enumerate(self.instructions) if i not in removed]
+        return len(removed)
+
+
+def split_instructions(tokens: Sequence['Parser.Token']) -> Tuple[List[Instruction], List['Parser.Token']]:
+    """ Splits a parser output token stream into a list of instructions, and the trailing (non-instruction) tokens """
+    instructions: List[Instruction] = []
+    tail: List['Parser.Token'] = []
+    for t in tokens:
+        if isinstance(t, ParseToken) and t in Parser.INSTRUCTION_TYPES:
+            instructions.append([t])
+        elif ParseToken.EOF.equals(t) or ParseToken.ERROR.equals(t) or tail:
+            tail.append(t)
+        else:
+            instructions[-1].append(t)
+    return instructions, tail
+
+
+def addresses(inst: Instruction) -> List[Address]:
+    """ All memory operands of an instruction, in token order """
+    result = []
+    i = 1
+    while i < len(inst):
+        t = inst[i]
+        if ParseToken.ADDRESS_CONSTANT.equals(t):
+            result.append((t, inst[i + 1]))
+            i += 2
+        elif ParseToken.ADDRESS_INDIRECT.equals(t):
+            result.append((t, inst[i + 1], inst[i + 2]))
+            i += 3
+        elif ParseToken.IMMEDIATE_26.equals(t) or ParseToken.LABEL.equals(t):
+            i += 2
+        else:
+            i += 1
+    return result
+
+
+def destination(inst: Instruction) -> Optional[Address]:
+    """ The memory operand written by an arithmetic instruction """
+    if ParseToken.TYPE_A.equals(inst[0]) or ParseToken.TYPE_B.equals(inst[0]):
+        return addresses(inst)[0]
+    return None
+
+
+def sources(inst: Instruction) -> List[Address]:
+    """ The memory operands read by an instruction. Note that indirect destinations also read their base address. """
+    if destination(inst) is not None:
+        return addresses(inst)[1:]
+    return addresses(inst)
+
+
+def immediate(inst: Instruction) -> Optional[int]:
+    for i, t in enumerate(inst):
+        if ParseToken.IMMEDIATE_26.equals(t):
+            return inst[i + 1]
+    return None
+
+
+def label_of(inst: Instruction) -> Optional[str]:
+    for i, t in enumerate(inst):
+        if ParseToken.LABEL.equals(t):
+            return inst[i + 1]
+    return None
+
+
+def set_label(inst: Instruction, label: str):
+    for i, t in enumerate(inst):
+        if ParseToken.LABEL.equals(t):
+            inst[i + 1] = label
+
+
+def is_constant(address: Address) -> bool:
+    # Constant addresses can only reference main memory (and r0), so reading from them never has side effects on devices
+    return ParseToken.ADDRESS_CONSTANT.equals(address[0])
+
+
+def is_branch(inst: Instruction) -> bool:
+    return ParseToken.TYPE_C.equals(inst[0]) or ParseToken.TYPE_D.equals(inst[0])
+
+
+def is_call(inst: Instruction) -> bool:
+    return ParseToken.TYPE_E.equals(inst[0]) and ParseToken.CALL.equals(inst[1])
+
+
+def reads_initialized(inst: Instruction, initialized: Set[Address]) -> bool:
+    return all(a == R0 or a in initialized for a in sources(inst))
+
+
+def is_unconditional_branch(inst: Instruction) -> bool:
+    # i.e. 'br', or any 'beq X X' / 'ble X X' comparing a constant address against itself
+    if ParseToken.TYPE_C.equals(inst[0]) and (ParseToken.BEQ.equals(inst[1]) or ParseToken.BLE.equals(inst[1])):
+        p1, p2 = addresses(inst)
+        return p1 == p2 and is_constant(p1)
+    return False
+
+
+IDENTITY_TYPE_A = {ParseToken.ADD, ParseToken.SUB, ParseToken.OR, ParseToken.XOR, ParseToken.LS, ParseToken.RS}  # Y op r0 = Y
+IDENTITY_TYPE_A_COMMUTATIVE = {ParseToken.ADD, ParseToken.OR, ParseToken.XOR}  # r0 op Z = Z
+IDENTITY_TYPE_B = {
+    ParseToken.ADDI: 0, ParseToken.ORI: 0, ParseToken.XORI: 0, ParseToken.LSI: 0, ParseToken.RSI: 0,
+    ParseToken.MULI: 1, ParseToken.DIVI: 1, ParseToken.POWI: 1
+}
+
+
+def is_identity(inst: Instruction) -> bool:
+    """ Instructions that are guaranteed to not modify memory, i.e. 'addi X X 0', or instructions that write to r0 """
+    dest = destination(inst)
+    if dest is None or not all(is_constant(a) for a in addresses(inst)):
+        return False
+    if dest == R0:
+        return True  # Writes to r0 are discarded
+    opcode = inst[1]
+    if ParseToken.TYPE_A.equals(inst[0]):
+        _, y, z = addresses(inst)
+        return (opcode in IDENTITY_TYPE_A and y == dest and z == R0) or (opcode in IDENTITY_TYPE_A_COMMUTATIVE and z == dest and y == R0)
+    else:
+        _, y = addresses(inst)
+        return opcode in IDENTITY_TYPE_B and y == dest and immediate(inst) == IDENTITY_TYPE_B[opcode]
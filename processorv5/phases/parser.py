@@ -1,5 +1,5 @@
 from enum import IntEnum
-from typing import Tuple, List, Dict, Sequence, Optional, Union, Any, Callable, Iterable
+from typing import Tuple, List, Dict, Set, Sequence, Optional, Union, Any, Callable, Iterable
 from utils import Interval, TextureHelper
 from constants import Opcodes, Instructions, Registers, GPUInstruction, GPUFunction, GPUImageDecoder
 from phases.scanner import Scanner, ScanToken
@@ -313,6 +313,7 @@ class Parser:
     Token = Union[ParseToken, ParseError, GPUInstruction, GPUFunction, int, str]
 
     ADDRESS: Interval = utils.interval_bitfield(10, False)
+    ADDRESS_OVERFLOW: Interval = utils.interval_bitfield(16, False)
     OFFSET: Interval = utils.interval_bitfield(5, True)
     IMMEDIATE_SIGNED: Interval = utils.interval_bitfield(26, True)
     IMMEDIATE_UNSIGNED: Interval = utils.interval_bitfield(26, False)
@@ -322,7 +323,7 @@ class Parser:
 
     R0 = ParseToken.ADDRESS_CONSTANT, 0
 
-    def __init__(self, tokens: List['Scanner.Token'], file: str = None, enable_assertions: bool = False, enable_print: bool = False):
+    def __init__(self, tokens: List['Scanner.Token'], file: str = None, enable_assertions: bool = False, enable_print: bool = False, scanners: Optional[Dict[str, Scanner]] = None, word_layout: Optional[Dict[str, int]] = None, allow_memory_overflow: bool = False):
         self.input_tokens: List['Scanner.Token'] = tokens
         self.output_tokens: List['Parser.Token'] = []
         self.pointer: int = 0
@@ -330,9 +331,14 @@ class Parser:
         self.file: str = utils.unique_path(file)
         self.root: str = os.path.dirname(self.file)
         self.includes = {self.file}
+        self.scanners: Optional[Dict[str, Scanner]] = scanners  # Pre-scanned included files, by unique path
 
         self.code_point: int = 0  # Increment at start of instruction outputs
         self.word_count: int = constants.FIRST_GENERAL_MEMORY_ADDRESS  # Increment when a word (undefined memory address) is referenced.
+        self.word_layout: Optional[Dict[str, int]] = word_layout  # Pre-computed word addresses, from the allocator, used instead of allocating words in order
+        self.allow_memory_overflow = allow_memory_overflow  # Allow words past the end of main memory, for analysis by the allocator
+        self.words: Dict[str, int] = {}  # 'word' statements, and their size
+        self.address_taken: Set[str] = set()  # Words which are referenced other than as a direct address, i.e. as an immediate, or with an index
         self.labels: Dict[str, int] = {}  # 'foo: ' statements
         self.undefined_labels: Dict[str, ParseError] = {}  # labels that have been referenced by an instruction but not defined yet, and the error referencing their first definition
         self.aliases: Dict[str, int] = {}  # 'alias' statements
@@ -513,20 +519,23 @@ class Parser:
             c = self.next()
 
     def parse_single_word_with_size(self, size: int):
-        if self.word_count + size - 1 >= constants.MAIN_MEMORY_SIZE:
-            self.err('Memory overflow! Tried to allocate %d bytes' % (size * 4))
-
         self.expect(ScanToken.IDENTIFIER, 'Expected identifier after \'word\' keyword')
         word = self.next()
         if word in self.aliases:
             self.err('Duplicate definition for: ' + repr(word))
+        value = self.word_count if self.word_layout is None else self.word_layout[word]
+        if value + size - 1 >= constants.MAIN_MEMORY_SIZE and not self.allow_memory_overflow:
+            self.err('Memory overflow! Tried to allocate %d bytes' % (size * 4))
+
         self.pointer += 1
-        value = self.word_count
-        self.word_count += size
+        self.word_count = max(self.word_count, value + size)
         self.aliases[word] = value
+        self.words[word] = size
         if size > 1:
             for offset in range(size):
                 self.memory_table[value + offset] = '%s[%d]' % (word, offset)
+        elif value in self.memory_table:
+            self.memory_table[value] += '/' + word  # Words sharing an address, from the allocator
         else:
             self.memory_table[value] = word
 
@@ -546,22 +555,30 @@ class Parser:
         file = utils.unique_path(os.path.join(self.root, ref))
         if file not in self.includes:  # Silently allow recursive includes
             self.includes.add(file)
-            try:
-                text = utils.read_file(file)
-            except Exception as e:
-                return self.err('%s\nReading file referenced from \'include "%s"\'' % (e, ref))
+            if self.scanners is not None and file in self.scanners:
+                scanner = self.scanners[file]
+            else:
+                try:
+                    text = utils.read_file(file)
+                except Exception as e:
+                    return self.err('%s\nReading file referenced from \'include "%s"\'' % (e, ref))
+
+                scanner = Scanner(text)
+                scanner.scan()
 
-            scanner = Scanner(text)
-            if not scanner.scan():
+            if scanner.error is not None:
                 return self.err('%s\nIn file \'%s\', referenced from \'include "%s"\'' % (scanner.error, file, ref))
 
             # Link sub-parser's output to this parser
-            parser = Parser(scanner.output_tokens, file, self.enable_assertions, self.enable_print)
+            parser = Parser(scanner.output_tokens, file, self.enable_assertions, self.enable_print, self.scanners, self.word_layout, self.allow_memory_overflow)
             parser.output_tokens = self.output_tokens
+            parser.code_point = self.code_point
             parser.word_count = self.word_count
             parser.memory_table = self.memory_table
             parser.labels = self.labels
             parser.aliases = self.aliases
+            parser.words = self.words
+            parser.address_taken = self.address_taken
             parser.sprites = self.sprites
             parser.includes = self.includes
             parser.inline_functions = self.inline_functions
@@ -575,6 +592,10 @@ class Parser:
             if parser.output_tokens[-1] != ParseToken.EOF:
                 return self.err('Parser terminated too early!\nIn file \'%s\', referenced from \'include "%s"\n' % (file, ref))
             parser.output_tokens.pop()
+
+            # Code and memory from the included file precede anything following the include
+            self.code_point = parser.code_point
+            self.word_count = parser.word_count
         self.pointer += 1
 
     def parse_sprite(self):
@@ -730,7 +751,7 @@ class Parser:
         return 0
 
     def parse_address_base(self) -> int:
-        return self.parse_literal_or_named_constant(Parser.ADDRESS)
+        return self.parse_literal_or_named_constant(Parser.ADDRESS_OVERFLOW if self.allow_memory_overflow else Parser.ADDRESS)
 
     def parse_address_offset(self) -> int:
         return self.parse_literal_or_named_constant(Parser.OFFSET)
@@ -753,11 +774,15 @@ class Parser:
                 self.err('Undefined alias \'%s\'%s' % (alias, self.hint(alias, self.aliases.keys())))
             self.pointer += 1
             value = self.aliases[alias]
+            if alias in self.words and interval is not Parser.ADDRESS and interval is not Parser.ADDRESS_OVERFLOW:
+                self.address_taken.add(alias)
 
             # Identifiers can all have optional array index declarations following them
             # This is to support word and sprite arrays, when using constant indexes
             t = self.next()
             if t == ScanToken.LBRACKET:
+                if alias in self.words:
+                    self.address_taken.add(alias)
                 self.pointer += 1
                 self.expect(ScanToken.INTEGER, 'Expected integer offset after \'[\'')
                 value += self.take()
@@ -851,35 +876,33 @@ class InlineFunctionParserExit(Exception):
 class InlineFunctionParser(Parser):
 
     def __init__(self, parent: Parser):
-        super().__init__(parent.input_tokens, parent.file, parent.enable_assertions, parent.enable_print)
+        super().__init__(parent.input_tokens, parent.file, parent.enable_assertions, parent.enable_print, parent.scanners, parent.word_layout, parent.allow_memory_overflow)
         self.includes = parent.includes
         self.word_count = parent.word_count
         self.memory_table = parent.memory_table
         self.aliases = parent.aliases
+        self.words = parent.words
+        self.address_taken = parent.address_taken
         self.sprites = parent.sprites
         self.inline_functions = parent.inline_functions
 
-        self.origin = parent.code_point
         self.invocation_count = 0
+        self.label_holes: List[int] = []  # Indices of label names in the output tokens, which are suffixed for each invocation
 
     def feed(self, parent: Parser):
-        # Output the contents of the inline function
+        # Output the contents of the inline function, which has been parsed once into a template of output tokens
         # Edit all labels to be suffixed with the invocation index of this inline function
-        # Output all labels, adjusted for the new output location's code point
+        # Output all labels, relative to the new output location's code point
         parent_origin = parent.code_point
-        label = False
-        for token in self.output_tokens:
-            if ParseToken.LABEL.equals(token):
-                label = True
-                parent.push(token)
-            elif label:
-                label = False
-                parent.push(token + '[%d]' % self.invocation_count)
-            else:
-                parent.push(token)
+        suffix = '[%d]' % self.invocation_count
+        tokens = list(self.output_tokens)
+        for i in self.label_holes:
+            tokens[i] += suffix
+        parent.output_tokens += tokens
+        parent.code_point += self.code_point
 
         for label, code_point in self.labels.items():
-            parent.labels[label + '[%d]' % self.invocation_count] = parent_origin - self.origin + code_point
+            parent.labels[label + suffix] = parent_origin + code_point
 
         self.invocation_count += 1
 
@@ -895,6 +918,8 @@ class InlineFunctionParser(Parser):
         for label, err in self.undefined_labels.items():
             raise err
 
+        self.label_holes = [i + 1 for i, token in enumerate(self.output_tokens) if ParseToken.LABEL.equals(token)]
+
     def parse_inline_label(self):
         self.err('Illegal reference to recursive inline function - inline functions must be terminated with a \'ret\' instruction before another \'inline\' keyword.')
 
@@ -46,6 +46,10 @@ class Device:
     def start(self): pass
     def tick(self): pass
 
+    # Devices with state override these, so a processor can be restored to an earlier tick
+    def save_state(self) -> Any: return None
+    def restore_state(self, state: Any): pass
+
 class ZeroRegisterDevice(Device):
 
     def owns(self, addr: int32) -> bool: return addr == 0
@@ -61,10 +65,37 @@ class CounterDevice(Device):
     def start(self): self.tick_count = int32(0)
     def tick(self): self.tick_count += int32(1)
 
+    def save_state(self) -> Any: return self.tick_count
+    def restore_state(self, state: Any): self.tick_count = state
+
 class RandomDevice(Device):
+    """ Random words are generated in blocks, from a generator which is reset to the seed on start. Without a seed, each start uses fresh entropy """
+
+    BLOCK_SIZE = 1024
+
+    def __init__(self, seed: Optional[int] = None):
+        self.seed = seed
+        self.generator = numpy.random.default_rng(seed)
+        self.block: List[int32] = []
+        self.index = 0
 
     def owns(self, addr: int32) -> bool: return addr == constants.RANDOM_PORT
-    def get(self, addr: int32) -> int32: return int32(numpy.random.randint(-2147483648, 2147483647, dtype=int32))
+    def get(self, addr: int32) -> int32:
+        if self.index >= len(self.block):
+            self.block = list(self.generator.integers(-2147483648, 2147483648, size=RandomDevice.BLOCK_SIZE, dtype=int32))
+            self.index = 0
+        value = self.block[self.index]
+        self.index += 1
+        return value
+
+    def start(self):
+        self.generator = numpy.random.default_rng(self.seed)
+        self.block = []
+        self.index = 0
+
+    def save_state(self) -> Any: return self.generator.bit_generator.state, self.block, self.index  # Blocks are replaced, never modified
+    def restore_state(self, state: Any):
+        self.generator.bit_generator.state, self.block, self.index = state
 
 
 class GPU:
@@ -152,12 +183,37 @@ class ProcessorEvent(Enum):
         proc.event_handle(proc, self, arg)
 
 
+class ProcessorHook(Enum):
+    INSTRUCTION = 'on_instruction'  # (proc, pc, ir), before each instruction executes
+    MEM_READ = 'on_mem_read'  # (proc, addr, value), after each direct memory or device read
+    MEM_WRITE = 'on_mem_write'  # (proc, addr, value), before each direct memory or device write
+    BRANCH = 'on_branch'  # (proc, pc, ir, taken), after each conditional branch, call or return executes
+    GPU = 'on_gpu'  # (proc, ir), before each GPU instruction executes
+
+
+BRANCH_OPCODES = frozenset([*range(Opcodes.BEQ.value, Opcodes.BGTI.value + 1), Opcodes.CALL.value, Opcodes.RET.value])
+
+
 def default_exception_handle(_, e: ProcessorError): raise e
 def default_event_handle(*_): pass
 
+class ProgramImage(NamedTuple):
+    """ A compact form of an assembled program, which is cheap to pickle when starting a processor in another process """
+    code: bytes  # Instructions, packed as little-endian 64-bit words
+    sprites: Tuple[str, ...]
+    print_table: Tuple[Tuple[str, Tuple[int, ...]], ...]
+    random_seed: Optional[int]
+
+    @staticmethod
+    def create(instructions: Sequence[AnyInt], sprites: Sequence[str] = (), print_table: Sequence[Tuple[str, Tuple[int, ...]]] = (), random_seed: Optional[int] = None) -> 'ProgramImage':
+        return ProgramImage(numpy.array(instructions, dtype='<u8').tobytes(), tuple(sprites), tuple(print_table), random_seed)
+
+    def processor(self, **kwargs: Any) -> 'Processor':
+        return Processor(numpy.frombuffer(self.code, dtype='<u8'), self.sprites, self.print_table, random_seed=self.random_seed, **kwargs)
+
 class Processor:
 
-    def __init__(self, instructions: Sequence[AnyInt] = (), sprites: Sequence[str] = (), print_table: Sequence[Tuple[str, Tuple[int, ...]]] = (), exception_handle: Callable[['Processor', ProcessorError], Any] = default_exception_handle, event_handle: Callable[['Processor', ProcessorEvent, Any], Any] = default_event_handle):
+    def __init__(self, instructions: Sequence[AnyInt] = (), sprites: Sequence[str] = (), print_table: Sequence[Tuple[str, Tuple[int, ...]]] = (), exception_handle: Callable[['Processor', ProcessorError], Any] = default_exception_handle, event_handle: Callable[['Processor', ProcessorEvent, Any], Any] = default_event_handle, random_seed: Optional[int] = None):
         self.memory: List[Optional[int32]] = [None] * constants.MAIN_MEMORY_SIZE  # N x 32b
         self.memory[0] = int32(0)  # R0
         self.instructions: List[Optional[uint64]] = [None] * constants.INSTRUCTION_MEMORY_SIZE  # N x 64b
@@ -179,7 +235,7 @@ class Processor:
         # Peripheral Devices
         self.r0 = ZeroRegisterDevice()
         self.counter = CounterDevice()
-        self.rng = RandomDevice()
+        self.rng = RandomDevice(random_seed)
         self.devices: List[Device] = [self.r0, self.counter, self.rng]
 
         self.gpu = GPU(self)
@@ -193,6 +249,118 @@ class Processor:
         # - Indirect memory read or write
         self.cpi_instruction_count: int = 0
 
+        # Hooks are installed by replacing methods of this instance with instrumented versions, only while any are registered
+        self.hooks: Dict[ProcessorHook, List[Callable[..., Any]]] = {hook: [] for hook in ProcessorHook}
+        self.unhooked: Dict[Tuple[Any, str], Tuple[Optional[Callable[..., Any]], Callable[..., Any]]] = {}  # (object, method name) -> (original, instrumented) method. The original is None if it was the class method
+        self.hooked_pc = int32(0)
+        self.hooked_ir: Optional[IRData] = None
+        self.branch_taken = False  # If the hooked instruction transferred control, including to the next instruction
+        self.decode_overridden = False  # If decode() is replaced on this instance, i.e. by a hook, telemetry, or a predecoded ROM
+
+        self.disassembler: Optional[disassembler.Disassembler] = None  # Created on demand by debug_view()
+
+    def add_hook(self, hook: ProcessorHook, callback: Callable[..., Any]):
+        if not self.hooks[hook]:
+            for owner, name in self.hooked_methods(hook):
+                if (owner, name) not in self.unhooked:
+                    method = getattr(owner, name)
+                    instrumented = getattr(self, 'hooked_' + name)(method)
+                    self.unhooked[owner, name] = (method if name in vars(owner) else None, instrumented)
+                    setattr(owner, name, instrumented)
+            self.decode_overridden = 'decode' in vars(self)
+        self.hooks[hook].append(callback)
+
+    def remove_hook(self, hook: ProcessorHook, callback: Callable[..., Any]):
+        self.hooks[hook].remove(callback)
+        if not self.hooks[hook]:
+            in_use = {key for other, callbacks in self.hooks.items() if callbacks for key in self.hooked_methods(other)}
+            for key in self.hooked_methods(hook):
+                owner, name = key
+                # If the instrumented method has since been wrapped by something else, it is left in place, and is reused if the hook is added again
+                if key not in in_use and key in self.unhooked and getattr(owner, name) is self.unhooked[key][1]:
+                    if (method := self.unhooked.pop(key)[0]) is not None:
+                        setattr(owner, name, method)
+                    else:
+                        delattr(owner, name)
+            self.decode_overridden = 'decode' in vars(self)
+
+    def hooked_methods(self, hook: ProcessorHook) -> List[Tuple[Any, str]]:
+        """ The methods instrumented for a hook. Branches need the decoded instruction, which is captured by 'decode', and whether control was transferred """
+        if hook == ProcessorHook.INSTRUCTION:
+            return [(self, 'decode')]
+        if hook == ProcessorHook.BRANCH:
+            return [(self, 'decode'), (self, 'tick'), (self, 'branch_to'), (self, 'call'), (self, 'ret')]
+        if hook == ProcessorHook.MEM_READ:
+            return [(self, 'mem_get')]
+        if hook == ProcessorHook.MEM_WRITE:
+            return [(self, 'mem_set')]
+        return [(self.gpu, 'exec')]
+
+    def hooked_decode(self, decode: Callable[[], 'IRData']) -> Callable[[], 'IRData']:
+        callbacks = self.hooks[ProcessorHook.INSTRUCTION]
+        def wrapper() -> IRData:
+            ir = self.hooked_ir = decode()
+            pc = self.hooked_pc = self.pc
+            for callback in callbacks:
+                callback(self, pc, ir)
+            return ir
+        return wrapper
+
+    def hooked_tick(self, tick: Callable[[], None]) -> Callable[[], None]:
+        callbacks = self.hooks[ProcessorHook.BRANCH]
+        def wrapper():
+            self.hooked_ir = None
+            self.branch_taken = False
+            tick()
+            if (ir := self.hooked_ir) is not None and ir.opcode in BRANCH_OPCODES:
+                pc, taken = self.hooked_pc, self.branch_taken
+                for callback in callbacks:
+                    callback(self, pc, ir, taken)
+        return wrapper
+
+    def hooked_branch_to(self, branch_to: Callable[[int32], None]) -> Callable[[int32], None]:
+        def wrapper(offset: int32):
+            branch_to(offset)
+            self.branch_taken = True
+        return wrapper
+
+    def hooked_call(self, call: Callable[[int32], None]) -> Callable[[int32], None]:
+        def wrapper(offset: int32):
+            call(offset)
+            self.branch_taken = True
+        return wrapper
+
+    def hooked_ret(self, ret: Callable[[], None]) -> Callable[[], None]:
+        def wrapper():
+            ret()
+            self.branch_taken = True
+        return wrapper
+
+    def hooked_mem_get(self, mem_get: Callable[[int32], int32]) -> Callable[[int32], int32]:
+        callbacks = self.hooks[ProcessorHook.MEM_READ]
+        def wrapper(addr: int32) -> int32:
+            value = mem_get(addr)
+            for callback in callbacks:
+                callback(self, addr, value)
+            return value
+        return wrapper
+
+    def hooked_mem_set(self, mem_set: Callable[[int32, int32], None]) -> Callable[[int32, int32], None]:
+        callbacks = self.hooks[ProcessorHook.MEM_WRITE]
+        def wrapper(addr: int32, value: int32):
+            for callback in callbacks:
+                callback(self, addr, value)
+            mem_set(addr, value)
+        return wrapper
+
+    def hooked_exec(self, gpu_exec: Callable[['IRData'], None]) -> Callable[['IRData'], None]:
+        callbacks = self.hooks[ProcessorHook.GPU]
+        def wrapper(ir: IRData):
+            for callback in callbacks:
+                callback(self, ir)
+            gpu_exec(ir)
+        return wrapper
+
     def throw(self, e: ProcessorErrorType, *args: Any) -> Any:
         self.exception_handle(self, e.create(*args))
 
@@ -206,8 +374,7 @@ class Processor:
 
     def tick(self):
         # Processor Tick
-        ir = self.inst_get()
-        ir_data: IRData = decode_ir(ir)
+        ir_data: IRData = self.decode() if self.decode_overridden else decode_ir(self.inst_get())
         self.pc_next = self.pc + int32(1)
         if ir_data.opcode not in INSTRUCTIONS:
             return self.throw(ProcessorErrorType.INVALID_OPCODE, ir_data.opcode)
@@ -223,6 +390,10 @@ class Processor:
         # CPI Tick
         self.cpi_instruction_count += 1
 
+    def decode(self) -> IRData:
+        """ Fetch and decode the instruction at the current PC. Anything which replaces this on an instance must also set 'decode_overridden', as tick() otherwise decodes inline """
+        return decode_ir(self.inst_get())
+
     def branch_to(self, offset: int32):
         self.pc_next = self.pc + offset
 
@@ -322,14 +493,15 @@ class Processor:
 
     def debug_view(self):
         # Show an area around the non-zero memory
-        memory_view = set()
-        for i, m in enumerate(self.memory):
-            if m != 0 and m is not None:
-                memory_view |= {i - 1, i, i + 1}
+        memory = self.memory
+        nonzero = [m is not None and m != 0 for m in memory]
+        memory_view = [i for i in range(len(memory)) if nonzero[i] or (i > 0 and nonzero[i - 1]) or (i + 1 < len(memory) and nonzero[i + 1])]
 
-        # Show a view of the assembly near the area
-        decoded = disassembler.decode(self.instructions)
-        decoded_view = decoded[self.pc - 3:self.pc] + [decoded[self.pc] + ' <-- HERE'] + decoded[self.pc + 1:self.pc + 4]
+        # Show a view of the assembly near the PC, only decoding the lines shown
+        if self.disassembler is None or self.disassembler.code is not self.instructions:
+            self.disassembler = disassembler.Disassembler(self.instructions, self.print_table)
+        pc = int(self.pc)
+        decoded_view = self.disassembler.decode_range(pc - 3, pc) + [line + ' <-- HERE' for line in self.disassembler.decode_range(pc, pc + 1)] + self.disassembler.decode_range(pc + 1, pc + 4)
 
         return '\n'.join([
             'PC: %d' % self.pc,
@@ -339,7 +511,7 @@ class Processor:
             '',
             'Memory:',
             'Addr | Hex  | Dec',
-            *['%04d | %s | %s' % (i, format(int(m), '08x') if m is not None else '????', '%d' % m if m is not None else '?') for i, m in enumerate(self.memory) if i in memory_view]
+            *['%04d | %s | %s' % (i, format(int(memory[i]), '08x') if memory[i] is not None else '????', '%d' % memory[i] if memory[i] is not None else '?') for i in memory_view]
         ])
 
 
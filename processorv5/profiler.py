@@ -0,0 +1,131 @@
+# Execution profiler for programs running on the ProcessorV5 model
+# Counts executions and indirect memory accesses per PC, and instructions per function, by tracking calls and returns
+# Functions are named by the label of their call target, and the call stacks can be written as folded stacks, for flamegraph tools
+
+from typing import List, Dict, Tuple, Optional, Sequence
+from numpy import int32
+from constants import Opcodes, GPUInstruction
+from processor import Processor, ProcessorHook, IRData, decode_operand
+
+import bisect
+import constants
+
+
+ENTRY = '<entry>'  # The root function, if there is no label at address zero
+
+
+class Profiler:
+    """
+    Profiles a single processor instance, using its instruction and branch hooks.
+    Each instruction is counted towards the function at the top of the call stack when it executes, so 'call' is counted in the caller, and 'ret' in the callee.
+    """
+
+    def __init__(self, proc: Processor, label_table: Dict[int, str]):
+        self.proc = proc
+        self.label_table = label_table
+        self.label_addresses: List[int] = sorted(label_table)
+        self.executions: List[int] = [0] * constants.INSTRUCTION_MEMORY_SIZE
+        self.indirect: List[int] = [0] * constants.INSTRUCTION_MEMORY_SIZE  # Indirect memory reads and writes
+        self.indirect_operands: List[Optional[int]] = [None] * constants.INSTRUCTION_MEMORY_SIZE  # Per instruction, computed when first executed
+
+        # Call stacks are interned as nodes of a tree, so each tick only needs to increment a list entry
+        self.node_paths: List[Tuple[str, ...]] = [(label_table.get(0, ENTRY),)]
+        self.node_ticks: List[int] = [0]
+        self.nodes: Dict[Tuple[int, str], int] = {}  # (parent node, function) -> node
+        self.stack: List[int] = [0]
+
+    def attach(self) -> 'Profiler':
+        self.proc.add_hook(ProcessorHook.INSTRUCTION, self.on_instruction)
+        self.proc.add_hook(ProcessorHook.BRANCH, self.on_branch)
+        return self
+
+    def detach(self):
+        self.proc.remove_hook(ProcessorHook.INSTRUCTION, self.on_instruction)
+        self.proc.remove_hook(ProcessorHook.BRANCH, self.on_branch)
+
+    def on_instruction(self, proc: Processor, pc: int32, ir: IRData):
+        self.node_ticks[self.stack[-1]] += 1
+        if 0 <= pc < len(self.executions):
+            self.executions[pc] += 1
+            if (count := self.indirect_operands[pc]) is None:
+                count = self.indirect_operands[pc] = indirect_operands(ir, proc.print_table)
+            self.indirect[pc] += count
+
+    def on_branch(self, proc: Processor, pc: int32, ir: IRData, taken: bool):
+        if ir.opcode == Opcodes.CALL:
+            target = int(proc.pc)
+            self.enter(self.label_table.get(target, '%04d' % target))
+        elif ir.opcode == Opcodes.RET and len(self.stack) > 1:  # Unbalanced returns stay in the root function
+            self.stack.pop()
+
+    def enter(self, function: str):
+        key = (self.stack[-1], function)
+        if (node := self.nodes.get(key)) is None:
+            node = self.nodes[key] = len(self.node_paths)
+            self.node_paths.append(self.node_paths[key[0]] + (function,))
+            self.node_ticks.append(0)
+        self.stack.append(node)
+
+    def folded_stacks(self) -> List[str]:
+        """ Lines of 'caller;callee count', in the folded stack format used by flamegraph tools """
+        return ['%s %d' % (';'.join(path), ticks) for path, ticks in zip(self.node_paths, self.node_ticks) if ticks > 0]
+
+    def write_folded_stacks(self, file: str):
+        with open(file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.folded_stacks()) + '\n')
+
+    def functions(self) -> Dict[str, Tuple[int, int]]:
+        """ Function -> (inclusive, exclusive) instructions executed """
+        result: Dict[str, Tuple[int, int]] = {}
+        for path, ticks in zip(self.node_paths, self.node_ticks):
+            for function in set(path):
+                inclusive, exclusive = result.get(function, (0, 0))
+                result[function] = (inclusive + ticks, exclusive + (ticks if function == path[-1] else 0))
+        return result
+
+    def label_of(self, pc: int) -> str:
+        """ The nearest label at or before an address """
+        i = bisect.bisect_right(self.label_addresses, pc) - 1
+        return self.label_table[self.label_addresses[i]] if i >= 0 else ENTRY
+
+    def report(self, disassembly: List[str], count: int = 20) -> List[str]:
+        """ A report of the hottest functions, labels and instructions. 'disassembly' is the decoded program, one line per address """
+        total = max(sum(self.executions), 1)
+        lines = ['Profile: %d instructions' % sum(self.executions), '', 'Functions (inclusive, exclusive):']
+        for function, (inclusive, exclusive) in sorted(self.functions().items(), key=lambda f: -f[1][0])[:count]:
+            lines.append('%10d %5.1f%% %10d %5.1f%%  %s' % (inclusive, 100 * inclusive / total, exclusive, 100 * exclusive / total, function))
+
+        by_label: Dict[str, int] = {}
+        for pc, executions in enumerate(self.executions):
+            if executions:
+                label = self.label_of(pc)
+                by_label[label] = by_label.get(label, 0) + executions
+        lines += ['', 'Labels:']
+        for label, executions in sorted(by_label.items(), key=lambda f: -f[1])[:count]:
+            lines.append('%10d %5.1f%%  %s' % (executions, 100 * executions / total, label))
+
+        lines += ['', 'Instructions (executions, indirect accesses):']
+        for pc in sorted((pc for pc, e in enumerate(self.executions) if e), key=lambda pc: -self.executions[pc])[:count]:
+            lines.append('%10d %5.1f%% %10d  %s' % (self.executions[pc], 100 * self.executions[pc] / total, self.indirect[pc], disassembly[pc] if pc < len(disassembly) else '%04d' % pc))
+        return lines
+
+
+def indirect_operands(ir: IRData, print_table: Sequence[Tuple[str, Tuple[int, ...]]]) -> int:
+    """ The number of indirect memory accesses made by an instruction, each time it executes """
+    opcode = ir.opcode
+    operands: Sequence[int32] = ()
+    if opcode <= Opcodes.LE:  # Type A
+        operands = (ir.op1, ir.op2, ir.op3)
+    elif opcode <= Opcodes.GTI:  # Type B
+        operands = (ir.op2, ir.op3)
+    elif opcode <= Opcodes.BLE:  # Type C
+        operands = (ir.op1, ir.op3)
+    elif opcode <= Opcodes.BGTI or opcode == Opcodes.ASSERT:  # Type D
+        operands = (ir.op3,)
+    elif opcode == Opcodes.PRINT and 0 <= ir.print_index < len(print_table):
+        operands = print_table[ir.print_index][1]
+    elif opcode == Opcodes.GPU and ir.gpu_opcode in (GPUInstruction.GLS, GPUInstruction.GLSD):
+        operands = (ir.op1,)
+    elif opcode == Opcodes.GPU and ir.gpu_opcode == GPUInstruction.GMV:
+        operands = (ir.op1, ir.op3)
+    return sum(int(decode_operand(int32(op)).indirect) for op in operands)
@@ -0,0 +1,169 @@
+# Instruction and branch coverage for programs running on the ProcessorV5 model
+# Tracks which instructions were executed, and which directions each conditional branch took, merged across any number of runs
+
+from typing import List, Dict, Sequence, Tuple, Optional, NamedTuple
+from numpy import int32
+from constants import Opcodes
+from assembler import Assembler
+from processor import Processor, ProcessorHook, IRData
+from disassembler import Disassembler
+from runner import Runner, RunnerControlDevice
+
+import sys
+import json
+import zlib
+import numpy
+import utils
+import argparse
+
+
+COVERAGE_VERSION = 1
+
+
+def read_command_line_args():
+    parser = argparse.ArgumentParser(description='Instruction and branch coverage for Factorio ProcessorV5 programs')
+
+    parser.add_argument('file', type=str, help='The assembly file to be run')
+
+    parser.add_argument('--ea', action='store_true', dest='enable_assertions', default=False, help='Enable assert instructions')
+    parser.add_argument('--opt', action='store_true', dest='enable_optimizations', default=False, help='Enable the optimizer')
+    parser.add_argument('--alloc', action='store_true', dest='enable_allocation', default=False, help='Enable the word allocator')
+
+    parser.add_argument('--seeds', type=int, default=1, help='Run the program this many times, with random seeds from 0')
+    parser.add_argument('--ticks', type=int, default=1_000_000, help='Stop each run after this many instructions')
+    parser.add_argument('--merge', type=str, nargs='*', default=(), help='Merge coverage saved from other runs of the same program')
+    parser.add_argument('--save', type=str, default=None, help='Save the merged coverage to this file')
+    parser.add_argument('--listing', action='store_true', default=False, help='Print the program listing, annotated with coverage')
+
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    asm = Assembler(args.file, utils.read_file(args.file), args.enable_assertions, enable_optimizations=args.enable_optimizations, enable_allocation=args.enable_allocation)
+    if not asm.assemble():
+        print(asm.error)
+        sys.exit(1)
+
+    coverage = Coverage(asm.code)
+    for seed in range(args.seeds):
+        proc = Processor(asm.code, asm.sprites, asm.print_table, random_seed=seed)
+        proc.devices.append(RunnerControlDevice())
+        coverage.attach(proc)
+        if not Runner(proc, max_ticks=args.ticks).run():
+            sys.exit(1)
+        coverage.detach(proc)
+
+    for file in args.merge:
+        coverage.merge(Coverage.load(file))
+    if args.save is not None:
+        coverage.save(args.save)
+
+    if args.listing:
+        print('\n'.join(coverage.listing(asm.print_table, asm.memory_table, asm.label_table)))
+    print(coverage.summary().format())
+
+
+class CoverageSummary(NamedTuple):
+    runs: int
+    instructions: int
+    executed: int
+    branch_directions: int  # Two per conditional branch
+    branch_directions_covered: int
+
+    def format(self) -> str:
+        return 'Runs: %d, Instructions: %d / %d (%.1f%%), Branches: %d / %d (%.1f%%)' % (
+            self.runs,
+            self.executed, self.instructions, 100 * self.executed / max(self.instructions, 1),
+            self.branch_directions_covered, self.branch_directions, 100 * self.branch_directions_covered / max(self.branch_directions, 1)
+        )
+
+
+class Coverage:
+    """
+    Coverage of a single program, which is collected via the instruction and branch hooks of each processor it is attached to.
+    Only conditional branches are counted as branches. Calls and returns are always taken.
+    """
+
+    def __init__(self, code: Sequence[int]):
+        self.code = list(code)
+        self.code_hash = zlib.crc32(numpy.array(self.code, dtype='<u8').tobytes())
+        self.runs = 0
+        self.executed: List[int] = [0] * len(self.code)
+        self.taken: List[int] = [0] * len(self.code)
+        self.not_taken: List[int] = [0] * len(self.code)
+
+    def attach(self, proc: Processor) -> 'Coverage':
+        proc.add_hook(ProcessorHook.INSTRUCTION, self.on_instruction)
+        proc.add_hook(ProcessorHook.BRANCH, self.on_branch)
+        self.runs += 1
+        return self
+
+    def detach(self, proc: Processor):
+        proc.remove_hook(ProcessorHook.INSTRUCTION, self.on_instruction)
+        proc.remove_hook(ProcessorHook.BRANCH, self.on_branch)
+
+    def on_instruction(self, proc: Processor, pc: int32, ir: IRData):
+        if 0 <= pc < len(self.executed):
+            self.executed[pc] += 1
+
+    def on_branch(self, proc: Processor, pc: int32, ir: IRData, taken: bool):
+        if 0 <= pc < len(self.executed) and is_conditional_branch(self.code[pc]):
+            if taken:
+                self.taken[pc] += 1
+            else:
+                self.not_taken[pc] += 1
+
+    def merge(self, other: 'Coverage'):
+        if other.code_hash != self.code_hash:
+            raise ValueError('Cannot merge coverage of a different program')
+        self.runs += other.runs
+        for counts, other_counts in ((self.executed, other.executed), (self.taken, other.taken), (self.not_taken, other.not_taken)):
+            for i, count in enumerate(other_counts):
+                counts[i] += count
+
+    def summary(self) -> CoverageSummary:
+        branches = [pc for pc, inst in enumerate(self.code) if is_conditional_branch(inst)]
+        return CoverageSummary(
+            self.runs,
+            len(self.code),
+            sum(count > 0 for count in self.executed),
+            2 * len(branches),
+            sum((self.taken[pc] > 0) + (self.not_taken[pc] > 0) for pc in branches)
+        )
+
+    def listing(self, print_table: Optional[Sequence[Tuple[str, Tuple[int, ...]]]] = None, memory_table: Optional[Dict[int, str]] = None, label_table: Optional[Dict[int, str]] = None) -> List[str]:
+        """
+        The disassembled program, with the execution count of each instruction, and the taken and not taken counts of each conditional branch.
+        Lines which were never executed, or branches which never went one direction, are marked with '!'
+        """
+        lines = []
+        for pc, line in enumerate(Disassembler(self.code, print_table, memory_table, label_table).decode()):
+            branch = ''
+            missed = self.executed[pc] == 0
+            if is_conditional_branch(self.code[pc]):
+                branch = 'T %d N %d' % (self.taken[pc], self.not_taken[pc])
+                missed = missed or self.taken[pc] == 0 or self.not_taken[pc] == 0
+            lines.append('%s %8s %-16s %s' % ('!' if missed else ' ', self.executed[pc] if self.executed[pc] else '-', branch, line))
+        return lines
+
+    def save(self, file: str):
+        with open(file, 'w', encoding='utf-8') as f:
+            json.dump({'version': COVERAGE_VERSION, 'code': self.code, 'runs': self.runs, 'executed': self.executed, 'taken': self.taken, 'not_taken': self.not_taken}, f)
+
+    @staticmethod
+    def load(file: str) -> 'Coverage':
+        with open(file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data['version'] != COVERAGE_VERSION:
+            raise ValueError('Unsupported coverage version %d in %s' % (data['version'], file))
+        coverage = Coverage(data['code'])
+        coverage.runs, coverage.executed, coverage.taken, coverage.not_taken = data['runs'], data['executed'], data['taken'], data['not_taken']
+        return coverage
+
+
+def is_conditional_branch(inst: int) -> bool:
+    return Opcodes.BEQ <= (int(inst) >> 58) <= Opcodes.BGTI
+
+
+if __name__ == '__main__':
+    main(read_command_line_args())
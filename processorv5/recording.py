@@ -0,0 +1,198 @@
+# Record and replay of the non-deterministic inputs to a ProcessorV5 program
+# A recording holds every control port input change and random value read by the program, and a hash of every screen flushed, each keyed by tick.
+# Replaying a recording feeds the same inputs back to the program, at any speed, and checks the program flushes the same screens at the same ticks.
+
+from typing import List, Tuple, Optional, Any, Sequence
+from numpy import int32
+from processor import Processor, ProcessorEvent, Device, ImageBuffer
+
+import zlib
+import numpy
+import constants
+
+
+RECORDING_VERSION = 1
+
+
+class Recording:
+
+    def __init__(self):
+        self.inputs: List[Tuple[int, int, int]] = []  # (tick, control port index, value), for each read which differs from the previous read of that port
+        self.randoms: List[int] = []  # Every random value read, in order
+        self.frames: List[Tuple[int, int]] = []  # (tick, hash) of every flushed screen
+        self.ticks = 0  # The total number of ticks recorded
+
+    def save(self, file: str):
+        with open(file, 'wb') as f:
+            numpy.savez_compressed(
+                f,
+                version=numpy.array(RECORDING_VERSION),
+                ticks=numpy.array(self.ticks, dtype=numpy.int64),
+                inputs=numpy.array(self.inputs, dtype=numpy.int64).reshape(-1, 3),
+                randoms=numpy.array(self.randoms, dtype=numpy.int32),
+                frames=numpy.array(self.frames, dtype=numpy.int64).reshape(-1, 2)
+            )
+
+    @staticmethod
+    def load(file: str) -> 'Recording':
+        with numpy.load(file) as data:
+            if int(data['version']) != RECORDING_VERSION:
+                raise ValueError('Unsupported recording version %d in %s' % (int(data['version']), file))
+            recording = Recording()
+            recording.ticks = int(data['ticks'])
+            recording.inputs = [(int(tick), int(index), int(value)) for tick, index, value in data['inputs']]
+            recording.randoms = [int(value) for value in data['randoms']]
+            recording.frames = [(int(tick), int(h)) for tick, h in data['frames']]
+        return recording
+
+
+class Recorder:
+    """
+    Records the inputs and screens of a single processor instance, by wrapping the random device, any control port devices, and the event handle.
+    Devices and the event handle must be added to the processor before attaching.
+    """
+
+    def __init__(self, proc: Processor):
+        self.proc = proc
+        self.recording = Recording()
+        self.last_inputs: List[Optional[int]] = [None] * constants.CONTROL_PORT_WIDTH
+
+    def attach(self) -> 'Recorder':
+        proc = self.proc
+        proc.rng.get = self.recorded_random(proc.rng.get)
+        for device in proc.devices:
+            if device is not proc.rng and any(device.reads(int32(constants.CONTROL_PORT + i)) for i in range(constants.CONTROL_PORT_WIDTH)):
+                device.get = self.recorded_input(device.get)
+
+        event_handle = proc.event_handle
+        def recorded_event_handle(p: Processor, event_type: ProcessorEvent, arg: Any):
+            if event_type == ProcessorEvent.GFLUSH:
+                self.recording.frames.append((self.tick(), frame_hash(arg)))
+            event_handle(p, event_type, arg)
+        proc.event_handle = recorded_event_handle
+        return self
+
+    def recorded_random(self, get):
+        def wrapper(addr: int32) -> int32:
+            value = get(addr)
+            self.recording.randoms.append(int(value))
+            return value
+        return wrapper
+
+    def recorded_input(self, get):
+        def wrapper(addr: int32) -> int32:
+            value = get(addr)
+            index = int(addr) - constants.CONTROL_PORT
+            if 0 <= index < constants.CONTROL_PORT_WIDTH and self.last_inputs[index] != int(value):
+                self.last_inputs[index] = int(value)
+                self.recording.inputs.append((self.tick(), index, int(value)))
+            return value
+        return wrapper
+
+    def tick(self) -> int:
+        return int(self.proc.counter.tick_count)
+
+    def save(self, file: str):
+        self.recording.ticks = self.tick()
+        self.recording.save(file)
+
+
+class Replayer:
+    """
+    Replays a recording on a single processor instance, by replacing its random device, adding a control port device, and checking every flushed screen.
+    If the program diverges from the recording, i.e. it flushes a different screen, or reads more random values than were recorded, the processor is stopped and the reason is stored in 'divergence'.
+    """
+
+    def __init__(self, proc: Processor, recording: Recording):
+        self.proc = proc
+        self.recording = recording
+        self.frames = 0  # The number of screens checked so far
+        self.divergence: Optional[str] = None
+
+    def attach(self) -> 'Replayer':
+        proc = self.proc
+        rng = ReplayRandomDevice(self)
+        proc.devices = [rng if device is proc.rng else device for device in proc.devices]
+        proc.rng = rng
+        proc.devices.append(ScriptedControlDevice(proc, self.recording.inputs))
+
+        event_handle = proc.event_handle
+        def replayed_event_handle(p: Processor, event_type: ProcessorEvent, arg: Any):
+            if event_type == ProcessorEvent.GFLUSH:
+                self.check_frame(arg)
+            event_handle(p, event_type, arg)
+        proc.event_handle = replayed_event_handle
+        return self
+
+    def check_frame(self, screen: ImageBuffer):
+        actual = (self.tick(), frame_hash(screen))
+        if self.frames >= len(self.recording.frames):
+            self.diverge('Unexpected screen flushed at tick %d' % actual[0])
+        elif actual != (expected := self.recording.frames[self.frames]):
+            self.diverge('Screen %d flushed at tick %d with hash %08x, expected tick %d with hash %08x' % (self.frames, *actual, *expected))
+        self.frames += 1
+
+    def diverge(self, reason: str):
+        if self.divergence is None:
+            self.divergence = reason
+        self.proc.running = False
+
+    def finish(self):
+        """ Called once the replay has stopped, to check every recorded screen was flushed """
+        if self.divergence is None and self.frames < len(self.recording.frames):
+            self.divergence = 'Flushed %d of %d recorded screens' % (self.frames, len(self.recording.frames))
+
+    def tick(self) -> int:
+        return int(self.proc.counter.tick_count)
+
+
+class ReplayRandomDevice(Device):
+
+    def __init__(self, replayer: Replayer):
+        self.replayer = replayer
+        self.index = 0
+
+    def owns(self, addr: int32) -> bool: return addr == constants.RANDOM_PORT
+    def get(self, addr: int32) -> int32:
+        randoms = self.replayer.recording.randoms
+        if self.index >= len(randoms):
+            self.replayer.diverge('Read more than %d recorded random values at tick %d' % (len(randoms), self.replayer.tick()))
+            return int32(0)
+        value = randoms[self.index]
+        self.index += 1
+        return int32(value)
+
+    def save_state(self) -> Any: return self.index
+    def restore_state(self, state: Any): self.index = state
+
+
+class ScriptedControlDevice(Device):
+    """ The control ports, driven by a script of (tick, control port index, value) input changes, in tick order """
+
+    def __init__(self, proc: Processor, inputs: Sequence[Tuple[int, int, int]]):
+        self.proc = proc
+        self.inputs = inputs
+        self.values = [0] * constants.CONTROL_PORT_WIDTH
+        self.index = 0  # The next input change to apply
+
+    def reads(self, addr: int32) -> bool: return 0 <= addr - constants.CONTROL_PORT < constants.CONTROL_PORT_WIDTH
+    def get(self, addr: int32) -> int32:
+        inputs, tick = self.inputs, self.proc.counter.tick_count
+        while self.index < len(inputs) and inputs[self.index][0] <= tick:
+            _, index, value = inputs[self.index]
+            self.values[index] = value
+            self.index += 1
+        return int32(self.values[addr - constants.CONTROL_PORT])
+
+    def start(self):
+        self.values = [0] * constants.CONTROL_PORT_WIDTH
+        self.index = 0
+
+    def save_state(self) -> Any: return list(self.values), self.index
+    def restore_state(self, state: Any):
+        values, self.index = state
+        self.values = list(values)
+
+
+def frame_hash(screen: ImageBuffer) -> int:
+    return zlib.crc32(numpy.array(screen.pack(), dtype=numpy.uint32).tobytes())
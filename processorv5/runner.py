@@ -0,0 +1,169 @@
+# This is a headless runner for programs for the ProcessorV5 architecture
+# It runs a program without the UI, either paced to a clock, or as fast as possible, printing output and telemetry to the console
+
+from typing import Optional, Any
+
+from assembler import Assembler
+from numpy import int32
+from processor import Processor, ProcessorError, ProcessorEvent, Device
+from telemetry import Telemetry
+from recording import Recording, Recorder, Replayer
+from profiler import Profiler
+from execution_trace import ExecutionTrace, DEFAULT_TRACE_SIZE
+from sampling_profiler import SamplingProfiler, DEFAULT_INTERVAL
+from utils import ClockScheduler
+
+import sys
+import time
+import utils
+import argparse
+import constants
+import disassembler
+
+
+TELEMETRY_NS = 1_000_000_000
+MAX_SPEED_BATCH = 1000  # Ticks run between checks for telemetry or the UI, when running at max speed
+
+
+def read_command_line_args():
+    parser = argparse.ArgumentParser(description='Headless runner for Factorio ProcessorV5 programs')
+
+    parser.add_argument('file', type=str, help='The assembly file to be run')
+
+    parser.add_argument('--ea', action='store_true', dest='enable_assertions', default=False, help='Enable assert instructions')
+    parser.add_argument('--ep', action='store_true', dest='enable_print', default=False, help='Enable print instructions')
+    parser.add_argument('--opt', action='store_true', dest='enable_optimizations', default=False, help='Enable the optimizer')
+    parser.add_argument('--alloc', action='store_true', dest='enable_allocation', default=False, help='Enable the word allocator')
+
+    parser.add_argument('--clock', type=str, default=None, help='The clock cycle time, i.e. \'20ms\', or \'max\' to run as fast as possible. Defaults to the \'sim_clock_time\' directive, or max speed')
+    parser.add_argument('--ticks', type=int, default=None, help='Stop after running this many instructions')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the random device, for reproducible runs. Defaults to the \'random_seed\' directive, or unseeded')
+    parser.add_argument('--telemetry', action='store_true', default=False, help='Print throughput telemetry once per second')
+
+    parser.add_argument('--profile', action='store_true', default=False, help='Print a profile of the hottest functions, labels and instructions')
+    parser.add_argument('--folded', type=str, default=None, help='Write the profiled call stacks to this file, in the folded stack format used by flamegraph tools')
+
+    parser.add_argument('--sample', action='store_true', default=False, help='Print a sampling profile of where the simulator itself spends time')
+    parser.add_argument('--sample-interval', type=float, default=1000 * DEFAULT_INTERVAL, help='The sampling interval, in milliseconds')
+    parser.add_argument('--sample-json', type=str, default=None, help='Write the simulator sampling profile to this file, as JSON')
+
+    parser.add_argument('--trace', type=str, default=None, help='Keep a trace of the last instructions executed, and write it to this file when the program stops. View it with execution_trace.py')
+    parser.add_argument('--trace-size', type=int, default=DEFAULT_TRACE_SIZE, help='The number of instructions kept in the trace')
+
+    parser.add_argument('--record', type=str, default=None, help='Record the inputs and screens of the program to this file')
+    parser.add_argument('--replay', type=str, default=None, help='Replay a recording, at max speed unless \'--clock\' is given, and check the program flushes the same screens')
+
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    asm = Assembler(args.file, utils.read_file(args.file), args.enable_assertions, args.enable_print, enable_optimizations=args.enable_optimizations, enable_allocation=args.enable_allocation)
+    if not asm.assemble():
+        print(asm.error)
+        sys.exit(1)
+
+    clock = args.clock if args.clock is not None else asm.directives.get(constants.DIRECTIVE_SIM_CLOCK_TIME, 'max') if args.replay is None else 'max'
+    seed = args.seed if args.seed is not None else asm.directives.get(constants.DIRECTIVE_RANDOM_SEED)
+    if seed is not None and not str(seed).isdigit():
+        print('Invalid random seed: \'%s\'' % seed)
+        sys.exit(1)
+
+    proc = Processor(asm.code, asm.sprites, asm.print_table, event_handle=RunnerEventHandle(), random_seed=int(seed) if seed is not None else None)
+
+    # Attached before the runner, so telemetry includes the replay devices
+    replayer = Replayer(proc, Recording.load(args.replay)).attach() if args.replay is not None else None
+    if replayer is None:
+        proc.devices.append(RunnerControlDevice())
+    recorder = Recorder(proc).attach() if args.record is not None else None
+    profiler = Profiler(proc, asm.label_table).attach() if args.profile or args.folded is not None else None
+    trace = ExecutionTrace(proc, args.trace_size).attach() if args.trace is not None else None
+    max_ticks = args.ticks if args.ticks is not None or replayer is None else replayer.recording.ticks
+
+    runner = Runner(proc, utils.parse_clock_time(clock), max_ticks, args.telemetry)
+    sampler = SamplingProfiler(args.sample_interval / 1000).start() if args.sample or args.sample_json is not None else None
+    success = runner.run()
+
+    if sampler is not None:
+        sampler.stop()
+        if args.sample:
+            print('\n'.join(sampler.report()))
+        if args.sample_json is not None:
+            sampler.save(args.sample_json)
+
+    if recorder is not None:
+        recorder.save(args.record)
+    if trace is not None:
+        trace.save(args.trace)
+    if profiler is not None:
+        if args.profile:
+            print('\n'.join(profiler.report(disassembler.decode(asm.code, asm.print_table, asm.memory_table, asm.label_table))))
+        if args.folded is not None:
+            profiler.write_folded_stacks(args.folded)
+    if replayer is not None:
+        replayer.finish()
+        if replayer.divergence is not None:
+            print('Replay diverged: %s' % replayer.divergence)
+            success = False
+        else:
+            print('Replayed %d ticks, %d screens matched' % (runner.ticks, replayer.frames))
+    if not success:
+        sys.exit(1)
+
+
+class Runner:
+
+    def __init__(self, proc: Processor, period_ns: int = 0, max_ticks: Optional[int] = None, telemetry: bool = False):
+        self.proc = proc
+        self.period_ns = period_ns  # 0 runs as fast as possible
+        self.max_ticks = max_ticks
+        self.telemetry: Optional[Telemetry] = Telemetry(proc).attach() if telemetry else None
+        self.ticks = 0
+
+    def run(self) -> bool:
+        """ Runs until the processor halts, or the tick limit is reached. Returns False if the processor raised an error """
+        proc = self.proc
+        scheduler = ClockScheduler(self.period_ns) if self.period_ns > 0 else None
+        next_telemetry_ns = time.perf_counter_ns() + TELEMETRY_NS
+
+        for device in proc.devices:
+            device.start()
+        proc.running = True
+        try:
+            while proc.running and (self.max_ticks is None or self.ticks < self.max_ticks):
+                batch = scheduler.ticks_due() if scheduler is not None else MAX_SPEED_BATCH
+                if self.max_ticks is not None:
+                    batch = min(batch, self.max_ticks - self.ticks)
+                for _ in range(batch):
+                    proc.tick()
+                    self.ticks += 1
+                    if not proc.running:
+                        break
+
+                if self.telemetry is not None and time.perf_counter_ns() > next_telemetry_ns:
+                    print(self.telemetry.sample().format())
+                    next_telemetry_ns = time.perf_counter_ns() + TELEMETRY_NS
+
+                if scheduler is not None and proc.running:
+                    scheduler.wait()
+        except ProcessorError as e:
+            print(e)
+            print(proc.debug_view())
+            return False
+        return True
+
+
+class RunnerControlDevice(Device):
+    """ The control ports, with no input """
+
+    def reads(self, addr: int32) -> bool: return 0 <= addr - constants.CONTROL_PORT < constants.CONTROL_PORT_WIDTH
+
+
+class RunnerEventHandle:
+
+    def __call__(self, proc: Processor, event_type: ProcessorEvent, arg: Any):
+        if event_type == ProcessorEvent.PRINT:
+            print(arg)
+
+
+if __name__ == '__main__':
+    main(read_command_line_args())
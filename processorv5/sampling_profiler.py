@@ -0,0 +1,107 @@
+# Statistical sampling profiler for the simulator itself
+# A background thread samples the Python stack of the thread running the simulator at a fixed interval, and counts the simulator functions on it
+# Unlike the program profiler, this measures where the simulator spends real time, i.e. decoding, GPU composition, devices or pipe I/O, without instrumenting any calls
+# Time spent in numpy, or any other library, is counted towards the simulator function which called it, and by the library module it was spent in
+
+from typing import List, Dict, Optional, Any
+from threading import Thread, Event
+from types import FrameType, CodeType
+
+import os
+import sys
+import json
+import threading
+
+
+SIMULATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INTERVAL = 0.005  # Seconds between samples
+SAMPLES_VERSION = 1
+
+
+class SamplingProfiler:
+    """
+    Samples a single thread, by default the one which creates the profiler.
+    While running, the interpreter's thread switch interval is lowered to the sample interval, so samples are not delayed waiting for the running thread to release the GIL.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = 0
+        self.exclusive: Dict[str, int] = {}  # The nearest simulator function to the top of the stack -> samples
+        self.inclusive: Dict[str, int] = {}  # Any simulator function on the stack -> samples
+        self.external: Dict[str, int] = {}  # The module at the top of the stack, when it is not part of the simulator -> samples
+
+        self.functions: Dict[CodeType, Optional[str]] = {}  # Simulator function names, or None for code outside the simulator
+        self.stopped = Event()
+        self.thread: Optional[Thread] = None
+        self.switch_interval = sys.getswitchinterval()
+
+    def start(self) -> 'SamplingProfiler':
+        self.stopped.clear()
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval))
+        self.thread = Thread(target=self.run, name='SamplingProfiler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+            sys.setswitchinterval(self.switch_interval)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if (frame := sys._current_frames().get(self.thread_id)) is None:
+                return  # The sampled thread has exited
+            self.sample(frame)
+
+    def sample(self, frame: FrameType):
+        self.samples += 1
+        leaf = True
+        seen = set()
+        current: Optional[FrameType] = frame
+        while current is not None:
+            if (function := self.function_of(current.f_code)) is not None:
+                if not seen:
+                    self.exclusive[function] = self.exclusive.get(function, 0) + 1
+                if function not in seen:
+                    seen.add(function)
+                    self.inclusive[function] = self.inclusive.get(function, 0) + 1
+            elif leaf:
+                module = current.f_globals.get('__name__', '?')
+                self.external[module] = self.external.get(module, 0) + 1
+            leaf = False
+            current = current.f_back
+
+    def function_of(self, code: CodeType) -> Optional[str]:
+        if code not in self.functions:
+            path = os.path.abspath(code.co_filename)
+            if path.startswith(SIMULATOR_DIR + os.sep) and not code.co_filename.startswith('<'):  # Excludes generated code, i.e. '<string>'
+                module = os.path.splitext(os.path.relpath(path, SIMULATOR_DIR))[0].replace(os.sep, '.')
+                self.functions[code] = '%s.%s' % (module, getattr(code, 'co_qualname', code.co_name))
+            else:
+                self.functions[code] = None
+        return self.functions[code]
+
+    def report(self, count: int = 20) -> List[str]:
+        """ A report of the simulator functions, and external modules, with the largest share of samples """
+        total = max(self.samples, 1)
+        lines = ['Samples: %d, every %.1f ms' % (self.samples, 1000 * self.interval), '', 'Simulator functions (exclusive, inclusive):']
+        for function, exclusive in sorted(self.exclusive.items(), key=lambda f: -f[1])[:count]:
+            inclusive = self.inclusive[function]
+            lines.append('%8d %5.1f%% %8d %5.1f%%  %s' % (exclusive, 100 * exclusive / total, inclusive, 100 * inclusive / total, function))
+        lines += ['', 'External modules:']
+        for module, samples in sorted(self.external.items(), key=lambda f: -f[1])[:count]:
+            lines.append('%8d %5.1f%%  %s' % (samples, 100 * samples / total, module))
+        return lines
+
+    def save(self, file: str):
+        """ Saves the sample counts as JSON, for comparing between versions of the simulator """
+        with open(file, 'w', encoding='utf-8') as f:
+            json.dump(self.results(), f, indent=2)
+
+    def results(self) -> Dict[str, Any]:
+        return {'version': SAMPLES_VERSION, 'interval': self.interval, 'samples': self.samples, 'exclusive': self.exclusive, 'inclusive': self.inclusive, 'external': self.external}
@@ -0,0 +1,110 @@
+# State shared between the app and the processor process, without pipe I/O in the processor's main loop
+
+from typing import Tuple, Optional, NamedTuple
+from multiprocessing.shared_memory import SharedMemory
+from telemetry import TelemetrySample, SUBSYSTEMS
+
+import numpy
+import constants
+
+
+class ProcessorStats(NamedTuple):
+    frequency: float
+    cpi: float
+    target_frequency: float  # 0 if running at max speed
+    memory: float  # Fraction of each memory which is initialized
+    instruction_memory: float
+    gpu_memory: float
+    telemetry: Optional[TelemetrySample]
+
+
+class SharedState:
+    """
+    A single shared memory block, holding the latest screen, the control port input words, a halt request flag, and the latest stats.
+    Input words and the halt flag are written only by the app, and the screen and stats only by the processor process.
+
+    The screen and stats are each guarded by a sequence number. The writer increments it before and after writing, so a reader which sees an odd number, or a different number after reading, knows the write was incomplete and tries again on the next refresh.
+    """
+
+    # Integer words
+    FRAME_SEQ = 0
+    FRAME = FRAME_SEQ + 1
+    INPUT = FRAME + constants.SCREEN_HEIGHT
+    HALT = INPUT + constants.CONTROL_PORT_WIDTH
+    STATS_SEQ = HALT + 1
+    INT_COUNT = STATS_SEQ + 1
+
+    # Float words
+    STATS = 0
+    TELEMETRY = STATS + 7  # (frequency, cpi, target frequency, memory, instruction memory, gpu memory, has telemetry)
+    FLOAT_COUNT = TELEMETRY + 4 + len(SUBSYSTEMS)  # (seconds, instructions per second, cpi, flushes per second, subsystems...)
+
+    SIZE = 8 * (INT_COUNT + FLOAT_COUNT)
+
+    def __init__(self, name: Optional[str] = None):
+        self.memory = SharedMemory(name, create=name is None, size=SharedState.SIZE)
+        self.ints = numpy.ndarray((SharedState.INT_COUNT,), dtype=numpy.int64, buffer=self.memory.buf)
+        self.floats = numpy.ndarray((SharedState.FLOAT_COUNT,), dtype=numpy.float64, buffer=self.memory.buf, offset=8 * SharedState.INT_COUNT)
+        if name is None:
+            self.ints[:] = 0
+            self.floats[:] = 0
+        self.frame_seq = 0  # The last sequence numbers read by this process
+        self.stats_seq = 0
+
+    def __reduce__(self):
+        # When passed to a spawned process, attach to the same block by name
+        return SharedState, (self.memory.name,)
+
+    def close(self, unlink: bool = False):
+        del self.ints, self.floats  # Views must be released before the block can be closed
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+    def write_frame(self, rows: Tuple[int, ...]):
+        self.ints[SharedState.FRAME_SEQ] += 1
+        self.ints[SharedState.FRAME:SharedState.INPUT] = rows
+        self.ints[SharedState.FRAME_SEQ] += 1
+
+    def read_frame(self) -> Optional[Tuple[int, ...]]:
+        """ Returns the latest screen, if it has changed since the last read """
+        seq = int(self.ints[SharedState.FRAME_SEQ])
+        if seq == self.frame_seq or seq % 2 == 1:
+            return None
+        rows = tuple(int(row) for row in self.ints[SharedState.FRAME:SharedState.INPUT])
+        if seq != self.ints[SharedState.FRAME_SEQ]:
+            return None
+        self.frame_seq = seq
+        return rows
+
+    def set_input(self, index: int, value: int):
+        self.ints[SharedState.INPUT + index] = value
+
+    def get_input(self, index: int) -> int:
+        return int(self.ints[SharedState.INPUT + index])
+
+    def request_halt(self):
+        self.ints[SharedState.HALT] = 1
+
+    def halt_requested(self) -> bool:
+        return self.ints[SharedState.HALT] != 0
+
+    def write_stats(self, stats: ProcessorStats):
+        self.ints[SharedState.STATS_SEQ] += 1
+        self.floats[SharedState.STATS:SharedState.TELEMETRY] = (*stats[:-1], stats.telemetry is not None)
+        if (sample := stats.telemetry) is not None:
+            self.floats[SharedState.TELEMETRY:] = (sample.seconds, sample.instructions_per_second, sample.cpi, sample.flushes_per_second, *(sample.subsystems[name] for name in SUBSYSTEMS))
+        self.ints[SharedState.STATS_SEQ] += 1
+
+    def read_stats(self) -> Optional[ProcessorStats]:
+        """ Returns the latest stats, if they have changed since the last read """
+        seq = int(self.ints[SharedState.STATS_SEQ])
+        if seq == self.stats_seq or seq % 2 == 1:
+            return None
+        *stats, has_telemetry = (float(f) for f in self.floats[SharedState.STATS:SharedState.TELEMETRY])
+        seconds, ips, cpi, fps, *subsystems = (float(f) for f in self.floats[SharedState.TELEMETRY:])
+        if seq != self.ints[SharedState.STATS_SEQ]:
+            return None
+        self.stats_seq = seq
+        telemetry = TelemetrySample(seconds, ips, cpi, fps, dict(zip(SUBSYSTEMS, subsystems))) if has_telemetry else None
+        return ProcessorStats(*stats, telemetry)
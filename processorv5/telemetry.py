@@ -0,0 +1,105 @@
+# Throughput telemetry for the ProcessorV5 model
+# Measures instructions per second, CPI, GPU flushes per second, and the time spent in each subsystem of the processor
+
+from typing import List, Dict, Callable, NamedTuple, Any
+from processor import Processor, ProcessorEvent
+
+import time
+
+
+SUBSYSTEMS = ('decode', 'alu', 'memory', 'gpu', 'devices')
+
+
+class TelemetrySample(NamedTuple):
+    seconds: float
+    instructions_per_second: float
+    cpi: float
+    flushes_per_second: float
+    subsystems: Dict[str, float]  # Fraction of the processor's time spent in each subsystem
+
+    def lines(self) -> List[str]:
+        return [
+            '%.0f inst/s' % self.instructions_per_second,
+            '%.2f CPI' % self.cpi,
+            '%.1f flushes/s' % self.flushes_per_second,
+            *['%s %.0f%%' % (name, 100 * fraction) for name, fraction in self.subsystems.items()]
+        ]
+
+    def format(self) -> str:
+        return ', '.join(self.lines())
+
+
+class Telemetry:
+    """
+    Instruments a single processor instance, by replacing its methods (and those of its GPU and devices) with timed wrappers.
+    Times are exclusive: time spent in a nested subsystem (i.e. a device read during a memory access) is only counted towards the innermost one. 'alu' is the remainder of each tick.
+    Devices must be added to the processor before attaching.
+    """
+
+    def __init__(self, proc: Processor):
+        self.proc = proc
+        self.times: Dict[str, int] = dict.fromkeys(SUBSYSTEMS, 0)
+        self.child_ns = 0  # Time spent in nested timed calls, within the current timed call
+        self.ticks = 0
+        self.flushes = 0
+        self.start_ns = time.perf_counter_ns()
+        self.start_cpi = proc.cpi_instruction_count
+
+    def attach(self) -> 'Telemetry':
+        proc = self.proc
+        proc.tick = self.timed('alu', self.counted(proc.tick))
+        proc.decode = self.timed('decode', proc.decode)
+        proc.decode_overridden = True
+        for name in ('mem_get_operand', 'mem_set_operand', 'mem_get', 'mem_set'):
+            setattr(proc, name, self.timed('memory', getattr(proc, name)))
+        proc.gpu.exec = self.timed('gpu', proc.gpu.exec)
+        for device in proc.devices:
+            for name in ('tick', 'get', 'set'):
+                setattr(device, name, self.timed('devices', getattr(device, name)))
+
+        event_handle = proc.event_handle
+        def counted_event_handle(p: Processor, event_type: ProcessorEvent, arg: Any):
+            if event_type == ProcessorEvent.GFLUSH:
+                self.flushes += 1
+            event_handle(p, event_type, arg)
+        proc.event_handle = counted_event_handle
+        return self
+
+    def timed(self, name: str, method: Callable[..., Any]) -> Callable[..., Any]:
+        def wrapper(*args: Any) -> Any:
+            outer_ns = self.child_ns
+            self.child_ns = 0
+            start_ns = time.perf_counter_ns()
+            try:
+                return method(*args)
+            finally:
+                elapsed_ns = time.perf_counter_ns() - start_ns
+                self.times[name] += elapsed_ns - self.child_ns
+                self.child_ns = outer_ns + elapsed_ns
+        return wrapper
+
+    def counted(self, tick: Callable[[], None]) -> Callable[[], None]:
+        def wrapper():
+            self.ticks += 1
+            tick()
+        return wrapper
+
+    def sample(self) -> TelemetrySample:
+        """ Returns the telemetry since the last sample, and resets all counters """
+        now_ns = time.perf_counter_ns()
+        seconds = max(now_ns - self.start_ns, 1) / 1_000_000_000
+        cpi_count = self.proc.cpi_instruction_count - self.start_cpi
+        total_ns = max(sum(self.times.values()), 1)
+        result = TelemetrySample(
+            seconds,
+            self.ticks / seconds,
+            self.ticks / cpi_count if cpi_count else 0,
+            self.flushes / seconds,
+            {name: t / total_ns for name, t in self.times.items()}
+        )
+
+        self.times = dict.fromkeys(SUBSYSTEMS, 0)
+        self.ticks = self.flushes = 0
+        self.start_ns = now_ns
+        self.start_cpi = self.proc.cpi_instruction_count
+        return result
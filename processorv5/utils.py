@@ -6,6 +6,7 @@ from constants import GPUImageDecoder
 from PIL import Image
 
 import os
+import time
 
 import constants
 
@@ -111,6 +112,20 @@ def write_file(file: str, contents: str):
 def unique_path(file: str) -> str:
     return os.path.normpath(os.path.abspath(file))
 
+def parse_clock_time(value: str) -> int:
+    """ Parses a clock cycle time, i.e. '20ms', '50us', or 'max' for an unthrottled clock, returning the period in ns, or 0 for unthrottled """
+    value = value.strip()
+    if value == 'max':
+        return 0
+    elif value.endswith('ns'):
+        return int(value[:-2])
+    elif value.endswith('us'):
+        return int(value[:-2]) * 1_000
+    elif value.endswith('ms'):
+        return int(value[:-2]) * 1_000_000
+    else:
+        return int(value) * 1_000_000
+
 
 class TextureHelper:
 
@@ -173,6 +188,10 @@ class ImageBuffer:
             return row[x]
         return '.'
 
+    def pack(self) -> Tuple[int, ...]:
+        """ Packs the screen area of the buffer into one integer per row, where bit x is set if the pixel (x, y) is on """
+        return tuple(sum(1 << x for x in range(constants.SCREEN_WIDTH) if self[x, y] == '#') for y in range(constants.SCREEN_HEIGHT))
+
 
 class ConnectionManager:
     """
@@ -203,6 +222,44 @@ class ConnectionManager:
             self.pipe = None
 
 
+class ClockScheduler:
+    """
+    Paces a simulated clock against real time, without pinning a core.
+    Ticks are run in batches of all ticks due, and between batches the scheduler sleeps for the bulk of the remaining time, and only spins for the final SPIN_NS.
+    For clock periods shorter than MIN_BATCH_NS, ticks are allowed to accumulate into batches, as sleeping for less than a period is not accurate.
+    Ticks are scheduled from a fixed origin, so errors in sleeps do not accumulate, but if the simulation falls more than MAX_LAG_NS behind, the schedule is reset rather than catching up in a burst.
+    """
+
+    SPIN_NS = 200_000
+    MIN_BATCH_NS = 2_000_000
+    MAX_BATCH_NS = 10_000_000  # The most time worth of ticks in a single batch, so that the caller can still regularly poll for events
+    MAX_LAG_NS = 100_000_000
+
+    def __init__(self, period_ns: int):
+        self.period_ns = period_ns
+        self.max_batch = max(1, ClockScheduler.MAX_BATCH_NS // period_ns)
+        self.slack_ns = max(0, ClockScheduler.MIN_BATCH_NS - period_ns)
+        self.next_ns = time.perf_counter_ns()
+
+    def ticks_due(self) -> int:
+        now = time.perf_counter_ns()
+        if now - self.next_ns > ClockScheduler.MAX_LAG_NS:
+            self.next_ns = now
+        if now < self.next_ns:
+            return 0
+        count = min(self.max_batch, 1 + (now - self.next_ns) // self.period_ns)
+        self.next_ns += count * self.period_ns
+        return count
+
+    def wait(self):
+        wake_ns = self.next_ns + self.slack_ns
+        remaining = wake_ns - time.perf_counter_ns()
+        if remaining > ClockScheduler.SPIN_NS:
+            time.sleep((remaining - ClockScheduler.SPIN_NS) / 1_000_000_000)
+        while time.perf_counter_ns() < wake_ns:
+            pass
+
+
 class KeyDebouncer:
     """ Debounces key events for Tkinter, so press-and-hold works. Modified from https://github.com/adamheins/tk-debouncer """
 
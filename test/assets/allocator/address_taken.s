@@ -0,0 +1,17 @@
+# Arrays, words used as an immediate or with an index, and words that are never read by name, keep their own address
+word [2] array
+word pointer
+word indexed
+word written
+word x, y
+
+main:
+    seti @written 1
+    seti @pointer array
+    seti @@pointer 5
+    seti @indexed[0] 6
+    set @x @indexed
+    addi @y @x 1
+    assert @y = 7
+    assert @array[0] = 5
+    halt
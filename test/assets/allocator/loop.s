@@ -0,0 +1,14 @@
+# Words live around a loop interfere with all words defined in the loop
+word i, sum, square, unused_after
+
+main:
+    seti @i 0
+    seti @sum 0
+loop:
+    mul @square @i @i
+    add @sum @sum @square
+    addi @i @i 1
+    blti @i 4 loop
+    set @unused_after @sum
+    assert @unused_after = 14
+    halt
@@ -0,0 +1,23 @@
+# Scratch words local to two routines can share addresses, but not with words live across the calls
+word total
+word a_temp, a_result
+word b_temp, b_result
+
+main:
+    seti @total 0
+    call routine_a
+    add @total @total @a_result
+    call routine_b
+    add @total @total @b_result
+    assert @total = 18
+    halt
+
+routine_a:
+    seti @a_temp 3
+    muli @a_result @a_temp 2
+    ret
+
+routine_b:
+    seti @b_temp 4
+    muli @b_result @b_temp 3
+    ret
@@ -0,0 +1,17 @@
+# Flushes two frames in quick succession, so the second is still pending when the processor faults
+
+word x
+
+sprite PIXEL `
+#
+`
+
+main:
+    gcb G_CLEAR
+    gflush
+    glsi PIXEL
+    gmv r0 r0
+    gcb G_DRAW_ALPHA
+    gflush
+    add r1 @x r0  # Uninitialized
+    halt
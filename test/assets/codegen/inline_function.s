@@ -0,0 +1,15 @@
+main:
+    seti r1 0
+    br start
+
+inline count_to_three:
+loop:
+    addi r1 r1 1
+    blti r1 3 loop
+    ret
+
+start:
+    call count_to_three
+    seti r1 1
+    call count_to_three
+    halt
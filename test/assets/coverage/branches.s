@@ -0,0 +1,15 @@
+# One branch is only ever taken, one is never taken, and one goes both ways
+
+word count
+
+main:
+    seti @count 0
+loop:
+    addi @count @count 1
+    blti @count 3 loop
+    beqi @count 0 never
+    bgti @count 0 always
+never:
+    seti @count 10
+always:
+    halt
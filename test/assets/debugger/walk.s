@@ -0,0 +1,39 @@
+# A random walk, which stores each step, and draws its position every few steps
+
+alias PORT_RANDOM 4000
+
+word RNG, position, steps
+word [40] history
+
+sprite PIXEL `
+#
+`
+
+main:
+    seti @RNG PORT_RANDOM
+    seti @position 16
+    seti @steps 0
+
+loop:
+    andi r1 @@RNG 1
+    beqi r1 0 left
+    addi @position @position 1
+    beq r0 r0 moved
+left:
+    subi @position @position 1
+moved:
+    andi @position @position 31
+    addi r2 @steps history
+    set @r2 @position
+
+    andi r1 @steps 3
+    bnei r1 0 next
+    gcb G_CLEAR
+    glsi PIXEL
+    gmv @position r0
+    gcb G_DRAW_ALPHA
+    gflush
+next:
+    addi @steps @steps 1
+    blti @steps 40 loop
+    halt
@@ -0,0 +1,34 @@
+# Counts frames until X is pressed, and fails an assertion if X is pressed on a frame where a random value is odd
+
+alias PORT_CONTROL_X 2000
+alias PORT_RANDOM 4000
+
+word RNG, CONTROL_X
+word frames
+
+sprite PIXEL `
+#
+`
+
+main:
+    seti @RNG PORT_RANDOM
+    seti @CONTROL_X PORT_CONTROL_X
+    seti @frames 0
+
+loop:
+    andi r1 @@RNG 1
+    beqi @@CONTROL_X 1 pressed
+
+    gcb G_CLEAR
+    glsi PIXEL
+    gmv @frames r0
+    gcb G_DRAW_ALPHA
+    gflush
+
+    addi @frames @frames 1
+    blti @frames 30 loop
+    halt
+
+pressed:
+    assert r1 = 0
+    halt
@@ -0,0 +1,20 @@
+main:
+    seti r1 1
+    seti r2 2
+    blt r1 r2 first
+    bgt r1 r2 other
+    bne r1 r2 late
+    call first
+    seti r3 3
+first:
+    br second
+other:
+    seti r3 4
+second:
+    br third
+late:
+    seti r3 5
+third:
+    blt r1 r2 main
+loop:
+    br loop
@@ -0,0 +1,12 @@
+main:
+    br start
+
+include "./dead_code_library.s"
+
+start:
+    seti r1 1
+    call used
+    print [ "used %d" r2 ]
+    halt
+    print [ "dead %d" r1 ]
+    br start
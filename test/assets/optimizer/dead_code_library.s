@@ -0,0 +1,13 @@
+# A library of routines, of which only some are used
+inline unused_inline:
+    seti r9 9
+    ret
+
+used:
+    seti r2 2
+    ret
+
+unused:
+    seti r3 3
+    call unused_inline
+    ret
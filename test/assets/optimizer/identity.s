@@ -0,0 +1,20 @@
+main:
+    seti r1 1
+    seti r2 2
+    seti r3 3
+    seti r4 4
+    seti r5 5
+    seti r6 6
+    noop
+    add r1 r1 r0
+    add r2 r0 r2
+    sub r3 r3 r0
+    addi r4 r4 0
+    muli r5 r5 1
+    set r6 r6
+    add r7 r8 r0
+    addi @r1 @r1 0
+    seti r0 5
+    addi r9 r9 0
+    add r0 r10 r0
+    halt
@@ -0,0 +1,15 @@
+main:
+    seti r1 1
+    seti r2 2
+    seti r3 3
+    br next
+next:
+    beq r1 r2 after
+after:
+    bne @r1 r2 last
+last:
+    beqi r3 5 end
+end:
+    beq r4 r5 uninitialized
+uninitialized:
+    halt
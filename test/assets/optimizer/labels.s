@@ -0,0 +1,10 @@
+main:
+    seti r1 1
+    noop
+skip:
+    noop
+    br done
+    seti r1 2
+done:
+    bnei r1 1 skip
+    halt
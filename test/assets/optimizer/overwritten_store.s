@@ -0,0 +1,10 @@
+main:
+    seti r1 1
+    seti r1 2
+    seti r1 3
+    addi r2 r1 1
+    add r2 r2 r1
+    seti r3 1
+    set @r4 r3
+    seti r3 4
+    halt
@@ -0,0 +1,22 @@
+main:
+    bgt r1 r0 skip
+    seti r2 1
+    seti r3 1
+skip:
+    addi r2 r2 0
+    addi r3 r3 0
+    call function
+    addi r4 r4 0
+    seti r5 1
+    seti r6 1
+    beq r5 r6 first
+    halt
+first:
+    beq r7 r7 done  # Faults, as r7 is uninitialized
+    halt
+done:
+    halt
+function:
+    seti r4 1
+    set r3 r3
+    ret
@@ -0,0 +1,9 @@
+main:
+    beq r0 r0 next  # Taken, to the next instruction
+next:
+    bne r0 r0 main  # Not taken
+    call function  # Calls the next instruction
+function:
+    seti ra 5
+    ret  # Returns to the next instruction
+    halt
@@ -0,0 +1,36 @@
+# Each frame draws a pixel at a random position, and a second pixel which moves right while X is held
+
+alias PORT_CONTROL_X 2000
+alias PORT_RANDOM 4000
+
+word RNG, CONTROL_X
+word x, y, player, frames
+
+sprite PIXEL `
+#
+`
+
+main:
+    seti @RNG PORT_RANDOM
+    seti @CONTROL_X PORT_CONTROL_X
+    seti @player 0
+    seti @frames 0
+
+loop:
+    andi @x @@RNG 0b11111
+    andi @y @@RNG 0b11111
+    add @player @player @@CONTROL_X
+    andi @player @player 0b11111
+
+    gcb G_CLEAR
+    glsi PIXEL
+    gmv @x @y
+    gcb G_DRAW_ALPHA
+    glsi PIXEL
+    gmv @player r0
+    gcb G_DRAW_ALPHA
+    gflush
+
+    addi @frames @frames 1
+    blti @frames 20 loop
+    halt
@@ -0,0 +1,13 @@
+# Loops, then reads an uninitialized address
+alias count 1
+alias total 2
+main:
+    seti @count 5
+    seti @total 0
+loop:
+    subi @count @count 1
+    add @total @total @count
+    bnei @count 0 loop
+    seti @total 900
+    set @3 @@total
+    halt
@@ -0,0 +1,48 @@
+from phases import Scanner, Parser, Allocator
+from assembler import Assembler
+from processor import Processor
+
+import utils
+import pytest
+import testfixtures
+
+
+def test_address_taken(): allocate('address_taken')
+def test_loop(): allocate('loop')
+def test_routines(): allocate('routines')
+
+def test_run_address_taken(): run('address_taken')
+def test_run_loop(): run('loop')
+def test_run_routines(): run('routines')
+
+
+def allocate(file: str):
+    file = 'assets/allocator/%s.s' % file
+    scan_text = utils.read_or_create_empty(file)
+    scanner = Scanner(scan_text)
+
+    assert scanner.scan()
+
+    parser = Parser(scanner.output_tokens, file=file, enable_assertions=True, allow_memory_overflow=True)
+
+    assert parser.parse()
+
+    allocator = Allocator(parser)
+    allocator.allocate()
+    actual_text = ''.join(allocator.memory_map()) + allocator.report() + '\n'
+    utils.write_file(file.replace('.s', '.out'), actual_text)
+    expected_text = utils.read_or_create_empty(file.replace('.s', '.trace'))
+
+    testfixtures.compare(actual=actual_text, expected=expected_text)
+
+
+def run(file: str):
+    # Programs with overlapping words must still pass all their assertions
+    file = 'assets/allocator/%s.s' % file
+    text = utils.read_file(file)
+    asm = Assembler(file, text, enable_assertions=True, enable_allocation=True)
+
+    assert asm.assemble(), asm.error
+
+    proc = Processor(asm.code, asm.sprites, exception_handle=lambda p, e: pytest.fail(str(e) + '\n\n' + p.debug_view(), False))
+    proc.run()
@@ -0,0 +1,40 @@
+from typing import List, Tuple, Any
+from queue import Queue
+from multiprocessing import Pipe
+from app import A2C_PROGRESS, A2C_RESULT, P2C_HALT, assemble_program, manage_processor
+from assembler import Assembler
+from processor import ProgramImage
+from shared import SharedState
+from utils import ImageBuffer
+
+import utils
+
+
+def test_assemble_progress():
+    messages = assemble('assets/debugger/walk.s')
+    assert messages[:-1] == [(1, A2C_PROGRESS, phase) for phase in ('Scanning', 'Parsing', 'Generating code')]
+    assembly_id, key, asm, error = messages[-1]
+    assert (assembly_id, key, error) == (1, A2C_RESULT, None) and asm.code
+
+def test_assemble_error():
+    assert assemble('assets/missing.s') == [(1, A2C_RESULT, None, 'Error loading from file: assets/missing.s')]
+
+def test_fault_writes_pending_frame(capsys):
+    file = 'assets/app/fault_after_gflush.s'
+    asm = Assembler(file, utils.read_file(file))
+    assert asm.assemble()
+    state = SharedState()
+    parent, child = Pipe()
+    try:
+        manage_processor(ProgramImage.create(asm.code, asm.sprites), 0, child, state)
+        assert state.read_frame() == ImageBuffer.unpack(asm.sprites[0]).pack()  # The second frame, not the cleared first one
+        assert parent.recv() == (P2C_HALT,)
+        assert 'Uninitialized' in capsys.readouterr().out
+    finally:
+        state.close(unlink=True)
+
+
+def assemble(path: str) -> List[Tuple[Any, ...]]:
+    queue: Queue = Queue()
+    assemble_program(path, 1, queue)
+    return [queue.get_nowait() for _ in range(queue.qsize())]
@@ -0,0 +1,36 @@
+from benchmark import Result, WORKLOADS, measure, compare, save, load
+
+import pytest
+
+
+def test_workloads():
+    for workload in WORKLOADS.values():
+        result = measure(workload, scale=0.01, repeat=1)
+        assert result.units > 0 and result.rate > 0 and result.peak_memory > 0, result
+
+def test_reproducible():
+    assert measure(WORKLOADS['model'], scale=0.1, repeat=1).units == measure(WORKLOADS['model'], scale=0.1, repeat=1).units == 31
+
+def test_save_load(tmp_path):
+    save(str(tmp_path / 'baseline.json'), [result()], 0.5, 2)
+    baseline = load(str(tmp_path / 'baseline.json'))
+    assert (baseline['scale'], baseline['repeat']) == (0.5, 2)
+    assert Result(**baseline['results']['execute']) == result()
+
+def test_compare_within_tolerance(): assert compare([result(rate=95, peak_memory=1050)], baseline(), 0.1) == []
+def test_compare_slower(): assert compare([result(rate=80)], baseline(), 0.1) == ['execute is 20.0% slower, 80.0 ticks/s against 100.0']
+def test_compare_memory(): assert compare([result(peak_memory=1500)], baseline(), 0.1) == ['execute uses 50.0% more memory, 1500 bytes against 1000']
+def test_compare_missing(): assert compare([result(name='gpu', rate=1)], baseline(), 0.1) == []
+
+def test_load_version(tmp_path):
+    (tmp_path / 'baseline.json').write_text('{"version": 0}')
+    with pytest.raises(ValueError):
+        load(str(tmp_path / 'baseline.json'))
+
+
+def result(name: str = 'execute', rate: float = 100, peak_memory: int = 1000) -> Result:
+    return Result(name, 'ticks', 100, 100 / rate, rate, peak_memory)
+
+
+def baseline():
+    return {'results': {'execute': result()._asdict()}}
@@ -0,0 +1,89 @@
+from typing import Tuple
+from numpy import int32
+from assembler import Assembler
+from processor import Processor
+from breakpoints import WatchKind, compile_condition
+from debugger import TimeTravelDebugger
+
+import utils
+import pytest
+
+
+def test_condition_arithmetic(): assert evaluate('1 + 2 * 3 - (4 << 1)') == -1
+def test_condition_logical(): assert evaluate('r1 == 30 && !r2 || 0') == 1
+def test_condition_bitwise(): assert evaluate('0xF0 & ~0x30 | 1 ^ 3') == 0xC2
+def test_condition_memory(): assert evaluate('@x + @30') == 14
+def test_condition_array(): assert evaluate('@x[1]') == 9
+def test_condition_indirect(): assert evaluate('@r1 == 7 && @(r1 + 1) == 9 && @@1 == 7') == 1
+def test_condition_uninitialized(): assert evaluate('@900 + @5000') == 0
+def test_condition_value(): assert evaluate('value * 2', 21) == 42
+
+def test_condition_errors():
+    for text in ('1 +', '(1', '1 2', 'x', 'foo', '$'):
+        with pytest.raises(ValueError):
+            compile_condition(text, {30: 'x'})
+
+def test_breakpoint():
+    debugger, asm = create()
+    debugger.breakpoints.add_breakpoint(debugger.labels['next'], compile_condition('@steps == 12', asm.memory_table))
+    debugger.run()
+    assert debugger.proc.pc == debugger.labels['next'] and debugger.proc.memory[address_of(asm, 'steps')] == 12
+    assert debugger.breakpoints.hit is not None
+
+    debugger.run()  # Continues past the breakpoint, to the end
+    assert not debugger.proc.running and debugger.breakpoints.hit is None
+
+def test_watch_write():
+    debugger, asm = create()
+    debugger.breakpoints.add_watchpoint(address_of(asm, 'steps'), WatchKind.WRITE, compile_condition('value == 7'))
+    debugger.run()
+    assert debugger.proc.memory[address_of(asm, 'steps')] == 7  # Stops after the write
+
+def test_watch_change():
+    debugger, asm = create()
+    debugger.breakpoints.add_watchpoint(address_of(asm, 'steps'), WatchKind.CHANGE)
+    debugger.run()
+    assert debugger.tick == 3  # The initial write of 0 is a change from uninitialized
+
+def test_watch_read():
+    debugger, asm = create()
+    debugger.breakpoints.add_watchpoint(address_of(asm, 'RNG'), WatchKind.READ)
+    debugger.run()
+    assert debugger.tick == 4 and debugger.breakpoints.hit.value == 4000
+
+def test_goto_ignores_breakpoints():
+    debugger, asm = create()
+    debugger.run(200)
+    debugger.breakpoints.add_watchpoint(address_of(asm, 'steps'), WatchKind.WRITE)
+    debugger.goto(100)
+    assert debugger.tick == 100 and debugger.breakpoints.hit is None
+
+def test_remove():
+    debugger, asm = create()
+    point = debugger.breakpoints.add_watchpoint(address_of(asm, 'steps'), WatchKind.WRITE)
+    assert 'mem_set' in vars(debugger.proc)
+    assert debugger.breakpoints.remove(point.id)
+    assert 'mem_set' not in vars(debugger.proc)  # The unwatched path has no hooks
+    debugger.run()
+    assert not debugger.proc.running
+
+
+def evaluate(text: str, value: int = 0) -> int:
+    proc = Processor([0])
+    proc.memory[1] = int32(30)
+    proc.memory[30], proc.memory[31] = int32(7), int32(9)
+    return compile_condition(text, {30: 'x', 31: 'x[1]'})(proc, value)
+
+
+def create() -> Tuple[TimeTravelDebugger, Assembler]:
+    file = 'assets/debugger/walk.s'
+    asm = Assembler(file, utils.read_file(file))
+
+    assert asm.assemble(), asm.error
+
+    proc = Processor(asm.code, asm.sprites, random_seed=3)
+    return TimeTravelDebugger(proc, asm.label_table, interval=10).start(), asm
+
+
+def address_of(asm: Assembler, name: str) -> int:
+    return next(addr for addr, n in asm.memory_table.items() if n == name)
@@ -0,0 +1,81 @@
+from typing import List
+from build import Build, BuildOptions
+from assembler import Assembler
+
+import os
+import shutil
+import utils
+import assembler
+
+
+OPTIONS = BuildOptions(True, True, False, False, False, False, False, False, False)
+
+
+def test_build(tmp_path):
+    roots = create(tmp_path)
+    build = run(roots, tmp_path)
+    assert not build.up_to_date and sorted(build.built) == sorted(roots)
+
+def test_up_to_date(tmp_path):
+    roots = create(tmp_path)
+    run(roots, tmp_path)
+    build = run(roots, tmp_path)
+    assert not build.built and sorted(build.up_to_date) == sorted(roots)
+
+def test_include_changed(tmp_path):
+    roots = create(tmp_path)
+    run(roots, tmp_path)
+    (tmp_path / 'shared.s').write_text('alias VALUE 8\n')
+    assert sorted(run(roots, tmp_path).built) == sorted(roots[:2])
+
+def test_texture_changed(tmp_path):
+    roots = create(tmp_path)
+    run(roots, tmp_path)
+    shutil.copy('assets/textures/background.png', tmp_path / 'numbers.png')
+    assert run(roots, tmp_path).built == [roots[1]]
+
+def test_force(tmp_path):
+    roots = create(tmp_path)
+    run(roots, tmp_path)
+    build = run(roots, tmp_path, force=True)
+    assert not build.up_to_date and sorted(build.built) == sorted(roots)
+
+def test_parallel(tmp_path):
+    roots = create(tmp_path)
+    build = run(roots, tmp_path, jobs=2)
+    assert sorted(build.built) == sorted(roots)
+
+def test_outputs_match_assembler(tmp_path):
+    roots = create(tmp_path)
+    run(roots, tmp_path)
+    for root in roots:
+        asm = Assembler(root, utils.read_file(root))
+        assert asm.assemble(), asm.error
+        assembler.write_outputs(asm, root + '.expected', OPTIONS.output_binary, OPTIONS.output_viewable)
+        for ext in OPTIONS.outputs():
+            with open(root + ext, 'rb') as actual, open(root + '.expected' + ext, 'rb') as expected:
+                assert actual.read() == expected.read(), root + ext
+
+def test_error(tmp_path):
+    roots = create(tmp_path)
+    (tmp_path / 'shared.s').write_text('alias VALUE\n')
+    build = Build(roots, OPTIONS, str(tmp_path / 'cache.json'))
+    build.scan()
+    assert [root for root, _ in build.build()] == roots[:2] and build.built == [roots[2]]
+
+
+def create(tmp_path) -> List[str]:
+    """ Two roots which include a shared file, one of which also references a texture, and an independent root """
+    shutil.copy('assets/textures/7seg_numbers.png', tmp_path / 'numbers.png')
+    (tmp_path / 'shared.s').write_text('alias VALUE 7\n')
+    (tmp_path / 'first.s').write_text('include "./shared.s"\n\nseti r1 VALUE\nhalt\n')
+    (tmp_path / 'second.s').write_text('include "./shared.s"\n\ntexture TEX_NUMBERS "./numbers.png"\nsprite SPRITE_ZERO TEX_NUMBERS [ 0 0 3 5 ]\n\nseti r2 VALUE\ngcb G_DRAW\ngflush\nhalt\n')
+    (tmp_path / 'third.s').write_text('seti r3 3\nhalt\n')
+    return [utils.unique_path(str(tmp_path / name)) for name in ('first.s', 'second.s', 'third.s')]
+
+
+def run(roots: List[str], tmp_path, jobs: int = 1, force: bool = False) -> Build:
+    build = Build(roots, OPTIONS, str(tmp_path / 'cache.json'))
+    build.scan()
+    assert build.build(jobs, force) == []
+    return build
@@ -6,6 +6,7 @@ import testfixtures
 
 
 def test_empty(): gen('empty')
+def test_inline_function(): gen('inline_function')
 def test_instructions_type_a(): gen('instructions_type_a')
 def test_instructions_type_ar(): gen('instructions_type_ar')
 def test_instructions_type_b(): gen('instructions_type_b')
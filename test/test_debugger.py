@@ -0,0 +1,89 @@
+from typing import Tuple, Any
+from assembler import Assembler
+from processor import Processor, ProcessorEvent
+from debugger import TimeTravelDebugger
+
+import utils
+
+
+def test_goto():
+    debugger, _ = create()
+    expected = []
+    while debugger.step(25) == 25:
+        expected.append(state(debugger.proc))
+
+    for i in reversed(range(len(expected))):
+        debugger.goto(25 * (i + 1))
+        assert state(debugger.proc) == expected[i]
+
+def test_step_back():
+    debugger, _ = create()
+    debugger.step(100)
+    pc = int(debugger.proc.pc)
+    debugger.step()
+    debugger.step_back()
+    assert (debugger.tick, int(debugger.proc.pc)) == (100, pc)
+    debugger.step_back(1000)
+    assert (debugger.tick, int(debugger.proc.pc)) == (0, 0)
+
+def test_run_back_to_write():
+    debugger, asm = create()
+    debugger.run()
+    steps = address_of(asm, 'steps')
+    assert debugger.run_back_to_write(steps)
+    assert debugger.proc.pc == debugger.labels['next']  # About to execute the last write
+    assert debugger.proc.memory[steps] == 39
+    debugger.step()
+    assert debugger.proc.memory[steps] == 40
+
+def test_run_back_to_write_none():
+    debugger, _ = create()
+    debugger.step(100)
+    assert not debugger.run_back_to_write(900)
+    assert debugger.tick == 100
+
+def test_run_to_label():
+    debugger, _ = create()
+    assert debugger.run_to_label('left')
+    assert debugger.proc.pc == debugger.labels['left']
+
+def test_events_posted_once():
+    debugger, _ = create()
+    debugger.run()
+    debugger.goto(0)
+    debugger.run()
+    assert debugger.event_handle.frames == 10
+
+def test_snapshot_pages_shared():
+    debugger, _ = create()
+    debugger.run()
+    first, second = debugger.snapshots[-2:]
+    assert sum(a is b for a, b in zip(first.pages, second.pages)) == len(first.pages) - 1  # Only the program's own page was written
+
+
+def create() -> Tuple[TimeTravelDebugger, Assembler]:
+    file = 'assets/debugger/walk.s'
+    asm = Assembler(file, utils.read_file(file))
+
+    assert asm.assemble(), asm.error
+
+    proc = Processor(asm.code, asm.sprites, event_handle=FlushCounter(), random_seed=3)
+    return TimeTravelDebugger(proc, asm.label_table, interval=10).start(), asm
+
+
+def state(proc: Processor) -> Tuple[Any, ...]:
+    return list(proc.memory), int(proc.pc), int(proc.counter.tick_count), proc.gpu.screen.pack(), proc.rng.save_state()[1:]
+
+
+def address_of(asm: Assembler, name: str) -> int:
+    return next(addr for addr, n in asm.memory_table.items() if n == name)
+
+
+class FlushCounter:
+
+    def __init__(self):
+        self.frames = 0
+
+    def __call__(self, proc: Processor, event_type: ProcessorEvent, arg: Any):
+        if event_type == ProcessorEvent.GFLUSH:
+            self.frames += 1
@@ -0,0 +1,37 @@
+from assembler import Assembler, write_outputs
+from argparse import Namespace
+
+import io
+import utils
+import pytest
+import disassembler
+
+
+def test_viewable_matches_decode():
+    asm = assemble('fibonacci')
+    f = io.StringIO()
+    disassembler.write_viewable(f, asm.code, asm.print_table, asm.memory_table, asm.label_table)
+    lines = f.getvalue().split('\n')[:-1]
+    assert [line.split(' | ', 1)[1] for line in lines] == disassembler.decode(asm.code, asm.print_table, asm.memory_table, asm.label_table)
+    assert all(int(line[:32] + line[33:65], 2) == c for line, c in zip(lines, asm.code))
+
+def test_object_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(disassembler, 'OBJECT_CHUNK_SIZE', 3)  # Spans multiple chunks
+    asm = assemble('fibonacci')
+    write_outputs(asm, str(tmp_path / 'fibonacci'), output_binary=True)
+    with open(tmp_path / 'fibonacci.o', 'rb') as f:
+        assert list(disassembler.read_object(f)) == asm.code
+
+    disassembler.main(Namespace(file=str(tmp_path / 'fibonacci.o'), out=None))
+    assert utils.read_file(str(tmp_path / 'fibonacci.v')) == ''.join(disassembler.viewable_lines(asm.code))
+
+def test_object_file_truncated():
+    with pytest.raises(ValueError):
+        list(disassembler.read_object(io.BytesIO(bytes(12))))
+
+
+def assemble(file: str) -> Assembler:
+    file = 'assets/processor/%s.s' % file
+    asm = Assembler(file, utils.read_file(file), enable_assertions=True)
+    assert asm.assemble(), asm.error
+    return asm
@@ -0,0 +1,51 @@
+from assembler import Assembler
+from processor import Processor
+from execution_trace import ExecutionTrace, Trace, NO_WRITE
+from disassembler import Disassembler
+from runner import Runner
+
+import utils
+import testfixtures
+
+
+def test_format():
+    asm = assemble('fault')
+    trace = run(asm, 8).trace()
+    actual_text = '\n'.join(trace.format(trace.entries, Disassembler(asm.code, asm.print_table, asm.memory_table, asm.label_table))) + '\n'
+    utils.write_file('assets/trace/fault.out', actual_text)
+    expected_text = utils.read_or_create_empty('assets/trace/fault.trace')
+
+    testfixtures.compare(actual=actual_text, expected=expected_text)
+
+def test_ring_buffer():
+    trace = run(assemble('fault'), 8).trace()
+    assert trace.count == 19
+    assert [e.index for e in trace.entries] == list(range(11, 19))
+    assert trace.entries[-1].pc == 6 and trace.entries[-1].addr == NO_WRITE  # The faulting read
+    assert (trace.entries[-2].addr, trace.entries[-2].value) == (2, 900)
+
+def test_not_full():
+    trace = run(assemble('fault'), 100).trace()
+    assert [e.index for e in trace.entries] == list(range(19))
+    assert trace.entries[0].pc == 0
+
+def test_save_load(tmp_path):
+    trace = run(assemble('fault'), 8).trace()
+    trace.save(str(tmp_path / 'fault.bin'))
+    loaded = Trace.load(str(tmp_path / 'fault.bin'))
+    assert loaded.entries == trace.entries
+    assert (loaded.code_hash, loaded.count) == (trace.code_hash, trace.count)
+
+
+def run(asm: Assembler, size: int) -> ExecutionTrace:
+    proc = Processor(asm.code, asm.sprites)
+    trace = ExecutionTrace(proc, size).attach()
+    assert not Runner(proc).run()  # Faults on an uninitialized read
+    return trace
+
+
+def assemble(file: str) -> Assembler:
+    file = 'assets/trace/%s.s' % file
+    asm = Assembler(file, utils.read_file(file))
+    assert asm.assemble(), asm.error
+    return asm
@@ -0,0 +1,39 @@
+from typing import List
+from assembler import Assembler
+from processor import ProgramImage
+from farm import FarmJob, FarmResult, run_farm, load_inputs
+
+import utils
+
+
+def test_no_inputs():
+    results = farm([FarmJob('none', seed, ()) for seed in range(2)])
+    assert [(r.reason, r.frames) for r in results] == [('halt', 30), ('halt', 30)]
+    assert results[0].screen_hash == results[1].screen_hash
+
+def test_inputs_and_seeds():
+    results = farm([FarmJob('x', seed, [(50, 0, 1)]) for seed in range(4)])
+    assert [(r.reason, r.frames) for r in results] == [('error', 6), ('halt', 6), ('error', 6), ('halt', 6)]  # Stops on the first frame X is pressed
+    assert results[0].error == 'Assert Failed: Assertion Failed at assert r1 = 0 (got 1)'
+
+def test_workers():
+    jobs = [FarmJob(name, seed, inputs) for name, inputs in (('none', ()), ('x', [(50, 0, 1)])) for seed in range(4)]
+    assert farm(jobs, workers=2) == farm(jobs)
+
+def test_timeout():
+    result, *_ = farm([FarmJob('none', 0, ())], max_ticks=100)
+    assert (result.reason, result.ticks) == ('timeout', 100)
+
+def test_load_inputs(tmp_path):
+    file = tmp_path / 'inputs.txt'
+    file.write_text('# Comment\n20 Up 1\n10 x 1  # Out of order\n\n30 up 0\n')
+    assert load_inputs(str(file)) == [(10, 0, 1), (20, 1, 1), (30, 1, 0)]
+
+
+def farm(jobs, workers: int = 1, max_ticks: int = 10000) -> List[FarmResult]:
+    file = 'assets/farm/fuzz.s'
+    asm = Assembler(file, utils.read_file(file), enable_assertions=True)
+
+    assert asm.assemble(), asm.error
+
+    return run_farm(ProgramImage.create(asm.code, asm.sprites, asm.print_table), jobs, workers, max_ticks)
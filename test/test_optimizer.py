@@ -0,0 +1,57 @@
+from phases import Scanner, Parser, CodeGen, Optimizer
+from assembler import Assembler
+from processor import Processor
+
+import utils
+import pytest
+import disassembler
+import testfixtures
+
+
+def test_branch_chain(): optimize('branch_chain')
+def test_dead_code(): optimize('dead_code')
+def test_identity(): optimize('identity')
+def test_jump_to_next(): optimize('jump_to_next')
+def test_labels(): optimize('labels')
+def test_overwritten_store(): optimize('overwritten_store')
+def test_uninitialized(): optimize('uninitialized')
+
+def test_run_branch_backwards(): run('branch_backwards')
+def test_run_call_return(): run('call_return')
+def test_run_call_return_nested(): run('call_return_nested')
+def test_run_call_return_special_constant(): run('call_return_special_constant')
+def test_run_fibonacci(): run('fibonacci')
+
+
+def optimize(file: str):
+    file = 'assets/optimizer/%s.s' % file
+    scan_text = utils.read_or_create_empty(file)
+    scanner = Scanner(scan_text)
+
+    assert scanner.scan()
+
+    parser = Parser(scanner.output_tokens, file=file, enable_print=True)
+
+    assert parser.parse()
+
+    optimizer = Optimizer(parser)
+    optimizer.optimize()
+    codegen = CodeGen(parser)
+    codegen.gen()
+    actual_text = '\n'.join(disassembler.decode(codegen.output_code, codegen.print_table, label_table=parser.label_table())) + '\n' + optimizer.report() + '\n'
+    utils.write_file(file.replace('.s', '.out'), actual_text)
+    expected_text = utils.read_or_create_empty(file.replace('.s', '.trace'))
+
+    testfixtures.compare(actual=actual_text, expected=expected_text)
+
+
+def run(file: str):
+    # Optimized programs must still pass all their assertions
+    file = 'assets/processor/%s.s' % file
+    text = utils.read_file(file)
+    asm = Assembler(file, text, enable_assertions=True, enable_optimizations=True)
+
+    assert asm.assemble(), asm.error
+
+    proc = Processor(asm.code, asm.sprites, exception_handle=lambda p, e: pytest.fail(str(e) + '\n\n' + p.debug_view(), False))
+    proc.run()
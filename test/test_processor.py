@@ -1,7 +1,11 @@
 from assembler import Assembler
-from processor import Processor
+from typing import List, Tuple, Callable, Any
+from processor import Processor, RandomDevice, ProgramImage, ProcessorHook
+from constants import Opcodes
 
 import utils
+import pickle
+import disassembler
 import pytest
 
 
@@ -21,8 +25,91 @@ def test_operators_arithmetic_immediate(): run('operators_arithmetic_immediate')
 def test_operators_logical(): run('operators_logical')
 def test_operators_logical_immediate(): run('operators_logical_immediate')
 
+def test_random_seeded():
+    assert random_words(RandomDevice(5), 3000) == random_words(RandomDevice(5), 3000)  # Spans multiple blocks
+    assert random_words(RandomDevice(5), 100) != random_words(RandomDevice(6), 100)
 
-def run(file: str):
+def test_random_start():
+    rng = RandomDevice(5)
+    first = random_words(rng, 100)
+    rng.start()
+    assert random_words(rng, 100) == first
+
+def test_program_image():
+    file = 'assets/processor/gpu_composer.s'
+    asm = Assembler(file, utils.read_file(file), enable_assertions=True)
+
+    assert asm.assemble(), asm.error
+
+    image: ProgramImage = pickle.loads(pickle.dumps(ProgramImage.create(asm.code, asm.sprites, asm.print_table, 5)))
+    proc = image.processor(exception_handle=lambda p, e: pytest.fail(str(e) + '\n\n' + p.debug_view(), False))
+    assert proc.instructions == Processor(asm.code).instructions
+    assert proc.rng.seed == 5
+    proc.run()
+
+def test_no_hooks():
+    proc = run('call_return')
+    assert not {'tick', 'decode', 'mem_get', 'mem_set'} & set(vars(proc))  # Default path is not instrumented
+
+def test_hook_instruction():
+    pcs = []
+    run('call_return_nested', [(ProcessorHook.INSTRUCTION, lambda p, pc, ir: pcs.append(int(pc)))])
+    assert pcs[:8] == [0, 1, 2, 3, 4, 5, 6, 13]
+
+def test_hook_branch():
+    branches = []
+    run('fibonacci', [(ProcessorHook.BRANCH, lambda p, pc, ir, taken: branches.append((int(pc), taken)))])
+    assert branches and {taken for _, taken in branches} == {True, False}
+
+def test_hook_branch_call_return():
+    branches = []
+    run('call_return_nested', [(ProcessorHook.BRANCH, lambda p, pc, ir, taken: branches.append(Opcodes(ir.opcode).name))])
+    assert branches == ['CALL', 'CALL', 'RET', 'RET']
+
+def test_hook_branch_to_next():
+    branches = []
+    run('branch_to_next', [(ProcessorHook.BRANCH, lambda p, pc, ir, taken: branches.append((int(pc), Opcodes(ir.opcode).name, taken)))])
+    assert branches == [(0, 'BEQ', True), (1, 'BNE', False), (2, 'CALL', True), (4, 'RET', True)]
+
+def test_hook_memory():
+    reads, writes = [], []
+    run('call_return', [(ProcessorHook.MEM_READ, lambda p, addr, value: reads.append(int(addr))), (ProcessorHook.MEM_WRITE, lambda p, addr, value: writes.append(int(addr)))])
+    assert reads and writes
+
+def test_hook_gpu():
+    gpu = []
+    run('gpu_composer', [(ProcessorHook.GPU, lambda p, ir: gpu.append(ir))])
+    assert gpu
+
+def test_remove_hook():
+    proc = Processor([0])
+    callback = lambda *_: None
+    proc.add_hook(ProcessorHook.INSTRUCTION, callback)
+    proc.add_hook(ProcessorHook.BRANCH, callback)
+    assert {'tick', 'decode', 'branch_to', 'call', 'ret'} <= set(vars(proc)) and proc.decode_overridden
+    proc.remove_hook(ProcessorHook.BRANCH, callback)
+    assert not {'tick', 'branch_to', 'call', 'ret'} & set(vars(proc)) and 'decode' in vars(proc) and proc.decode_overridden  # Still used by the instruction hook
+    proc.remove_hook(ProcessorHook.INSTRUCTION, callback)
+    assert 'decode' not in vars(proc) and not proc.decode_overridden  # tick() decodes inline
+
+def test_debug_view():
+    proc = run('fibonacci')
+    proc.pc = 1
+    view = proc.debug_view().split('\n')
+    assert view[3].startswith('0000 |') and view[4].startswith('0001 |') and view[4].endswith('<-- HERE')
+    assert proc.disassembler is not None and proc.disassembler.decode_line.cache_info().currsize == 5  # Only the lines shown are decoded
+
+def test_disassembler_lines():
+    proc = run('fibonacci')
+    full = disassembler.decode(proc.instructions)
+    dis = disassembler.Disassembler(proc.instructions)
+    assert [dis.decode_line(i) for i in range(len(full))] == full
+    assert dis.decode_range(-3, 4) == full[:4]
+    assert dis.decode_range(len(full) - 2, len(full) + 5) == full[-2:]
+    assert dis.decode_line.cache_info().hits > 0
+
+
+def run(file: str, hooks: List[Tuple[ProcessorHook, Callable[..., Any]]] = ()) -> Processor:
     file = 'assets/processor/%s.s' % file
     text = utils.read_file(file)
     asm = Assembler(file, text, enable_assertions=True)
@@ -30,4 +117,11 @@ def run(file: str):
     assert asm.assemble(), asm.error
 
     proc = Processor(asm.code, asm.sprites, exception_handle=lambda p, e: pytest.fail(str(e) + '\n\n' + p.debug_view(), False))
+    for hook, callback in hooks:
+        proc.add_hook(hook, callback)
     proc.run()
+    return proc
+
+
+def random_words(rng: RandomDevice, count: int):
+    return [int(rng.get(4000)) for _ in range(count)]
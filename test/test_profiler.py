@@ -0,0 +1,56 @@
+from assembler import Assembler
+from processor import Processor
+from profiler import Profiler
+from runner import Runner
+
+import utils
+import pytest
+import disassembler
+
+
+def test_functions():
+    profiler = profile('call_return_nested')
+    assert profiler.functions() == {'start': (23, 13), 'outer': (10, 8), 'inner': (2, 2)}
+
+def test_folded_stacks():
+    profiler = profile('call_return_nested')
+    assert profiler.folded_stacks() == ['start 13', 'start;outer 8', 'start;outer;inner 2']
+
+def test_executions():
+    profiler = profile('fibonacci')
+    assert sum(profiler.executions) == profiler.node_ticks[0]
+    assert max(profiler.executions) == 25  # The loop
+
+def test_indirect():
+    profiler = profile('call_return_nested')
+    assert sum(profiler.indirect) == 2  # Saving and restoring 'ra'
+
+def test_label_of():
+    profiler = profile('call_return_nested')
+    assert [profiler.label_of(pc) for pc in (0, 12, 13, 22, 23)] == ['start', 'start', 'outer', 'outer', 'inner']
+
+def test_report():
+    asm = assemble('call_return_nested')
+    profiler = profile('call_return_nested')
+    lines = profiler.report(disassembler.decode(asm.code, asm.print_table, asm.memory_table, asm.label_table))
+    assert lines[0] == 'Profile: 23 instructions'
+    assert any(line.endswith('0006 | call [+7 -> outer]') for line in lines)
+
+
+def profile(file: str) -> Profiler:
+    asm = assemble(file)
+    proc = Processor(asm.code, asm.sprites, exception_handle=lambda p, e: pytest.fail(str(e) + '\n\n' + p.debug_view(), False))
+    profiler = Profiler(proc, asm.label_table).attach()
+
+    assert Runner(proc).run()
+
+    return profiler
+
+
+def assemble(file: str) -> Assembler:
+    file = 'assets/processor/%s.s' % file
+    asm = Assembler(file, utils.read_file(file), enable_assertions=True)
+
+    assert asm.assemble(), asm.error
+
+    return asm
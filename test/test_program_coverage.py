@@ -0,0 +1,60 @@
+from assembler import Assembler
+from processor import Processor
+from program_coverage import Coverage
+from runner import Runner
+
+import utils
+import pytest
+import testfixtures
+
+
+def test_listing():
+    asm = assemble('branches')
+    coverage = run(asm, Coverage(asm.code))
+    actual_text = '\n'.join(coverage.listing(asm.print_table, asm.memory_table, asm.label_table)) + '\n' + coverage.summary().format() + '\n'
+    utils.write_file('assets/coverage/branches.out', actual_text)
+    expected_text = utils.read_or_create_empty('assets/coverage/branches.trace')
+
+    testfixtures.compare(actual=actual_text, expected=expected_text)
+
+def test_summary():
+    asm = assemble('branches')
+    summary = run(asm, Coverage(asm.code)).summary()
+    assert (summary.runs, summary.instructions, summary.executed, summary.branch_directions, summary.branch_directions_covered) == (1, 7, 6, 6, 4)
+
+def test_merge():
+    asm = assemble('branches')
+    coverage = run(asm, Coverage(asm.code))
+    coverage.merge(run(asm, Coverage(asm.code)))
+    assert coverage.runs == 2
+    assert coverage.executed[0] == 2
+
+def test_merge_different_program():
+    coverage = Coverage(assemble('branches').code)
+    with pytest.raises(ValueError):
+        coverage.merge(Coverage([0]))
+
+def test_save_load(tmp_path):
+    asm = assemble('branches')
+    coverage = run(asm, Coverage(asm.code))
+    coverage.save(str(tmp_path / 'branches.cov'))
+    loaded = Coverage.load(str(tmp_path / 'branches.cov'))
+    assert (loaded.runs, loaded.executed, loaded.taken, loaded.not_taken) == (coverage.runs, coverage.executed, coverage.taken, coverage.not_taken)
+
+
+def run(asm: Assembler, coverage: Coverage) -> Coverage:
+    proc = Processor(asm.code, asm.sprites, exception_handle=lambda p, e: pytest.fail(str(e) + '\n\n' + p.debug_view(), False))
+    coverage.attach(proc)
+
+    assert Runner(proc).run()
+
+    return coverage
+
+
+def assemble(file: str) -> Assembler:
+    file = 'assets/coverage/%s.s' % file
+    asm = Assembler(file, utils.read_file(file))
+
+    assert asm.assemble(), asm.error
+
+    return asm
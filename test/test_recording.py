@@ -0,0 +1,84 @@
+from numpy import int32
+from assembler import Assembler
+from processor import Processor, Device
+from recording import Recording, Recorder, Replayer
+from runner import Runner
+
+import utils
+import pytest
+import constants
+
+
+def test_record():
+    recording = record()
+    assert len(recording.randoms) == 40
+    assert len(recording.frames) == 20
+    assert recording.inputs == [(6, 0, 0), (202, 0, 1)]  # Reads of X, only when the value changes
+    assert recording.ticks == 285
+
+def test_replay(): replay(record())
+def test_replay_saved(tmp_path):
+    file = str(tmp_path / 'inputs.rec')
+    record().save(file)
+    replay(Recording.load(file))
+
+def test_replay_diverged_random():
+    recording = record()
+    recording.randoms[10] += 1
+    replayer = replay(recording, diverged=True)
+    assert replayer.divergence.startswith('Screen 5 flushed at tick')
+
+def test_replay_diverged_input():
+    recording = record()
+    recording.inputs.pop()  # X is never pressed
+    replay(recording, diverged=True)
+
+def test_replay_truncated_randoms():
+    recording = record()
+    del recording.randoms[20:]
+    replayer = replay(recording, diverged=True)
+    assert replayer.divergence.startswith('Read more than 20 recorded random values')
+
+def test_replay_missing_frames():
+    recording = record()
+    recording.frames.append((300, 0))
+    replayer = replay(recording, diverged=True)
+    assert replayer.divergence == 'Flushed 20 of 21 recorded screens'
+
+
+def record() -> Recording:
+    proc = processor()
+    proc.devices.append(HeldControlDevice(proc, 200))
+    recorder = Recorder(proc).attach()
+    assert Runner(proc).run()
+    recorder.recording.ticks = recorder.tick()
+    return recorder.recording
+
+
+def replay(recording: Recording, diverged: bool = False) -> Replayer:
+    proc = processor()
+    replayer = Replayer(proc, recording).attach()
+    assert Runner(proc, max_ticks=recording.ticks).run()
+    replayer.finish()
+    assert (replayer.divergence is not None) == diverged, replayer.divergence
+    return replayer
+
+
+def processor() -> Processor:
+    file = 'assets/recording/inputs.s'
+    asm = Assembler(file, utils.read_file(file))
+
+    assert asm.assemble(), asm.error
+
+    return Processor(asm.code, asm.sprites, exception_handle=lambda p, e: pytest.fail(str(e) + '\n\n' + p.debug_view(), False))
+
+
+class HeldControlDevice(Device):
+    """ Holds X from a given tick onwards """
+
+    def __init__(self, proc: Processor, tick: int):
+        self.proc = proc
+        self.tick_held = tick
+
+    def owns(self, addr: int32) -> bool: return addr == constants.CONTROL_PORT_X
+    def get(self, addr: int32) -> int32: return int32(self.proc.counter.tick_count >= self.tick_held)
@@ -0,0 +1,41 @@
+from assembler import Assembler
+from processor import Processor
+from runner import Runner
+
+import utils
+import pytest
+
+
+def test_run_fibonacci(): run('fibonacci')
+def test_run_gpu_composer(): run('gpu_composer')
+def test_run_with_telemetry_fibonacci(): run('fibonacci', telemetry=True)
+def test_run_with_telemetry_gpu_composer(): run('gpu_composer', telemetry=True)
+
+def test_max_ticks():
+    runner = Runner(processor('branch_backwards'), max_ticks=3)
+    assert runner.run()
+    assert runner.ticks == 3
+
+def test_telemetry_sample():
+    runner = Runner(processor('gpu_composer'), telemetry=True)
+    assert runner.run()
+    sample = runner.telemetry.sample()
+    assert sample.instructions_per_second > 0
+    assert sample.flushes_per_second > 0
+    assert sum(sample.subsystems.values()) == pytest.approx(1)
+
+
+def run(file: str, telemetry: bool = False):
+    runner = Runner(processor(file), telemetry=telemetry)
+    assert runner.run()
+    assert not runner.proc.running
+
+
+def processor(file: str) -> Processor:
+    file = 'assets/processor/%s.s' % file
+    text = utils.read_file(file)
+    asm = Assembler(file, text, enable_assertions=True)
+
+    assert asm.assemble(), asm.error
+
+    return Processor(asm.code, asm.sprites, exception_handle=lambda p, e: pytest.fail(str(e) + '\n\n' + p.debug_view(), False))
@@ -0,0 +1,51 @@
+from typing import Any
+from assembler import Assembler
+from processor import Processor, ProcessorEvent
+from sampling_profiler import SamplingProfiler
+from runner import RunnerControlDevice
+
+import sys
+import json
+import time
+import utils
+
+
+def test_sample():
+    profiler = SamplingProfiler()
+    proc = processor(lambda p, event_type, arg: profiler.sample(sys._getframe()) if event_type == ProcessorEvent.GFLUSH else None)
+    proc.run()
+
+    assert profiler.samples == 30
+    assert profiler.exclusive == {'processor.ProcessorEvent.post': 30}  # The nearest simulator function to the event handle
+    assert {'processor.Processor.run', 'processor.Processor.tick', 'processor.GPU.exec'} <= set(profiler.inclusive)
+    assert profiler.external == {__name__: 30}
+
+def test_sampling_thread():
+    profiler = SamplingProfiler(0.001).start()
+    proc = processor()
+    end = time.perf_counter() + 0.5
+    while time.perf_counter() < end:
+        proc.run()
+    profiler.stop()
+
+    assert profiler.samples > 0
+    assert profiler.inclusive.get('processor.Processor.tick', 0) > 0
+    assert sys.getswitchinterval() == profiler.switch_interval  # Restored
+
+def test_save(tmp_path):
+    profiler = SamplingProfiler()
+    profiler.sample(sys._getframe())
+    profiler.save(str(tmp_path / 'samples.json'))
+    with open(tmp_path / 'samples.json', encoding='utf-8') as f:
+        assert json.load(f) == profiler.results()
+
+
+def processor(event_handle: Any = lambda *_: None) -> Processor:
+    file = 'assets/farm/fuzz.s'
+    asm = Assembler(file, utils.read_file(file))
+
+    assert asm.assemble(), asm.error
+
+    proc = Processor(asm.code, asm.sprites, event_handle=event_handle)
+    proc.devices.append(RunnerControlDevice())
+    return proc
@@ -0,0 +1,90 @@
+from typing import List, Tuple
+from shared import SharedState, ProcessorStats
+from telemetry import TelemetrySample, SUBSYSTEMS
+from app import App
+
+import pickle
+import pytest
+
+
+@pytest.fixture
+def state():
+    state = SharedState()
+    yield state
+    state.close(unlink=True)
+
+
+def test_frame(state: SharedState):
+    assert state.read_frame() is None
+    state.write_frame(tuple(range(32)))
+    assert state.read_frame() == tuple(range(32))
+    assert state.read_frame() is None  # Already read
+
+def test_frame_incomplete_write(state: SharedState):
+    state.ints[SharedState.FRAME_SEQ] += 1  # Simulate a write in progress
+    assert state.read_frame() is None
+
+def test_inputs(state: SharedState):
+    state.set_input(2, 1)
+    assert state.get_input(2) == 1
+    assert state.get_input(1) == 0
+
+def test_halt(state: SharedState):
+    assert not state.halt_requested()
+    state.request_halt()
+    assert state.halt_requested()
+
+def test_stats(state: SharedState):
+    assert state.read_stats() is None
+    stats = ProcessorStats(50, 0.5, 50, 0.25, 0.125, 0, None)
+    state.write_stats(stats)
+    assert state.read_stats() == stats
+
+def test_stats_with_telemetry(state: SharedState):
+    sample = TelemetrySample(1, 1000, 0.75, 10, {name: 0.2 for name in SUBSYSTEMS})
+    stats = ProcessorStats(1000, 0.75, 0, 0.25, 0.125, 0, sample)
+    state.write_stats(stats)
+    assert state.read_stats() == stats
+
+def test_attach_by_name(state: SharedState):
+    other: SharedState = pickle.loads(pickle.dumps(state))
+    other.write_frame((1,) * 32)
+    other.set_input(0, 5)
+    assert state.read_frame() == (1,) * 32
+    assert state.get_input(0) == 5
+    other.close()
+
+def test_final_frame_before_halt():
+    # The processor writes its last screen and halts after the app has read the shared state, but before it polls the pipe
+    app = HeadlessApp()
+    processor: SharedState = pickle.loads(pickle.dumps(app.processor_state))
+    processor.write_frame((1,) * 32)
+    processor.write_stats(ProcessorStats(50, 0.5, 50, 0.25, 0.125, 0, None))
+    processor.close()
+
+    app.on_halt()
+    assert app.screens == [(1,) * 32]
+    assert len(app.stats) == 1
+    assert app.processor_state is None
+
+
+class HeadlessApp(App):
+    """ The processor state handling of the app, without a UI """
+
+    def __init__(self):
+        self.asm = None
+        self.assembling = False
+        self.perf_clock_ns = 0
+        self.processor_thread = None
+        self.processor_state = SharedState()
+        self.info_text = self.perf_text = self.telemetry_text = Text()
+        self.screens: List[Tuple[int, ...]] = []
+        self.stats: List[ProcessorStats] = []
+
+    def update_screen(self, screen: Tuple[int, ...]): self.screens.append(screen)
+    def update_stats(self, stats: ProcessorStats): self.stats.append(stats)
+
+
+class Text:
+
+    def set(self, value: str): pass
@@ -31,3 +31,20 @@ def test_interval_unsigned_bitfield():
     assert i.min == 0
     assert i.max == 15
     assert i.error_template == 'Value %d outside of range [0, 15] for 4-bit unsigned field'
+
+def test_image_buffer_pack():
+    buffer = utils.ImageBuffer.unpack('#..|.#.|..#|#.#')
+    assert buffer.pack() == (0b001, 0b010, 0b100, 0b101) + (0,) * 28
+
+def test_image_buffer_pack_empty():
+    assert utils.ImageBuffer.empty().pack() == (0,) * 32
+
+def test_clock_scheduler_batch_limit():
+    scheduler = utils.ClockScheduler(1_000)
+    scheduler.next_ns -= 50_000_000
+    assert scheduler.ticks_due() == 10_000
+
+def test_clock_scheduler_lag_reset():
+    scheduler = utils.ClockScheduler(1_000)
+    scheduler.next_ns -= 1_000_000_000
+    assert scheduler.ticks_due() == 1